@@ -7,7 +7,7 @@ This is the main package for the Professor AI Helper backend API.
 # Import and expose the main components
 from . import (
     models, schemas, schemas_ai, auth, crud, database, 
-    ai_services_enhanced as ai_services, file_processing, security
+    ai_services, file_processing, security
 )
 
 # Make frequently used items directly available
@@ -0,0 +1,85 @@
+"""
+Generation Profiles for Professor AI Helper
+
+Every AI task runs under a declarative profile: the model tier it
+prefers (see app.model_router), its sampling temperature, an output cap
+sized to what the task actually produces, how much document context it
+may send, whether it answers in JSON, and its deadline. Tuning a task
+means editing its profile here rather than the call sites.
+"""
+from dataclasses import dataclass
+from typing import Dict, Optional
+import os
+
+from app.chat_memory import CHAT_PROMPT_TOKEN_BUDGET
+from app.model_router import FAST, STRONG
+
+AI_MAX_OUTPUT_TOKENS = 8192  # Upper bound of the model; no profile asks for more
+
+# Per-task deadlines, so interactive calls give up long before batch-style ones
+AI_CHAT_TIMEOUT = float(os.getenv("AI_CHAT_TIMEOUT", 20))  # Chat answer, or first streamed chunk
+AI_GENERATION_TIMEOUT = float(os.getenv("AI_GENERATION_TIMEOUT", 60))  # Quizzes, questions, summaries
+AI_REPORT_TIMEOUT = float(os.getenv("AI_REPORT_TIMEOUT", 180))  # Reports and imports (run as background jobs)
+
+# Document tokens sent to quiz and question generation; longer documents are cut
+AI_DOCUMENT_CONTEXT_TOKENS = int(os.getenv("AI_DOCUMENT_CONTEXT_TOKENS", 100000))
+
+
+@dataclass(frozen=True)
+class TaskProfile:
+    """How one kind of AI task is generated."""
+
+    name: str
+    temperature: float = 0.7
+    max_output_tokens: int = 2048  # Output cap, before the per-item allowance
+    tokens_per_item: int = 0  # Extra output allowed per requested item (e.g. quiz question)
+    context_tokens: Optional[int] = None  # Document/prompt budget; None sends the input as is
+    json_output: bool = False
+    timeout: float = AI_GENERATION_TIMEOUT
+    tier: str = FAST  # Preferred model tier
+    escalate_above_tokens: Optional[int] = None  # Prompts this large go to the strong tier
+
+    def output_cap(self, items: int = 0) -> int:
+        return min(AI_MAX_OUTPUT_TOKENS, self.max_output_tokens + self.tokens_per_item * max(items, 0))
+
+    def generation_config(self, output_tokens: Optional[int] = None) -> dict:
+        config = {
+            "temperature": self.temperature,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": min(output_tokens or self.max_output_tokens, AI_MAX_OUTPUT_TOKENS),
+        }
+        if self.json_output:
+            config["response_mime_type"] = "application/json"
+        return config
+
+
+PROFILES: Dict[str, TaskProfile] = {profile.name: profile for profile in (
+    TaskProfile("chat", max_output_tokens=2048, context_tokens=CHAT_PROMPT_TOKEN_BUDGET, timeout=AI_CHAT_TIMEOUT),
+    TaskProfile("chat_summary", temperature=0.3, max_output_tokens=512, json_output=True),
+    TaskProfile(
+        "quiz", temperature=0.5, max_output_tokens=512, tokens_per_item=300,
+        context_tokens=AI_DOCUMENT_CONTEXT_TOKENS, json_output=True,
+    ),
+    TaskProfile(
+        "questions", temperature=0.5, max_output_tokens=256, tokens_per_item=200,
+        context_tokens=AI_DOCUMENT_CONTEXT_TOKENS, json_output=True,
+    ),
+    # Single-pass summaries stop at SUMMARY_SINGLE_PASS_LENGTH (about 7500 tokens); the
+    # longest of them go to the strong tier, while longer documents are map-reduced
+    TaskProfile("summary", temperature=0.3, max_output_tokens=1536, json_output=True, escalate_above_tokens=6000),
+    TaskProfile("summary_section", temperature=0.3, max_output_tokens=768, json_output=True),
+    TaskProfile("summary_merge", temperature=0.3, max_output_tokens=1536, json_output=True),
+    TaskProfile("class_report", max_output_tokens=4096, timeout=AI_REPORT_TIMEOUT, tier=STRONG),
+    TaskProfile("file_report", max_output_tokens=4096, timeout=AI_REPORT_TIMEOUT, tier=STRONG),
+    TaskProfile(
+        "class_import", temperature=0.2, max_output_tokens=8192, json_output=True,
+        timeout=AI_REPORT_TIMEOUT, escalate_above_tokens=20000,
+    ),
+    # Output cap is set per call from the size of the payload being fixed
+    TaskProfile("json_repair", temperature=0.0, max_output_tokens=256, json_output=True),
+)}
+
+
+def get_profile(task: str) -> TaskProfile:
+    return PROFILES[task]
@@ -0,0 +1,338 @@
+"""
+LLM Providers for Professor AI Helper
+
+This module hides the model backend behind a small interface (generate,
+stream, count tokens) so the teaching assistant can run against Gemini or
+against a deterministic offline fake used for development, benchmarks and
+load tests. The backend is chosen with AI_BACKEND.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+import asyncio
+import json
+import os
+import random
+import re
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Provider selection
+AI_BACKEND = os.getenv("AI_BACKEND", "gemini")  # "gemini" or "fake"
+DEFAULT_MODEL_NAME = "gemini-1.5-flash"
+
+# Fake backend behaviour
+AI_FAKE_LATENCY = os.getenv("AI_FAKE_LATENCY", "uniform:0.1,0.3")  # Time to first token, see parse_latency()
+AI_FAKE_TOKENS_PER_SECOND = float(os.getenv("AI_FAKE_TOKENS_PER_SECOND", 200))  # Output throughput per request
+AI_FAKE_MAX_CONCURRENCY = int(os.getenv("AI_FAKE_MAX_CONCURRENCY", 0))  # Simulated upstream capacity, 0 = unlimited
+AI_FAKE_ERROR_RATE = float(os.getenv("AI_FAKE_ERROR_RATE", 0))  # Fraction of calls rejected as rate limited
+AI_FAKE_RESPONSES_FILE = os.getenv("AI_FAKE_RESPONSES_FILE")  # JSON list of {"match": ..., "response": ...}
+AI_FAKE_SEED = os.getenv("AI_FAKE_SEED")
+# Per-model overrides, e.g. "gemini-1.5-pro=uniform:1,3;gemini-1.5-flash=fixed:0.2", to exercise model routing
+AI_FAKE_MODEL_LATENCY = os.getenv("AI_FAKE_MODEL_LATENCY", "")
+AI_FAKE_MODEL_ERROR_RATE = os.getenv("AI_FAKE_MODEL_ERROR_RATE", "")  # e.g. "gemini-1.5-flash=1"
+
+
+class ProviderError(Exception):
+    """An upstream model call failed."""
+
+
+class ProviderRateLimitError(ProviderError):
+    """The upstream rejected the call for quota reasons (HTTP 429)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProviderUnavailableError(ProviderError):
+    """The upstream is overloaded, unreachable or timed out."""
+
+
+@dataclass
+class GenerationResult:
+    text: str
+    blocked: bool = False  # Response withheld by the provider's safety filters
+    prompt_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+
+
+class LLMProvider(ABC):
+    """Interface every model backend implements."""
+
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._chars_per_token = 4.0
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def generate(self, prompt: str, generation_config: dict) -> GenerationResult:
+        """Generate a complete response."""
+
+    @abstractmethod
+    def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[str]:
+        """Yield response text chunks as they are generated."""
+
+    async def count_tokens(self, text: str) -> int:
+        """Token count for text; providers with a tokenizer API count exactly and calibrate the estimate."""
+        return self.estimate_tokens(text)
+
+    def estimate_tokens(self, text: str) -> int:
+        """Cheap local estimate, calibrated against the token counts the provider reports."""
+        return max(1, round(len(text) / self._chars_per_token)) if text else 0
+
+    def calibrate(self, text: str, tokens: int) -> None:
+        """Nudge the characters-per-token ratio towards an observed count for text."""
+        if tokens > 0 and len(text) >= 200:
+            self._chars_per_token += 0.1 * (len(text) / tokens - self._chars_per_token)
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini via the google-generativeai SDK."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME, api_key: Optional[str] = None):
+        super().__init__(model_name)
+        self._model = None
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            print("Error: GOOGLE_API_KEY environment variable is not set")
+            return
+        try:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            self._model = genai.GenerativeModel(model_name)
+            print(f"AI model initialized successfully with {model_name}")
+        except Exception as e:
+            print(f"Error initializing AI model: {str(e)}")
+
+    @property
+    def available(self) -> bool:
+        return self._model is not None
+
+    @staticmethod
+    def _translate_error(e: Exception) -> Exception:
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(e, google_exceptions.ResourceExhausted):
+            return ProviderRateLimitError(str(e), retry_after=_retry_after_from_error(e))
+        if isinstance(e, (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded,
+                          google_exceptions.InternalServerError)):
+            return ProviderUnavailableError(str(e))
+        return ProviderError(str(e))
+
+    @staticmethod
+    def _result(response) -> GenerationResult:
+        usage = getattr(response, "usage_metadata", None)
+        if not response.parts:
+            return GenerationResult(text="", blocked=True)
+        return GenerationResult(
+            text=response.text,
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            output_tokens=getattr(usage, "candidates_token_count", None),
+        )
+
+    async def generate(self, prompt: str, generation_config: dict) -> GenerationResult:
+        try:
+            response = await self._model.generate_content_async(prompt, generation_config=generation_config)
+        except Exception as e:
+            raise self._translate_error(e) from e
+        return self._result(response)
+
+    async def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[str]:
+        try:
+            response = await self._model.generate_content_async(
+                prompt, generation_config=generation_config, stream=True
+            )
+            async for chunk in response:
+                if chunk.parts:
+                    yield chunk.text
+        except ProviderError:
+            raise
+        except Exception as e:
+            raise self._translate_error(e) from e
+
+    async def count_tokens(self, text: str) -> int:
+        try:
+            response = await self._model.count_tokens_async(text)
+        except Exception:
+            return self.estimate_tokens(text)
+        self.calibrate(text, response.total_tokens)
+        return response.total_tokens
+
+
+def _retry_after_from_error(e: Exception) -> Optional[float]:
+    match = re.search(r"retry(?:_delay| after)?\D{0,20}(\d+(?:\.\d+)?)\s*s", str(e), re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+
+def parse_latency(spec: str):
+    """
+    Parse a latency distribution spec into a sampling function (seconds).
+
+    Supported forms: "fixed:0.2", "uniform:0.1,0.5", "normal:0.3,0.05"
+    (mean, stddev) and "lognormal:-1.2,0.5" (mu, sigma of the log).
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeProvider(LLMProvider):
+    """
+    Offline provider with realistic timing and schema-shaped canned outputs.
+
+    Latency to the first token is drawn from a configurable distribution,
+    output is paced at a fixed tokens-per-second rate, and an optional
+    concurrency cap models upstream capacity. Outputs are deterministic for
+    a given prompt so caches and coalescing behave as with a real model.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        model_name: str = "fake",
+        latency: str = AI_FAKE_LATENCY,
+        tokens_per_second: float = AI_FAKE_TOKENS_PER_SECOND,
+        max_concurrency: int = AI_FAKE_MAX_CONCURRENCY,
+        error_rate: float = AI_FAKE_ERROR_RATE,
+        responses_file: Optional[str] = AI_FAKE_RESPONSES_FILE,
+        seed: Optional[str] = AI_FAKE_SEED,
+    ):
+        super().__init__(model_name)
+        self._sample_latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._capacity = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+        self._canned: List[dict] = []
+        if responses_file:
+            with open(responses_file, "r", encoding="utf-8") as f:
+                self._canned = json.load(f)
+        print(f"AI model initialized with the offline fake backend ({model_name})")
+
+    def respond(self, prompt: str, generation_config: dict) -> str:
+        """The deterministic response text for a prompt."""
+        for entry in self._canned:
+            if entry.get("match", "") in prompt:
+                response = entry["response"]
+                return response if isinstance(response, str) else json.dumps(response, ensure_ascii=False)
+
+        if generation_config.get("response_mime_type") == "application/json":
+            return json.dumps(self._json_response(prompt), ensure_ascii=False)
+        return f"This is an offline answer from {self.model_name} for a prompt of {len(prompt)} characters."
+
+    def _json_response(self, prompt: str):
+        lowered = prompt.lower()
+        if "quiz" in lowered:
+            count = _first_int(r"number of questions:\s*(\d+)", lowered, 3)
+            return {
+                "title": "Offline quiz",
+                "description": "Generated by the fake backend.",
+                "questions": [
+                    {
+                        "question": f"Question {i + 1}?",
+                        "type": "multiple_choice",
+                        "options": ["A", "B", "C", "D"],
+                        "correct_answer": 0,
+                        "explanation": "Offline explanation.",
+                    }
+                    for i in range(count)
+                ],
+            }
+        if "study questions" in lowered:
+            count = _first_int(r"generate (\d+) study questions", lowered, 3)
+            return [{"question": f"Question {i + 1}?", "answer": "Offline answer."} for i in range(count)]
+        if "extract class data" in lowered:
+            return {"students": [], "assignments": [], "grades": []}
+        if "summar" in lowered:
+            return {
+                "title": "Offline summary",
+                "summary": "Summary generated by the fake backend.",
+                "key_points": ["First point", "Second point"],
+                "keywords": ["offline", "fake"],
+            }
+        return {"result": "Offline output."}
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise ProviderRateLimitError("Fake backend rate limit", retry_after=1.0)
+
+    def _output_delay(self, text: str) -> float:
+        return self.estimate_tokens(text) / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    async def _acquire(self) -> None:
+        if self._capacity is not None:
+            await self._capacity.acquire()
+
+    def _release(self) -> None:
+        if self._capacity is not None:
+            self._capacity.release()
+
+    async def generate(self, prompt: str, generation_config: dict) -> GenerationResult:
+        self._maybe_fail()
+        text = self.respond(prompt, generation_config)
+        await self._acquire()
+        try:
+            await asyncio.sleep(self._sample_latency(self._rng) + self._output_delay(text))
+        finally:
+            self._release()
+        return GenerationResult(text=text, prompt_tokens=self.estimate_tokens(prompt), output_tokens=self.estimate_tokens(text))
+
+    async def stream(self, prompt: str, generation_config: dict) -> AsyncIterator[str]:
+        self._maybe_fail()
+        text = self.respond(prompt, generation_config)
+        await self._acquire()
+        try:
+            await asyncio.sleep(self._sample_latency(self._rng))
+            words = text.split(" ")
+            for i, word in enumerate(words):
+                chunk = word if i == len(words) - 1 else word + " "
+                await asyncio.sleep(self._output_delay(chunk))
+                yield chunk
+        finally:
+            self._release()
+
+
+def _first_int(pattern: str, text: str, default: int) -> int:
+    match = re.search(pattern, text)
+    return int(match.group(1)) if match else default
+
+
+def parse_model_settings(spec: str) -> dict:
+    """Parse "model=value;model=value" into a dict."""
+    settings = {}
+    for entry in spec.split(";"):
+        model, _, value = entry.partition("=")
+        if model.strip() and value.strip():
+            settings[model.strip()] = value.strip()
+    return settings
+
+
+def create_provider(model_name: str = DEFAULT_MODEL_NAME, backend: str = AI_BACKEND) -> LLMProvider:
+    """Build the provider selected by AI_BACKEND."""
+    if backend == "fake":
+        return FakeProvider(
+            model_name=f"fake-{model_name}",
+            latency=parse_model_settings(AI_FAKE_MODEL_LATENCY).get(model_name, AI_FAKE_LATENCY),
+            error_rate=float(parse_model_settings(AI_FAKE_MODEL_ERROR_RATE).get(model_name, AI_FAKE_ERROR_RATE)),
+        )
+    if backend == "gemini":
+        return GeminiProvider(model_name=model_name)
+    raise ValueError(f"Unknown AI_BACKEND: {backend}")
@@ -1,74 +1,481 @@
-from typing import Dict, List, Optional
+from collections import Counter
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+import asyncio
 import json
 import os
-import google.generativeai as genai
+import time
 from dotenv import load_dotenv
+from pydantic import BaseModel, ValidationError
+
+from app.ai_profiles import AI_CHAT_TIMEOUT, TaskProfile, get_profile
+from app.ai_providers import GenerationResult, LLMProvider, ProviderRateLimitError, create_provider
+from app.generation_cache import generation_cache, content_hash, make_cache_key
+from app.json_repair import repair_json, repair_prompt
+from app.json_stream import StreamingJsonParser
+from app.metrics import metrics
+from app.model_router import AI_ROUTER_PRIMARY_SHARE, FAST, ModelRouter
+from app.rate_limit import (
+    AI_RATE_LIMIT_MAX_RETRIES, AIOverloadedError, admission, backoff_delay, current_user_id, fan_out
+)
+from app.semantic_cache import is_standalone, semantic_cache
+from app.schemas_ai import (
+    ChatSummaryOutput, ClassImportOutput, QuizOutput, QuizQuestion, StudyQuestionList, SummaryOutput
+)
+from app.singleflight import SingleFlight, request_key
+from app import chat_memory, summarization
 
 # Load environment variables
 load_dotenv()
 
-# Configure the AI model
-MODEL_AVAILABLE = False
-try:
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        print("Error: GOOGLE_API_KEY environment variable is not set")
-    else:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        MODEL_AVAILABLE = True
-        print("AI model initialized successfully with gemini-1.5-flash")
-except Exception as e:
-    print(f"Error initializing AI model: {str(e)}")
-    model = None
+# Bump whenever a prompt template changes so cached results are regenerated
+PROMPT_VERSION = "1"
+
+# Async client limits
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", 8))  # Simultaneous upstream calls per worker
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", 60))  # Seconds, including time spent queued
+
+# Starting guess for output length, refined from completed calls; used to
+# estimate the tokens saved when a call is abandoned
+_INITIAL_EXPECTED_OUTPUT_TOKENS = 500
+
+# Broken structured output up to this size is sent back to the model to be fixed
+# (instead of regenerating from the document); 0 disables the repair call
+AI_JSON_REPAIR_MAX_CHARS = int(os.getenv("AI_JSON_REPAIR_MAX_CHARS", 20000))
+
+class _ErrorText(str):
+    """An error message returned in place of model output, so it is never cached as an answer."""
+
+def _is_error_payload(value: Any) -> bool:
+    """The {"error": ...} payload _generate_response returns on failure."""
+    return isinstance(value, dict) and set(value) == {"error"}
+
+def _validate(value: Any, schema: Optional[Type[BaseModel]]) -> Tuple[Any, Optional[str]]:
+    """Returns (validated value, None), or (None, reason) if value doesn't fit schema."""
+    if _is_error_payload(value):
+        return None, f"model returned an error: {value['error']}"
+    if schema is None:
+        return value, None
+    try:
+        return schema.model_validate(value).model_dump(exclude_unset=True), None
+    except ValidationError as e:
+        return None, str(e)
+
+def _quiz_question(item: Any) -> Optional[dict]:
+    """A streamed quiz question if it matches the schema, else None."""
+    question, _ = _validate(item, QuizQuestion)
+    return question
+
+def _question_key(question: dict) -> str:
+    """Identifies a quiz question by its normalized text."""
+    return " ".join(str(question.get("question", "")).split()).lower()
+
+def _is_error_result(result: Any) -> bool:
+    """True for the error payloads the assistant returns instead of raising."""
+    if isinstance(result, _ErrorText):
+        return True
+    if isinstance(result, dict):
+        return "error" in result
+    if isinstance(result, list):
+        return any(isinstance(item, dict) and "error" in item for item in result)
+    return not result
 
 class TeachingAssistant:
-    """A unified AI assistant for all educational and class management tasks."""
+    """
+    A unified AI assistant for all educational and class management tasks.
+
+    Each task runs under its profile from app.ai_profiles, on the model tier
+    chosen by app.model_router. Model clients are created on first use, one
+    per model, so importing the app doesn't configure any backend and tasks
+    sharing a model share its client.
+    """
 
-    def __init__(self):
+    def __init__(
+        self,
+        provider: Optional[LLMProvider] = None,
+        max_concurrency: int = AI_MAX_CONCURRENCY,
+        timeout: float = AI_REQUEST_TIMEOUT,
+    ):
+        # An explicitly passed provider serves every model
+        self._provider_override = provider
+        self._providers: Dict[str, LLMProvider] = {}
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = SingleFlight("ai.singleflight")
+        self.router = ModelRouter()
+        self._expected_output_tokens = float(_INITIAL_EXPECTED_OUTPUT_TOKENS)
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
         self.system_prompt = """
         Ты дружелюбный и полезный AI-помощник преподавателя. Отвечай на том языке, на котором задан вопрос. Будь естественным в общении, старайся быть кратким и по делу. Помогай с любыми вопросами, связанными с образованием (включая планирование уроков, проверку работ, генерацию заданий и т.п.), а также не отказывайся от обсуждения других тем, если это уместно.
         """
 
-    def _generate_response(self, prompt: str, is_json_output: bool = False) -> str:
-        """Generate a response from the AI model with robust error handling."""
-        if not MODEL_AVAILABLE:
+    def _provider_for(self, model: str) -> LLMProvider:
+        if self._provider_override is not None:
+            return self._provider_override
+        provider = self._providers.get(model)
+        if provider is None:
+            provider = self._providers[model] = create_provider(model_name=model)
+        return provider
+
+    @property
+    def provider(self) -> LLMProvider:
+        """Client for the fast tier's model; also used for token estimates."""
+        return self._provider_for(self.router.model_for(FAST))
+
+    def _fit_context(self, document_text: str, profile: TaskProfile) -> str:
+        """Cuts the document to the profile's context budget."""
+        if profile.context_tokens is None:
+            return document_text
+        return chat_memory.truncate_to_tokens(document_text, profile.context_tokens, self.provider.estimate_tokens)
+
+    def _observe_output(self, text: str, output_tokens: Optional[int] = None) -> None:
+        tokens = output_tokens if output_tokens is not None else self.provider.estimate_tokens(text)
+        self._expected_output_tokens += 0.1 * (tokens - self._expected_output_tokens)
+
+    def _record_cancelled(self, prompt_tokens: int, started: bool, output_tokens_received: int = 0) -> None:
+        """Counts a call abandoned by its caller and the tokens that saved (estimated).
+
+        A call cancelled before it was sent saves the prompt as well; one
+        cancelled mid-generation saves only the output not yet produced.
+        """
+        avoided = max(self._expected_output_tokens - output_tokens_received, 0.0)
+        if not started:
+            avoided += prompt_tokens
+        metrics.increment("ai.cancelled")
+        metrics.increment("ai.tokens_avoided", round(avoided))
+
+    async def _call_tier(
+        self,
+        tier: str,
+        provider: LLMProvider,
+        prompt: str,
+        generation_config: dict,
+        estimated_tokens: int,
+        deadline: float,
+        retry_rate_limits: bool,
+    ) -> GenerationResult:
+        """One model call on a tier, bounded by deadline at every stage.
+
+        Only the model call itself counts towards the tier's breaker. An
+        upstream 429 is retried with backoff unless retry_rate_limits is
+        False (the caller has another tier to fall back to).
+        """
+        def remaining() -> float:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+
+        breaker = self.router.breakers[tier]
+        breaker.check()
+        user_id = current_user_id.get()
+        attempt = 0
+        started = None
+        try:
+            while True:
+                await asyncio.wait_for(
+                    admission.admit(estimated_tokens, user_id, upstream=provider.model_name), timeout=remaining()
+                )
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=remaining())
+                try:
+                    call_timeout = remaining()
+                    started = time.monotonic()
+                    with breaker.guard():
+                        result = await asyncio.wait_for(
+                            provider.generate(prompt, generation_config), timeout=call_timeout
+                        )
+                    self._observe_output(result.text, result.output_tokens)
+                    if result.prompt_tokens:
+                        provider.calibrate(prompt, result.prompt_tokens)
+                    self.router.observe(
+                        tier, time.monotonic() - started,
+                        result.prompt_tokens or estimated_tokens,
+                        result.output_tokens or provider.estimate_tokens(result.text),
+                    )
+                    return result
+                except ProviderRateLimitError as e:
+                    attempt += 1
+                    metrics.increment("ai.upstream_rate_limited")
+                    delay = backoff_delay(attempt, e.retry_after)
+                    # Every call to this model waits out the cooldown in admit(), not just this one
+                    admission.penalize(delay, upstream=provider.model_name)
+                    if not retry_rate_limits or attempt > AI_RATE_LIMIT_MAX_RETRIES:
+                        raise AIOverloadedError("AI provider rate limit reached, please retry later", retry_after=delay)
+                finally:
+                    self._semaphore.release()
+        except asyncio.TimeoutError:
+            if started is not None:
+                self.router.observe_timeout(tier, time.monotonic() - started)
+            raise
+        except asyncio.CancelledError:
+            # Every caller sharing this call has gone away
+            self._record_cancelled(estimated_tokens, started is not None)
+            raise
+
+    def _available_tiers(self, tiers: List[str]) -> List[str]:
+        return [tier for tier in tiers if self._provider_for(self.router.model_for(tier)).available]
+
+    async def _generate_response(self, prompt: str, profile: TaskProfile, output_tokens: Optional[int] = None) -> str:
+        """Generate a response from the AI model without blocking the event loop.
+
+        The profile selects the generation config, deadline and preferred
+        model tier; output_tokens overrides its output cap for this call.
+
+        At most ``max_concurrency`` calls run upstream at once; the rest wait
+        for a slot. Identical concurrent requests (same prompt and config)
+        share a single upstream call. The timeout covers both the wait and the
+        model call; the upstream request is cancelled once every caller
+        waiting on it has been cancelled or timed out.
+
+        The router picks the tier (see app.model_router). If that tier times
+        out, is rate limited or has its circuit breaker open, the call falls
+        back to the other tier for the rest of the deadline; the first tier
+        gets AI_ROUTER_PRIMARY_SHARE of the deadline so there is time left to
+        do so. With both breakers open, calls fail immediately with
+        CircuitOpenError.
+
+        Cancelling the caller (e.g. because the HTTP client disconnected)
+        aborts the upstream call unless another caller still shares it.
+
+        Calls are admitted through the rate limiter first. An upstream 429
+        pauses admission to that model for the retry-after period; on the
+        last tier the call is retried with jittered backoff. AIOverloadedError
+        is raised (not returned) when the call is shed, so routers can
+        answer 503.
+        """
+        is_json_output = profile.json_output
+        timeout = profile.timeout or self.timeout
+        deadline = time.monotonic() + timeout
+        estimated_tokens = self.provider.estimate_tokens(prompt)
+        tiers = self._available_tiers(
+            self.router.route(profile.tier, estimated_tokens, timeout, profile.escalate_above_tokens)
+        )
+        if not tiers:
             error_msg = "AI service is not available. Check server logs."
             print(f"Error: {error_msg}")
-            return json.dumps({"error": error_msg}) if is_json_output else error_msg
+            return _ErrorText(json.dumps({"error": error_msg}) if is_json_output else error_msg)
 
         try:
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "top_k": 40,
-                "max_output_tokens": 8192,
-            }
-            if is_json_output:
-                generation_config["response_mime_type"] = "application/json"
-
-            response = model.generate_content(prompt, generation_config=generation_config)
-            
-            if not response.parts:
-                return json.dumps({"error": "Safety policy violation. Cannot provide a response."})
+            generation_config = profile.generation_config(output_tokens)
+
+            async def _call():
+                for position, tier in enumerate(tiers):
+                    last = position == len(tiers) - 1
+                    tier_deadline = deadline
+                    if not last:
+                        tier_deadline = time.monotonic() + (deadline - time.monotonic()) * AI_ROUTER_PRIMARY_SHARE
+                    provider = self._provider_for(self.router.model_for(tier))
+                    try:
+                        return await self._call_tier(
+                            tier, provider, prompt, generation_config, estimated_tokens, tier_deadline,
+                            retry_rate_limits=last,
+                        )
+                    except (asyncio.TimeoutError, AIOverloadedError) as e:
+                        if last:
+                            raise
+                        metrics.increment("ai.router.fallbacks")
+                        print(f"AI tier '{tier}' failed ({type(e).__name__}), falling back to '{tiers[position + 1]}'")
 
-            return response.text
+            models = [self.router.model_for(tier) for tier in tiers]
+            call_key = request_key(prompt, {**generation_config, "models": models})
+            result = await self._inflight.do(call_key, _call)
+
+            if result.blocked:
+                return _ErrorText(json.dumps({"error": "Safety policy violation. Cannot provide a response."}))
+
+            return result.text
+        except AIOverloadedError:
+            raise
+        except asyncio.TimeoutError:
+            error_msg = f"AI response timed out after {timeout:g} seconds"
+            print(error_msg)
+            return _ErrorText(json.dumps({"error": error_msg}) if is_json_output else error_msg)
         except Exception as e:
             error_msg = f"Error generating AI response: {str(e)}"
             print(error_msg)
-            return json.dumps({"error": error_msg}) if is_json_output else error_msg
+            return _ErrorText(json.dumps({"error": error_msg}) if is_json_output else error_msg)
 
-    def analyze_document_chat(self, document_text: str, query: str, chat_history: List[Dict] = []) -> str:
-        """Analyzes document content to answer a query in a chat context."""
-        # Безопасная обработка истории чата
-        history_str = ""
-        if chat_history:
+    async def _stream_response(
+        self,
+        prompt: str,
+        profile: TaskProfile,
+        timeout: Optional[float] = None,
+        first_chunk_timeout: Optional[float] = None,
+        output_tokens: Optional[int] = None,
+        stream_info: Optional[dict] = None,
+    ) -> AsyncIterator[str]:
+        """Yield text chunks from the model's streaming API as they are generated.
+
+        Holds a concurrency slot for the life of the stream and applies an
+        overall deadline (the profile's unless timeout is given);
+        ``first_chunk_timeout`` additionally bounds the wait for the first
+        chunk. Errors are raised to the caller, since part of the answer may
+        already have been sent; a stream is routed like any other call but
+        neither falls back to the other tier nor is retried after an
+        upstream 429. The name of the model serving the stream is recorded
+        in ``stream_info["model"]`` when a dict is passed.
+        """
+        timeout = timeout or profile.timeout or self.timeout
+        prompt_tokens = self.provider.estimate_tokens(prompt)
+        tiers = self._available_tiers(
+            self.router.route(profile.tier, prompt_tokens, timeout, profile.escalate_above_tokens)
+        )
+        if not tiers:
+            raise RuntimeError("AI service is not available. Check server logs.")
+        tier = tiers[0]
+        provider = self._provider_for(self.router.model_for(tier))
+        if stream_info is not None:
+            stream_info["model"] = provider.model_name
+        breaker = self.router.breakers[tier]
+        breaker.check()
+
+        deadline = time.monotonic() + timeout
+        received_tokens = 0
+        first_chunk_deadline = time.monotonic() + first_chunk_timeout if first_chunk_timeout else deadline
+        try:
+            await asyncio.wait_for(
+                admission.admit(prompt_tokens, current_user_id.get(), upstream=provider.model_name), timeout=timeout
+            )
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"AI response timed out after {timeout:g} seconds")
+        except asyncio.CancelledError:
+            self._record_cancelled(prompt_tokens, started=False)
+            raise
+        started = time.monotonic()
+        try:
+            with breaker.guard():
+                chunks = provider.stream(prompt, profile.generation_config(output_tokens)).__aiter__()
+                try:
+                    chunk_deadline = min(deadline, first_chunk_deadline)
+                    while True:
+                        try:
+                            text = await asyncio.wait_for(chunks.__anext__(), timeout=max(chunk_deadline - time.monotonic(), 0))
+                        except StopAsyncIteration:
+                            break
+                        chunk_deadline = deadline
+                        received_tokens += provider.estimate_tokens(text)
+                        yield text
+                finally:
+                    await chunks.aclose()
+            self._observe_output("", received_tokens)
+            self.router.observe(tier, time.monotonic() - started, prompt_tokens, received_tokens)
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected or stopped reading; closing the provider stream aborts generation
+            self._record_cancelled(prompt_tokens, started=True, output_tokens_received=received_tokens)
+            raise
+        except ProviderRateLimitError as e:
+            metrics.increment("ai.upstream_rate_limited")
+            delay = backoff_delay(1, e.retry_after)
+            admission.penalize(delay, upstream=provider.model_name)
+            raise AIOverloadedError("AI provider rate limit reached, please retry later", retry_after=delay)
+        except asyncio.TimeoutError:
+            self.router.observe_timeout(tier, time.monotonic() - started)
+            raise TimeoutError(f"AI response timed out after {timeout:g} seconds")
+        finally:
+            self._semaphore.release()
+
+    def _generation_key(self, task: str, document_text: str, params: dict) -> Tuple[str, str]:
+        text_hash = content_hash(document_text)
+        # Keyed by the task's preferred model, whichever tier ended up serving it
+        model_name = self._provider_for(self.router.model_for(get_profile(task).tier)).model_name
+        return text_hash, make_cache_key(text_hash, task, params, model_name, PROMPT_VERSION)
+
+    async def _cached_generation(
+        self, task: str, document_text: str, params: dict, generate: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Returns the cached result for a task, generating and storing it on a miss."""
+        text_hash, cache_key = self._generation_key(task, document_text, params)
+        cached = await generation_cache.aget(cache_key)
+        if cached is not None:
+            return cached
+
+        result = await generate()
+        if not _is_error_result(result):
+            await generation_cache.aset(cache_key, text_hash, task, result)
+        return result
+
+    async def _cached_history_summary(self, window: chat_memory.HistoryWindow, length: int) -> Optional[str]:
+        """The rolling summary of the first `length` messages, if already generated."""
+        _, cache_key = self._generation_key("chat_summary", chat_memory.summary_material(window, length), {})
+        cached = await generation_cache.aget(cache_key)
+        return cached.get("summary") if isinstance(cached, dict) else None
+
+    async def _summarize_history(self, window: chat_memory.HistoryWindow, length: int) -> dict:
+        """Folds the first `length` messages into a rolling summary, one block per model call."""
+        async def generate() -> dict:
+            start = length - chat_memory.CHAT_SUMMARY_BLOCK
+            previous = ""
+            if start - chat_memory.CHAT_SUMMARY_BLOCK >= window.offset:
+                previous_result = await self._summarize_history(window, start)
+                if _is_error_result(previous_result):
+                    return previous_result
+                previous = previous_result.get("summary", "")
+            elif start > 0:
+                # That block was never loaded; its summary was made when it still was
+                previous = await self._cached_history_summary(window, start) or ""
+            return await self._generate_json(
+                chat_memory.summary_prompt(self.system_prompt, previous, window.messages_between(start, length)),
+                get_profile("chat_summary"),
+                "Failed to parse conversation summary JSON.",
+                schema=ChatSummaryOutput,
+            )
+
+        return await self._cached_generation(
+            "chat_summary", chat_memory.summary_material(window, length), {}, generate
+        )
+
+    def _schedule_history_summary(self, window: chat_memory.HistoryWindow, length: int) -> None:
+        """Generates a history summary in the background so the current turn isn't delayed."""
+        key = chat_memory.summary_material(window, length)
+        if key in self._summary_tasks:
+            return
+
+        async def run():
             try:
-                history_str = "\n".join([f"{h.get('role', 'user')}: {h.get('content', '')}" for h in chat_history if h.get('content')])
+                await self._summarize_history(window, length)
             except Exception as e:
-                print(f"Error processing chat history: {e}")
-                history_str = ""
-        
+                print(f"Error summarizing chat history: {e}")
+
+        task = asyncio.create_task(run())
+        self._summary_tasks[key] = task
+        task.add_done_callback(lambda _: self._summary_tasks.pop(key, None))
+
+    async def _compact_history(
+        self, chat_history: List[Dict], history_offset: int = 0, conversation_key: Optional[str] = None
+    ) -> Tuple[str, List[Dict]]:
+        """
+        Returns (summary of older messages, messages to include verbatim).
+
+        history_offset and conversation_key describe a stored conversation
+        loaded as a window of its newest messages (see chat_memory). If the
+        summary for the current block boundary isn't cached yet it is
+        generated in the background, and this turn falls back to the newest
+        earlier summary plus the messages it doesn't cover.
+        """
+        window = chat_memory.HistoryWindow(chat_memory.clean_history(chat_history), history_offset, conversation_key)
+        folded, verbatim = chat_memory.split_history(window)
+        if folded == 0:
+            return "", verbatim
+
+        summary = await self._cached_history_summary(window, folded)
+        if summary is not None:
+            metrics.increment("chat_memory.summary_hits")
+            return summary, verbatim
+
+        metrics.increment("chat_memory.summary_misses")
+        if folded - chat_memory.CHAT_SUMMARY_BLOCK >= window.offset:
+            self._schedule_history_summary(window, folded)
+        for depth in range(1, chat_memory.CHAT_SUMMARY_SEARCH_DEPTH + 1):
+            length = folded - depth * chat_memory.CHAT_SUMMARY_BLOCK
+            if length <= 0:
+                break
+            summary = await self._cached_history_summary(window, length)
+            if summary is not None:
+                return summary, window.messages_between(length, window.offset + len(window.messages))
+        return "", window.messages
+
+    def _render_chat_prompt(self, document_text: str, history_str: str, query: str) -> str:
         # Если есть документ, используем его как контекст
         if document_text and document_text.strip():
             prompt = f"""
@@ -95,15 +502,147 @@ class TeachingAssistant:
             
             Вопрос пользователя: {query}
             """
-        
-        return self._generate_response(prompt)
+        return prompt
 
-    def generate_quiz(self, document_text: str, question_count: int, difficulty: str, question_type: str) -> dict:
-        """Generates a quiz from document text."""
-        prompt = f"""
+    async def _build_chat_prompt(
+        self,
+        document_text: str,
+        query: str,
+        chat_history: List[Dict],
+        history_offset: int = 0,
+        conversation_key: Optional[str] = None,
+    ) -> str:
+        """Builds the chat prompt from the document context, history and query.
+
+        The prompt never exceeds the chat profile's context budget: the
+        history gets at most CHAT_HISTORY_TOKEN_BUDGET (rolling summary first,
+        then the newest messages that fit), and the document is trimmed to
+        what remains.
+        """
+        prompt_budget = get_profile("chat").context_tokens
+        count_tokens = self.provider.estimate_tokens
+        summary, messages = await self._compact_history(chat_history, history_offset, conversation_key)
+
+        history_budget = chat_memory.CHAT_HISTORY_TOKEN_BUDGET
+        history_str = ""
+        if summary:
+            summary = chat_memory.truncate_to_tokens(summary, history_budget // 2, count_tokens)
+            history_str = f"Краткое содержание начала разговора: {summary}\n"
+            history_budget -= count_tokens(history_str)
+        history_str += chat_memory.format_messages(chat_memory.fit_messages(messages, history_budget, count_tokens))
+
+        query = chat_memory.truncate_to_tokens(query, prompt_budget // 4, count_tokens)
+        prompt = self._render_chat_prompt(document_text, history_str, query)
+        if document_text and document_text.strip():
+            if count_tokens(prompt) > prompt_budget * chat_memory.CHAT_EXACT_COUNT_FRACTION:
+                # Near the budget the estimate's error matters; an exact count recalibrates it
+                await self.provider.count_tokens(prompt)
+            # Give the document whatever the rest of the prompt leaves; estimates
+            # aren't exactly additive, so shrink again if it still overshoots
+            document_budget = prompt_budget - count_tokens(self._render_chat_prompt("-", history_str, query))
+            while count_tokens(prompt) > prompt_budget and document_budget > 0:
+                document_text = chat_memory.truncate_to_tokens(document_text, document_budget, count_tokens)
+                prompt = self._render_chat_prompt(document_text, history_str, query)
+                document_budget -= 8
+        return prompt
+
+    @staticmethod
+    def _semantic_cacheability(
+        document_id: Optional[int], version: Optional[str], query: str, chat_history: List[Dict]
+    ) -> Tuple[bool, bool]:
+        """(may be answered from the semantic cache, answer may be stored in it)"""
+        if document_id is None or version is None:
+            return False, False
+        first_question = not chat_memory.clean_history(chat_history)
+        return first_question or is_standalone(query), first_question
+
+    async def analyze_document_chat(
+        self,
+        document_text: str,
+        query: str,
+        chat_history: List[Dict] = [],
+        cache_document_id: Optional[int] = None,
+        cache_document_version: Optional[str] = None,
+        use_cache: bool = True,
+        history_offset: int = 0,
+        conversation_key: Optional[str] = None,
+    ) -> str:
+        """Analyzes document content to answer a query in a chat context.
+
+        chat_history may be the newest part of a stored conversation:
+        history_offset is the number of earlier messages left out and
+        conversation_key identifies the conversation (see chat_memory).
+        With cache_document_id and cache_document_version set, the answer may
+        come from the semantic cache (unless use_cache is False) if the
+        question is the first one or stands on its own. Answers to first
+        questions are stored in it for similar questions about the same
+        document, since only they were written without earlier turns.
+        """
+        cacheable, storable = self._semantic_cacheability(cache_document_id, cache_document_version, query, chat_history)
+        if cacheable and use_cache:
+            cached = semantic_cache.lookup(cache_document_id, cache_document_version, query)
+            if cached is not None:
+                return cached
+        prompt = await self._build_chat_prompt(document_text, query, chat_history, history_offset, conversation_key)
+        answer = await self._generate_response(prompt, get_profile("chat"))
+        if storable and not isinstance(answer, _ErrorText):
+            semantic_cache.store(cache_document_id, cache_document_version, query, answer)
+        return answer
+
+    async def stream_document_chat(
+        self,
+        document_text: str,
+        query: str,
+        chat_history: List[Dict] = [],
+        cache_document_id: Optional[int] = None,
+        cache_document_version: Optional[str] = None,
+        use_cache: bool = True,
+        stream_info: Optional[dict] = None,
+        history_offset: int = 0,
+        conversation_key: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Streams the chat answer chunk by chunk as the model generates it.
+
+        Uses the semantic cache like analyze_document_chat; a cached answer
+        is sent as a single chunk. If stream_info is given, it receives the
+        serving ``model`` and whether the answer was ``cached``.
+        """
+        if stream_info is not None:
+            stream_info.update(model=None, cached=False)
+        cacheable, storable = self._semantic_cacheability(cache_document_id, cache_document_version, query, chat_history)
+        if cacheable and use_cache:
+            cached = semantic_cache.lookup(cache_document_id, cache_document_version, query)
+            if cached is not None:
+                if stream_info is not None:
+                    stream_info["cached"] = True
+                yield cached
+                return
+        prompt = await self._build_chat_prompt(document_text, query, chat_history, history_offset, conversation_key)
+        # The whole stream may take longer than a chat answer; only its start is bounded by the chat deadline
+        chunks = self._stream_response(
+            prompt, get_profile("chat"), timeout=self.timeout, first_chunk_timeout=AI_CHAT_TIMEOUT, stream_info=stream_info
+        )
+        parts: List[str] = []
+        async with aclosing(chunks):
+            async for text in chunks:
+                parts.append(text)
+                yield text
+        if storable:
+            semantic_cache.store(cache_document_id, cache_document_version, query, "".join(parts))
+
+    async def generate_quiz(self, document_text: str, question_count: int, difficulty: str, question_type: str) -> dict:
+        """Generates a quiz from document text, reusing a cached result when possible."""
+        params = {"question_count": question_count, "difficulty": difficulty, "question_type": question_type}
+        return await self._cached_generation(
+            "quiz", document_text, params,
+            lambda: self._generate_quiz(document_text, question_count, difficulty, question_type),
+        )
+
+    def _quiz_prompt(self, document_text: str, question_count: int, difficulty: str, question_type: str) -> str:
+        return f"""
         {self.system_prompt}
         Task: Generate a quiz from the document.
-        Document: "{document_text}"
+        Document: "{self._fit_context(document_text, get_profile('quiz'))}"
         Requirements:
         - Number of questions: {question_count}
         - Difficulty: {difficulty}
@@ -111,27 +650,221 @@ class TeachingAssistant:
         Output JSON with keys: 'title', 'description', 'questions'.
         Each question should have 'question', 'type', 'options', 'correct_answer', 'explanation'.
         """
-        response_str = self._generate_response(prompt, is_json_output=True)
-        try:
-            return json.loads(response_str)
-        except json.JSONDecodeError:
-            return {"error": "Failed to parse quiz JSON."}
 
-    def generate_questions(self, document_text: str, count: int, question_type: str) -> list:
+    async def _generate_quiz(self, document_text: str, question_count: int, difficulty: str, question_type: str) -> dict:
+        """Generates a quiz from document text."""
+        prompt = self._quiz_prompt(document_text, question_count, difficulty, question_type)
+        profile = get_profile("quiz")
+        return await self._generate_json(
+            prompt, profile, "Failed to parse quiz JSON.", schema=QuizOutput,
+            output_tokens=profile.output_cap(question_count),
+        )
+
+    async def stream_quiz(
+        self, document_text: str, question_count: int, difficulty: str, question_type: str
+    ) -> AsyncIterator[dict]:
+        """
+        Generates a quiz, yielding each question as soon as the model has
+        finished writing it.
+
+        Yields {"question": {...}} events and finally {"quiz": {...}} with the
+        complete quiz, which is cached like generate_quiz's result (a cached
+        quiz is replayed immediately). Raises ValueError if the output isn't
+        a valid quiz.
+        """
+        params = {"question_count": question_count, "difficulty": difficulty, "question_type": question_type}
+        text_hash, cache_key = self._generation_key("quiz", document_text, params)
+        quiz = await generation_cache.aget(cache_key)
+        if quiz is not None:
+            for question in quiz.get("questions", []):
+                yield {"question": question}
+            yield {"quiz": quiz}
+            return
+
+        prompt = self._quiz_prompt(document_text, question_count, difficulty, question_type)
+        parser = StreamingJsonParser(item_key="questions")
+        parts: List[str] = []
+        # Questions already sent, by text: the repaired quiz may drop or reorder streamed items
+        emitted: Counter = Counter()
+        profile = get_profile("quiz")
+        chunks = self._stream_response(prompt, profile, output_tokens=profile.output_cap(question_count))
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                parts.append(chunk)
+                for item in parser.feed(chunk):
+                    question = _quiz_question(item)
+                    if question is not None:
+                        emitted[_question_key(question)] += 1
+                        yield {"question": question}
+
+        quiz = await self._parse_structured("".join(parts), QuizOutput)
+        if quiz is None or _is_error_payload(quiz):
+            raise ValueError("Failed to parse quiz JSON.")
+        # Questions only recovered by repairing the complete output
+        for question in quiz["questions"]:
+            key = _question_key(question)
+            if emitted[key]:
+                emitted[key] -= 1
+            else:
+                yield {"question": question}
+        await generation_cache.aset(cache_key, text_hash, "quiz", quiz)
+        yield {"quiz": quiz}
+
+    async def generate_questions(self, document_text: str, count: int, question_type: str) -> list:
+        """Generates study questions from document text, reusing a cached result when possible."""
+        params = {"count": count, "question_type": question_type}
+        return await self._cached_generation(
+            "questions", document_text, params,
+            lambda: self._generate_questions(document_text, count, question_type),
+        )
+
+    async def _generate_questions(self, document_text: str, count: int, question_type: str) -> list:
         """Generates study questions from document text."""
+        profile = get_profile("questions")
         prompt = f"""
         {self.system_prompt}
         Task: Generate {count} study questions of type '{question_type}'.
-        Document: "{document_text}"
+        Document: "{self._fit_context(document_text, profile)}"
         Output a JSON list of objects, each with 'question' and 'answer'.
         """
-        response_str = self._generate_response(prompt, is_json_output=True)
+        questions = await self._generate_json(
+            prompt, profile, "Failed to parse questions JSON.", schema=StudyQuestionList,
+            output_tokens=profile.output_cap(count),
+        )
+        return [questions] if isinstance(questions, dict) else questions
+
+    async def summarize_document(self, document_text: str, summary_type: str, length: str) -> dict:
+        """Generates a summary of a document, reusing a cached result when possible.
+
+        Documents longer than SUMMARY_SINGLE_PASS_LENGTH are summarized
+        section by section and the partial summaries merged.
+        """
+        params = {"summary_type": summary_type, "length": length}
+        if summarization.needs_map_reduce(document_text):
+            generate = lambda: self._summarize_map_reduce(document_text, summary_type, length)
+        else:
+            generate = lambda: self._summarize_document(document_text, summary_type, length)
+        return await self._cached_generation("summary", document_text, params, generate)
+
+    async def _parse_structured(self, response_str: str, schema: Optional[Type[BaseModel]]) -> Any:
+        """
+        Parses JSON model output and validates it against schema.
+
+        Output that isn't valid JSON or doesn't match the schema is first
+        repaired locally (fences, trailing commas, quotes, truncation); if
+        that fails, the model is asked to fix just the broken payload, which
+        costs far less than regenerating it from the document. Returns None
+        if the output can't be repaired; error payloads pass through as is.
+        """
         try:
-            return json.loads(response_str)
+            value = json.loads(response_str)
         except json.JSONDecodeError:
-            return [{"error": "Failed to parse questions JSON."}]
+            value, problem = None, "output is not valid JSON"
+        else:
+            if _is_error_payload(value):
+                return value
+            result, problem = _validate(value, schema)
+            if problem is None:
+                metrics.increment("ai.json.valid")
+                return result
+
+        repaired = repair_json(response_str)
+        if repaired is not None and repaired != value:
+            result, local_problem = _validate(repaired, schema)
+            if local_problem is None:
+                metrics.increment("ai.json.repaired_local")
+                return result
+            problem = local_problem
+
+        if 0 < len(response_str) <= AI_JSON_REPAIR_MAX_CHARS:
+            schema_json = schema.model_json_schema() if schema is not None else {}
+            profile = get_profile("json_repair")
+            # Room for the whole payload again, plus slack for what was missing
+            output_tokens = profile.max_output_tokens + self.provider.estimate_tokens(response_str)
+            fixed = await self._generate_response(
+                repair_prompt(response_str, schema_json, problem), profile, output_tokens=output_tokens
+            )
+            result, _ = _validate(repair_json(fixed), schema)
+            if result is not None:
+                metrics.increment("ai.json.repaired_model")
+                return result
 
-    def summarize_document(self, document_text: str, summary_type: str, length: str) -> dict:
+        metrics.increment("ai.json.failed")
+        print(f"Could not repair structured AI output: {problem}")
+        return None
+
+    async def _generate_json(
+        self,
+        prompt: str,
+        profile: TaskProfile,
+        error_message: str,
+        schema: Optional[Type[BaseModel]] = None,
+        output_tokens: Optional[int] = None,
+    ) -> Any:
+        """Runs a JSON-output prompt and parses (and if need be repairs) the result."""
+        response_str = await self._generate_response(prompt, profile, output_tokens=output_tokens)
+        result = await self._parse_structured(response_str, schema)
+        return {"error": error_message} if result is None else result
+
+    async def _summarize_map_reduce(self, document_text: str, summary_type: str, length: str) -> dict:
+        """Summarizes a long document hierarchically.
+
+        Sections are summarized in parallel (bounded by SUMMARY_MAP_CONCURRENCY)
+        and cached individually, so re-running on an edited document only
+        regenerates the sections that changed.
+        """
+        sections = summarization.split_into_sections(document_text)
+        limiter = asyncio.Semaphore(summarization.SUMMARY_MAP_CONCURRENCY)
+
+        async def summarize_section(section: str) -> dict:
+            async with limiter:
+                return await self._cached_generation(
+                    "summary_section", section, {"summary_type": summary_type},
+                    lambda: self._generate_json(
+                        summarization.section_prompt(self.system_prompt, section, summary_type),
+                        get_profile("summary_section"),
+                        "Failed to parse section summary JSON.",
+                        schema=SummaryOutput,
+                    ),
+                )
+
+        def successful(results: list) -> list:
+            # A failed section or merge costs detail, not the whole summary
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Warning: Summary partial failed: {result}")
+            return [r for r in results if not isinstance(r, BaseException) and not _is_error_result(r)]
+
+        # One summary is many model calls; they queue for the user's budget instead of being shed
+        with fan_out():
+            partials = successful(await asyncio.gather(
+                *[summarize_section(section) for section in sections], return_exceptions=True
+            ))
+            if not partials:
+                return {"error": "Failed to summarize document sections."}
+
+            # Merge in groups until a single reduce call can take all partials
+            while len(partials) > summarization.SUMMARY_REDUCE_FAN_IN:
+                partials = successful(await asyncio.gather(*[
+                    self._generate_json(
+                        summarization.reduce_prompt(self.system_prompt, group, summary_type, length, final=False),
+                        get_profile("summary_merge"),
+                        "Failed to parse merged summary JSON.",
+                        schema=SummaryOutput,
+                    )
+                    for group in summarization.group_partials(partials)
+                ], return_exceptions=True))
+                if not partials:
+                    return {"error": "Failed to merge section summaries."}
+
+            return await self._generate_json(
+                summarization.reduce_prompt(self.system_prompt, partials, summary_type, length, final=True),
+                get_profile("summary"),
+                "Failed to parse summary JSON.",
+                schema=SummaryOutput,
+            )
+
+    async def _summarize_document(self, document_text: str, summary_type: str, length: str) -> dict:
         """Generates a summary of a document."""
         prompt = f"""
         {self.system_prompt}
@@ -140,13 +873,9 @@ class TeachingAssistant:
         Type: {summary_type}, Length: {length}
         Output JSON with 'title', 'summary', 'key_points', 'keywords'.
         """
-        response_str = self._generate_response(prompt, is_json_output=True)
-        try:
-            return json.loads(response_str)
-        except json.JSONDecodeError:
-            return {"error": "Failed to parse summary JSON."}
+        return await self._generate_json(prompt, get_profile("summary"), "Failed to parse summary JSON.", schema=SummaryOutput)
 
-    def generate_class_report(self, class_data_str: str) -> str:
+    async def generate_class_report(self, class_data_str: str) -> str:
         """Generates a class report from formatted data."""
         prompt = f"""
         {self.system_prompt}
@@ -155,9 +884,9 @@ class TeachingAssistant:
         Report must include: overall performance, student analysis, assignment analysis, and recommendations.
         Format as markdown.
         """
-        return self._generate_response(prompt)
+        return await self._generate_response(prompt, get_profile("class_report"))
 
-    def process_import_file(self, file_content: str) -> dict:
+    async def process_import_file(self, file_content: str) -> dict:
         """Parses file content to extract structured class data."""
         prompt = f"""
         {self.system_prompt}
@@ -165,13 +894,11 @@ class TeachingAssistant:
         File Content: {file_content}
         Return JSON with 'students', 'assignments', 'grades'.
         """
-        response_str = self._generate_response(prompt, is_json_output=True)
-        try:
-            return json.loads(response_str)
-        except json.JSONDecodeError:
-            return {"error": "Failed to parse import file JSON."}
+        return await self._generate_json(
+            prompt, get_profile("class_import"), "Failed to parse import file JSON.", schema=ClassImportOutput
+        )
             
-    def generate_file_report(self, file_content: str) -> str:
+    async def generate_file_report(self, file_content: str) -> str:
         """Generates a report from file content."""
         prompt = f"""
         {self.system_prompt}
@@ -180,7 +907,7 @@ class TeachingAssistant:
         Report must include: summary of the content, key insights, analysis, and recommendations.
         Format as markdown with clear sections and bullet points where appropriate.
         """
-        return self._generate_response(prompt)
+        return await self._generate_response(prompt, get_profile("file_report"))
 
 # Singleton instance
 teaching_assistant = TeachingAssistant()
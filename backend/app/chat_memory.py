@@ -0,0 +1,130 @@
+"""
+Conversation Memory for Professor AI Helper
+
+Keeps chat prompts within a fixed token budget however long the
+conversation gets. The most recent messages are sent verbatim; older
+messages are folded, a block at a time, into a rolling summary. Each
+summary is cached under the messages it covers, so a conversation only
+pays for one small summarization call every CHAT_SUMMARY_BLOCK messages.
+
+A stored conversation is loaded as a window of its newest turns. Its
+summaries are keyed on the conversation and absolute message positions
+rather than on the window's contents, so the keys stay put as the window
+slides forward.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import os
+
+# Context budget settings (tokens as counted by the provider's calibrated estimate)
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", 16000))  # Whole chat prompt
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 2000))  # Summary plus verbatim messages
+CHAT_RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", 8))  # Always kept verbatim (user + assistant)
+CHAT_SUMMARY_BLOCK = int(os.getenv("CHAT_SUMMARY_BLOCK", 8))  # Older messages folded into the summary at a time
+CHAT_SUMMARY_SEARCH_DEPTH = 3  # Earlier summaries tried when the current one isn't ready yet
+CHAT_EXACT_COUNT_FRACTION = 0.9  # Prompts estimated above this share of the budget get an exact count
+
+TokenCounter = Callable[[str], int]
+
+
+def clean_history(chat_history: Optional[List[Dict]]) -> List[Dict]:
+    """Drops malformed and empty entries, keeping only role and content."""
+    messages = []
+    for entry in chat_history or []:
+        if isinstance(entry, dict) and entry.get("content"):
+            messages.append({"role": str(entry.get("role", "user")), "content": str(entry["content"])})
+    return messages
+
+
+def format_messages(messages: List[Dict]) -> str:
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+@dataclass
+class HistoryWindow:
+    """The messages of a conversation passed to the model, and where they sit in it."""
+
+    messages: List[Dict] = field(default_factory=list)
+    offset: int = 0  # Earlier messages of the conversation that were not loaded
+    conversation: Optional[str] = None  # Stable key of a stored conversation; None for client-sent history
+
+    def messages_between(self, start: int, stop: int) -> List[Dict]:
+        """Messages at absolute positions [start, stop) that are in the window."""
+        return self.messages[max(start - self.offset, 0):max(stop - self.offset, 0)]
+
+
+def split_history(window: HistoryWindow) -> Tuple[int, List[Dict]]:
+    """
+    Returns how many leading messages of the conversation (counted from its
+    start, not the window's) belong in the summary, and the messages to
+    send verbatim. Only whole blocks are summarized, so the summarized
+    prefix (and its cache key) changes once per block.
+    """
+    older = max(window.offset + len(window.messages) - CHAT_RECENT_MESSAGES, 0)
+    folded = (older // CHAT_SUMMARY_BLOCK) * CHAT_SUMMARY_BLOCK
+    return folded, window.messages_between(folded, window.offset + len(window.messages))
+
+
+def summary_material(window: HistoryWindow, length: int) -> str:
+    """
+    Stable text identifying the summary of the conversation's first `length`
+    messages, used as its cache content: the messages themselves for
+    client-sent history, otherwise the conversation key, the length and
+    the last block folded in.
+    """
+    if window.conversation is None:
+        return json.dumps(window.messages[:length], ensure_ascii=False, sort_keys=True)
+    return json.dumps({
+        "conversation": window.conversation,
+        "length": length,
+        "block": window.messages_between(length - CHAT_SUMMARY_BLOCK, length),
+    }, ensure_ascii=False, sort_keys=True)
+
+
+def summary_prompt(system_prompt: str, previous_summary: str, messages: List[Dict]) -> str:
+    """Prompt folding one block of messages into the running summary."""
+    previous = previous_summary or "(пока нет)"
+    return f"""
+        {system_prompt}
+        Task: Update the running summary of a conversation between a teacher and the assistant.
+        Current summary: {previous}
+        New messages:
+        {format_messages(messages)}
+        Write the updated summary in the language of the conversation, at most 200 words.
+        Keep names, numbers, decisions and open questions; drop small talk.
+        Output JSON with 'summary' (a string).
+        """
+
+
+def fit_messages(messages: List[Dict], max_tokens: int, count_tokens: TokenCounter) -> List[Dict]:
+    """Newest messages that fit in max_tokens; the oldest are dropped first."""
+    kept: List[Dict] = []
+    used = 0
+    for message in reversed(messages):
+        cost = count_tokens(f"{message['role']}: {message['content']}\n")
+        if used + cost > max_tokens:
+            break
+        kept.append(message)
+        used += cost
+    return list(reversed(kept))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: TokenCounter) -> str:
+    """Cuts text at a line or word boundary so that it fits in max_tokens."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    marker = "\n[...]"
+    # Proportional first guess, then shrink until it fits
+    limit = int(len(text) * max_tokens / max(count_tokens(text), 1))
+    while limit > 0:
+        cut = text[:limit]
+        boundary = max(cut.rfind("\n"), cut.rfind(" "))
+        if boundary > limit // 2:
+            cut = cut[:boundary]
+        if count_tokens(cut + marker) <= max_tokens:
+            return cut + marker
+        limit = int(limit * 0.9)
+    return ""
@@ -0,0 +1,123 @@
+"""
+Chat History Writer for Professor AI Helper
+
+Chat turns are persisted off the request path: endpoints hand finished
+turns to a queue and a background task writes them in batches, one
+transaction per batch. Turns not yet written are still visible through
+pending_turns(), so the stored history is complete for the next request.
+"""
+from datetime import datetime, timezone
+from typing import List, Optional
+import asyncio
+import os
+
+from app import crud
+from app.database import SessionLocal
+from app.metrics import metrics
+
+# Writer settings
+CHAT_WRITER_BATCH_SIZE = int(os.getenv("CHAT_WRITER_BATCH_SIZE", 100))  # Turns per transaction
+CHAT_WRITER_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITER_FLUSH_INTERVAL", 0.5))  # Seconds a turn may wait for company
+CHAT_WRITER_MAX_QUEUE = int(os.getenv("CHAT_WRITER_MAX_QUEUE", 10000))
+
+
+def _write_batch(turns: List[dict]) -> None:
+    with SessionLocal() as db:
+        try:
+            crud.create_chat_history_batch(db, turns)
+            return
+        except Exception as e:
+            db.rollback()
+            print(f"Error writing chat history batch, retrying turn by turn: {e}")
+        # One bad row (e.g. its document was deleted meanwhile) shouldn't lose the rest
+        for turn in turns:
+            try:
+                crud.create_chat_history_batch(db, [turn])
+            except Exception as e:
+                db.rollback()
+                metrics.increment("chat_writer.dropped")
+                print(f"Error writing chat turn for document {turn.get('document_id')}: {e}")
+
+
+class ChatHistoryWriter:
+    """Single background task draining a queue of chat turns into the database."""
+
+    def __init__(
+        self,
+        batch_size: int = CHAT_WRITER_BATCH_SIZE,
+        flush_interval: float = CHAT_WRITER_FLUSH_INTERVAL,
+        max_queue: int = CHAT_WRITER_MAX_QUEUE,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Turns accepted but not yet committed, oldest first
+        self._pending: List[dict] = []
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Write whatever is still queued, then stop."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def submit(self, user_id: int, document_id: Optional[int], user_query: str, ai_response: str) -> None:
+        """Queue a finished turn for writing; never blocks the caller."""
+        turn = {
+            "user_id": user_id,
+            "document_id": document_id,
+            "user_query": user_query,
+            "ai_response": ai_response,
+            # Stamped now, so batching doesn't reorder turns
+            "timestamp": datetime.now(timezone.utc),
+        }
+        if self._queue is None:
+            _write_batch([turn])
+            return
+        try:
+            self._queue.put_nowait(turn)
+        except asyncio.QueueFull:
+            metrics.increment("chat_writer.dropped")
+            print("Warning: chat history queue is full, dropping turn")
+            return
+        self._pending.append(turn)
+
+    def pending_turns(self, user_id: int, document_id: int) -> List[dict]:
+        return [t for t in self._pending if t["user_id"] == user_id and t["document_id"] == document_id]
+
+    async def _next_batch(self) -> List[Optional[dict]]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            stopping = batch[-1] is None
+            turns = [turn for turn in batch if turn is not None]
+            if turns:
+                await asyncio.to_thread(_write_batch, turns)
+                metrics.increment("chat_writer.batches")
+                metrics.increment("chat_writer.turns", len(turns))
+                written = {id(turn) for turn in turns}
+                self._pending = [t for t in self._pending if id(t) not in written]
+            if stopping:
+                return
+
+
+chat_writer = ChatHistoryWriter()
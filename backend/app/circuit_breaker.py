@@ -0,0 +1,139 @@
+"""
+Circuit Breaker for Professor AI Helper
+
+Stops sending work to a dependency that keeps failing. After enough
+consecutive failures the breaker opens and calls fail immediately; once the
+recovery timeout has passed a limited number of probe calls are let
+through (half-open), and the breaker closes again if they succeed.
+"""
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple, Type
+import os
+import threading
+import time
+
+from app.metrics import metrics
+from app.rate_limit import AIOverloadedError
+
+# Breaker settings
+AI_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", 5))  # Consecutive failures before opening
+AI_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("AI_BREAKER_RECOVERY_TIMEOUT", 30))  # Seconds open before probing
+AI_BREAKER_HALF_OPEN_PROBES = int(os.getenv("AI_BREAKER_HALF_OPEN_PROBES", 1))  # Concurrent probe calls
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(AIOverloadedError):
+    """The breaker is open; the call was rejected without reaching the dependency."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Only exceptions listed in failure_exceptions (and not in
+    ignored_exceptions) count as failures; anything else, including
+    cancellation, leaves the breaker as it was.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+        ignored_exceptions: Tuple[Type[BaseException], ...] = (),
+        failure_threshold: int = AI_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = AI_BREAKER_RECOVERY_TIMEOUT,
+        half_open_probes: int = AI_BREAKER_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.failure_exceptions = failure_exceptions
+        self.ignored_exceptions = ignored_exceptions
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+
+    def check(self) -> None:
+        """Fail fast while open, without taking a probe slot."""
+        with self._lock:
+            if self._current_state() == OPEN:
+                metrics.increment(f"{self.name}.rejected")
+                raise CircuitOpenError("AI service is temporarily unavailable, please retry later",
+                                       retry_after=self._retry_after())
+
+    def _before_call(self) -> bool:
+        """Admit a call; returns True if it is a half-open probe."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            metrics.increment(f"{self.name}.rejected")
+            raise CircuitOpenError("AI service is temporarily unavailable, please retry later",
+                                   retry_after=self._retry_after() or self.recovery_timeout)
+
+    def _after_call(self, probe: bool, error: Optional[BaseException]) -> None:
+        failed = (
+            error is not None
+            and isinstance(error, self.failure_exceptions)
+            and not isinstance(error, self.ignored_exceptions)
+        )
+        with self._lock:
+            if probe:
+                self._probes -= 1
+            if failed:
+                self._failures += 1
+                if probe or self._failures >= self.failure_threshold:
+                    if self._state != OPEN:
+                        metrics.increment(f"{self.name}.opened")
+                        print(f"Circuit breaker '{self.name}' opened after {self._failures} failures")
+                    self._state = OPEN
+                    self._opened_at = time.monotonic()
+            elif error is None:
+                self._failures = 0
+                if self._state == HALF_OPEN and probe:
+                    print(f"Circuit breaker '{self.name}' closed")
+                    self._state = CLOSED
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Wrap one call to the protected dependency."""
+        probe = self._before_call()
+        try:
+            yield
+        except BaseException as e:
+            self._after_call(probe, e)
+            raise
+        else:
+            self._after_call(probe, None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_after": round(self._retry_after(), 1) if state == OPEN else 0,
+            }
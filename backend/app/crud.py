@@ -1,4 +1,7 @@
-from sqlalchemy.orm import Session, joinedload, selectinload
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, joinedload, selectinload, defer
 import pandas as pd
 from fastapi import HTTPException, status
 from app import models, schemas, security
@@ -27,8 +30,12 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 # Document CRUD operations
-def get_document(db: Session, document_id: int, user_id: int):
-    return db.query(models.Document).filter(models.Document.id == document_id, models.Document.user_id == user_id).first()
+def get_document(db: Session, document_id: int, user_id: int, load_text: bool = True):
+    query = db.query(models.Document)
+    if not load_text:
+        # Extracted text can be megabytes; let callers fetch it lazily if needed
+        query = query.options(defer(models.Document.extracted_text_content))
+    return query.filter(models.Document.id == document_id, models.Document.user_id == user_id).first()
 
 def get_documents_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Document).filter(models.Document.user_id == user_id).offset(skip).limit(limit).all()
@@ -40,24 +47,42 @@ def delete_document(db: Session, document_id: int, user_id: int):
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found or access denied"
         )
+    # Bulk-delete the retrieval index instead of loading every row through the ORM
+    db.query(models.ChunkTerm).filter(models.ChunkTerm.document_id == document_id).delete(synchronize_session=False)
+    db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id == document_id).delete(synchronize_session=False)
     db.delete(db_document)
     db.commit()
     return True
 
-def create_user_document(db: Session, file_name: str, file_path: str, file_type: str, user_id: int, extracted_text: str = "", file_size: int = 0):
+def create_user_document(db: Session, file_name: str, file_path: str, file_type: str, user_id: int, extracted_text: str = "", file_size: int = 0, stored_file_id: Optional[int] = None):
     db_document = models.Document(
         file_name=file_name,
         file_path=file_path,
         file_type=file_type,
         user_id=user_id,
         extracted_text_content=extracted_text,
-        file_size=file_size
+        file_size=file_size,
+        stored_file_id=stored_file_id
     )
     db.add(db_document)
     db.commit()
     db.refresh(db_document)
     return db_document
 
+def count_document_pages(db: Session, stored_file_id: int) -> int:
+    return db.query(func.count(models.DocumentPage.id)).filter(models.DocumentPage.stored_file_id == stored_file_id).scalar()
+
+def get_document_pages(db: Session, stored_file_id: int, first_page: int, last_page: int):
+    """Pages first_page to last_page (1-based, inclusive) of a stored file, in order."""
+    return db.query(models.DocumentPage)\
+        .filter(
+            models.DocumentPage.stored_file_id == stored_file_id,
+            models.DocumentPage.page_number >= first_page,
+            models.DocumentPage.page_number <= last_page,
+        )\
+        .order_by(models.DocumentPage.page_number.asc())\
+        .all()
+
 # Chat History CRUD operations
 def get_chat_history_by_document(db: Session, document_id: int, user_id: int, skip: int = 0, limit: int = 1000):
     return db.query(models.ChatHistory)\
@@ -65,6 +90,34 @@ def get_chat_history_by_document(db: Session, document_id: int, user_id: int, sk
         .order_by(models.ChatHistory.timestamp.asc())\
         .offset(skip).limit(limit).all()
 
+def get_chat_history_page(db: Session, document_id: int, user_id: int, limit: int = 50,
+                          before: Optional[Tuple[datetime, int]] = None):
+    """
+    Newest-first page of a document's chat turns, using keyset pagination.
+
+    before is the (timestamp, id) of the oldest turn already seen; the page
+    holds the turns strictly older than it.
+    """
+    query = db.query(models.ChatHistory).filter(
+        models.ChatHistory.user_id == user_id,
+        models.ChatHistory.document_id == document_id,
+    )
+    if before is not None:
+        before_timestamp, before_id = before
+        query = query.filter(or_(
+            models.ChatHistory.timestamp < before_timestamp,
+            and_(models.ChatHistory.timestamp == before_timestamp, models.ChatHistory.id < before_id),
+        ))
+    return query.order_by(models.ChatHistory.timestamp.desc(), models.ChatHistory.id.desc()).limit(limit).all()
+
+def get_chat_history_extent(db: Session, document_id: int, user_id: int) -> Tuple[int, Optional[int]]:
+    """(number of stored turns, id of the first one) of a document's conversation."""
+    count, first_id = db.query(func.count(models.ChatHistory.id), func.min(models.ChatHistory.id)).filter(
+        models.ChatHistory.user_id == user_id,
+        models.ChatHistory.document_id == document_id,
+    ).one()
+    return count, first_id
+
 def create_chat_history(db: Session, chat: schemas.ChatHistoryCreate, user_id: int, ai_response: str):
     db_chat = models.ChatHistory(**chat.model_dump(), user_id=user_id, ai_response=ai_response)
     db.add(db_chat)
@@ -72,6 +125,11 @@ def create_chat_history(db: Session, chat: schemas.ChatHistoryCreate, user_id: i
     db.refresh(db_chat)
     return db_chat
 
+def create_chat_history_batch(db: Session, turns: List[dict]) -> None:
+    """Inserts several chat turns in one transaction."""
+    db.add_all([models.ChatHistory(**turn) for turn in turns])
+    db.commit()
+
 # Generic update function
 def update_db_object(db_obj, data):
     for field, value in data.model_dump(exclude_unset=True).items():
@@ -234,6 +292,71 @@ def import_data_from_excel(db: Session, class_id: int, file_path: str):
                     db.add(new_grade)
     db.commit()
 
+def import_processed_class_data(db: Session, class_id: int, processed_data: dict):
+    """Import AI-extracted students, assignments and grades into a class in one transaction."""
+    try:
+        # Import students
+        for student_data in processed_data.get("students", []):
+            student_name = student_data.get("name")
+            if student_name:
+                # Check if student already exists
+                existing_student = db.query(models.Student).filter(
+                    models.Student.full_name == student_name,
+                    models.Student.class_id == class_id
+                ).first()
+                if not existing_student:
+                    db.add(models.Student(full_name=student_name, class_id=class_id))
+        db.flush()  # autoflush is off; make new students visible to the grade lookups
+
+        # Import assignments
+        for assignment_data in processed_data.get("assignments", []):
+            title = assignment_data.get("title")
+            description = assignment_data.get("description", "")
+            if title:
+                # Check if assignment already exists
+                existing_assignment = db.query(models.Assignment).filter(
+                    models.Assignment.title == title,
+                    models.Assignment.class_id == class_id
+                ).first()
+                if not existing_assignment:
+                    db.add(models.Assignment(title=title, description=description, class_id=class_id))
+        db.flush()
+
+        # Import grades
+        for grade_data in processed_data.get("grades", []):
+            student_name = grade_data.get("student_name")
+            assignment_title = grade_data.get("assignment_title")
+            grade_value = grade_data.get("grade")
+            if not (student_name and assignment_title and grade_value):
+                continue
+
+            # Get student and assignment IDs
+            student = db.query(models.Student).filter(
+                models.Student.full_name == student_name,
+                models.Student.class_id == class_id
+            ).first()
+            assignment = db.query(models.Assignment).filter(
+                models.Assignment.title == assignment_title,
+                models.Assignment.class_id == class_id
+            ).first()
+            if not (student and assignment):
+                continue
+
+            # Check if grade already exists
+            existing_grade = db.query(models.Grade).filter(
+                models.Grade.student_id == student.id,
+                models.Grade.assignment_id == assignment.id
+            ).first()
+            if existing_grade:
+                existing_grade.grade = str(grade_value)
+            else:
+                db.add(models.Grade(student_id=student.id, assignment_id=assignment.id, grade=str(grade_value)))
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
 def get_class_details(db: Session, class_id: int, user_id: int) -> models.Class:
     """Get class details with an optimized query to load all related data."""
     return (
@@ -0,0 +1,103 @@
+"""
+Document Text Cache for Professor AI Helper
+
+This module keeps recently used extracted document text in memory so chat
+requests can reference a document by id instead of re-sending its text.
+"""
+from collections import OrderedDict
+from typing import Optional, Tuple
+import os
+import threading
+
+from sqlalchemy.orm import Session
+
+from app import crud, models
+
+# Total size of cached text, measured as UTF-8 bytes
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv("DOCUMENT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class DocumentTextCache:
+    """
+    An in-process LRU cache of document text bounded by total byte size.
+
+    Entries are looked up by document id and content version: ids are
+    reused once a document is deleted, so a version that no longer matches
+    is treated as a miss.
+    """
+
+    def __init__(self, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # document_id -> (version, text, size)
+        self._entries: "OrderedDict[int, tuple[str, str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, document_id: int, version: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(document_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(document_id)
+            return entry[1]
+
+    def put(self, document_id: int, version: str, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            # Never let a single huge document flush the whole cache
+            return
+        with self._lock:
+            self._discard(document_id)
+            self._entries[document_id] = (version, text, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def invalidate(self, document_id: int) -> None:
+        with self._lock:
+            self._discard(document_id)
+
+    def _discard(self, document_id: int) -> None:
+        entry = self._entries.pop(document_id, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+
+document_text_cache = DocumentTextCache()
+
+
+def content_version(document: models.Document) -> str:
+    """
+    Identifies the content of a document. Its file_path names the file:
+    the SHA-256 for deduplicated files, a fresh UUID for older uploads, so
+    unlike the id it is never reused for a different file. text_revision
+    changes when the text of the same file is rewritten, e.g. by OCR.
+    """
+    return f"{document.file_path}#{document.text_revision or 0}"
+
+
+def get_document_content(db: Session, document_id: int, user_id: int) -> Optional[Tuple[str, str]]:
+    """
+    Return (extracted text, content version) of a document owned by the user.
+
+    Ownership is checked against the database on every call; only the text
+    itself is served from the cache. Returns None if the document does not
+    exist or belongs to someone else.
+    """
+    document = crud.get_document(db, document_id=document_id, user_id=user_id, load_text=False)
+    if not document:
+        return None
+
+    version = content_version(document)
+    text = document_text_cache.get(document_id, version)
+    if text is None:
+        text = document.extracted_text_content or ""
+        document_text_cache.put(document_id, version, text)
+    return text, version
+
+
+def get_document_text(db: Session, document_id: int, user_id: int) -> Optional[str]:
+    """The extracted text of a document owned by the user, or None; see get_document_content."""
+    content = get_document_content(db, document_id, user_id)
+    return content[0] if content else None
@@ -0,0 +1,245 @@
+"""
+Text Extraction Pool for Professor AI Helper
+
+Parsing PDFs and Word files is CPU-bound and can take seconds, so it runs
+in a pool of worker processes instead of on the event loop (or in a
+thread, which would hold the GIL). Workers are started and warmed up with
+the app, recycled after a number of jobs, and run under an address-space
+limit. A job that overruns its deadline gets its pool killed and replaced,
+so a runaway parser can't hold a core forever. Large PDFs are split into
+page ranges that are extracted in parallel.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+from app import file_processing  # Imported here so every worker has the parsers loaded
+from app.metrics import metrics
+
+# Extraction pool settings
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 120))  # Seconds per file
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv("EXTRACTION_MEMORY_LIMIT_MB", 2048))  # Address space per worker; 0 disables
+EXTRACTION_MAX_TASKS_PER_WORKER = int(os.getenv("EXTRACTION_MAX_TASKS_PER_WORKER", 100))  # Recycle workers to bound leaks
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", 25))  # PDF pages per worker call
+EXTRACTION_PROGRESS_TTL = float(os.getenv("EXTRACTION_PROGRESS_TTL", 300))  # Seconds finished uploads stay pollable
+
+
+class ExtractionError(RuntimeError):
+    """Text extraction timed out, ran out of memory or crashed its worker."""
+
+
+def _init_worker(memory_limit_mb: int, pid_queue) -> None:
+    # Lets the pool find its own workers when it has to kill them
+    pid_queue.put(os.getpid())
+    if memory_limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:
+        return  # Not available on Windows
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+class ExtractionPool:
+    """Process pool running file_processing functions with deadlines."""
+
+    def __init__(
+        self,
+        workers: int = EXTRACTION_WORKERS,
+        timeout: float = EXTRACTION_TIMEOUT,
+        memory_limit_mb: int = EXTRACTION_MEMORY_LIMIT_MB,
+        max_tasks_per_worker: int = EXTRACTION_MAX_TASKS_PER_WORKER,
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Bumped every time the pool is replaced, so concurrent failures restart it only once
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Workers report their PIDs through the queue as they start (also when recycled)
+        self._pid_queue = None
+        self._pids: Set[int] = set()
+        self._pids_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the workers now rather than on the first upload."""
+        self._ensure_pool()
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forking a process that runs the event loop and thread pools is unsafe
+                context = multiprocessing.get_context("spawn")
+                with self._pids_lock:
+                    self._pid_queue = context.SimpleQueue()
+                    self._pids = set()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb, self._pid_queue),
+                    max_tasks_per_child=self.max_tasks_per_worker or None,
+                )
+                for _ in range(self.workers):
+                    self._pool.submit(_warm_up)
+            return self._pool
+
+    def _collect_pids(self) -> Set[int]:
+        """PIDs of this pool's live workers, draining the ones reported since the last call."""
+        with self._pids_lock:
+            while self._pid_queue is not None and not self._pid_queue.empty():
+                self._pids.add(self._pid_queue.get())
+            # Recycled workers have exited; active_children() also reaps them
+            self._pids &= {process.pid for process in multiprocessing.active_children()}
+            return set(self._pids)
+
+    def _kill(self, pool: ProcessPoolExecutor) -> None:
+        # The executor can't cancel a running call; killing its workers is the only way to stop one
+        pids = self._collect_pids()
+        for process in multiprocessing.active_children():
+            if process.pid in pids:
+                process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _restart(self, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation or self._pool is None:
+                return
+            self._kill(self._pool)
+            self._pool = None
+            self._generation += 1
+        metrics.increment("extraction.pool_restarts")
+
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Runs fn(*args) in a worker process and returns its result.
+
+        Raises ExtractionError if the call exceeds its deadline, runs out of
+        memory or crashes the worker. Calls that were only caught up in a
+        restart caused by another call are retried once on the new pool.
+        """
+        timeout = timeout or self.timeout
+        for attempt in range(2):
+            pool = self._ensure_pool()
+            generation = self._generation
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(asyncio.wrap_future(pool.submit(fn, *args)), timeout)
+                metrics.observe("extraction.duration_seconds", time.monotonic() - started)
+                # Keeps the PID queue from filling up as workers are recycled
+                self._collect_pids()
+                return result
+            except asyncio.TimeoutError:
+                metrics.increment("extraction.timeouts")
+                self._restart(generation)
+                raise ExtractionError(f"Text extraction timed out after {timeout:g} seconds")
+            except MemoryError:
+                metrics.increment("extraction.out_of_memory")
+                raise ExtractionError("Text extraction ran out of memory")
+            except BrokenProcessPool as e:
+                restarted_elsewhere = generation != self._generation
+                self._restart(generation)
+                if restarted_elsewhere and attempt == 0:
+                    continue
+                metrics.increment("extraction.crashes")
+                raise ExtractionError("Text extraction worker crashed") from e
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._kill(self._pool)
+                self._pool = None
+
+
+extraction_pool = ExtractionPool()
+
+
+async def extract_text(file_path: str, file_name: str) -> str:
+    """file_processing.extract_text, run in the extraction pool."""
+    return await extraction_pool.run(file_processing.extract_text, file_path, file_name)
+
+
+async def extract_pages(
+    file_path: str, file_name: str, on_progress: Optional[Callable[[int, int], None]] = None
+) -> List[str]:
+    """
+    Extracts a file's text page by page. PDF page ranges are extracted in
+    parallel across the pool, calling on_progress(pages_done, total_pages)
+    as each range finishes; other formats come back as a single page.
+    """
+    if os.path.splitext(file_name)[1].lower() != ".pdf":
+        pages = [await extract_text(file_path, file_name)]
+        if on_progress:
+            on_progress(1, 1)
+        return pages
+
+    total = await extraction_pool.run(file_processing.count_pdf_pages, file_path)
+    ranges = [(start, min(start + EXTRACTION_PAGES_PER_TASK, total)) for start in range(0, total, EXTRACTION_PAGES_PER_TASK)]
+    results: List[List[str]] = [[] for _ in ranges]
+    done = 0
+    if on_progress:
+        on_progress(0, total)
+
+    async def extract_range(index: int, start: int, stop: int) -> None:
+        nonlocal done
+        results[index] = await extraction_pool.run(file_processing.extract_pdf_pages, file_path, start, stop)
+        done += stop - start
+        if on_progress:
+            on_progress(done, total)
+
+    await asyncio.gather(*(extract_range(index, start, stop) for index, (start, stop) in enumerate(ranges)))
+    return [page for pages in results for page in pages]
+
+
+class ExtractionProgress:
+    """
+    Pages extracted so far per upload, for clients polling a long upload by
+    its upload_id. Entries are kept per user, so a user only ever sees (or
+    overwrites) the progress of their own uploads.
+    """
+
+    def __init__(self, ttl: float = EXTRACTION_PROGRESS_TTL):
+        self.ttl = ttl
+        # (user_id, upload_id) -> (status, pages_done, total_pages, ocr_job_id, updated_at)
+        self._entries: Dict[Tuple[int, str], Tuple[str, int, int, Optional[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def update(
+        self,
+        user_id: int,
+        upload_id: str,
+        status: str,
+        pages_done: int = 0,
+        total_pages: int = 0,
+        ocr_job_id: Optional[int] = None,
+    ) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(user_id, upload_id)] = (status, pages_done, total_pages, ocr_job_id, now)
+            # Forget uploads nobody has polled for a while
+            for key in [key for key, entry in self._entries.items() if now - entry[4] > self.ttl]:
+                del self._entries[key]
+
+    def get(self, user_id: int, upload_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get((user_id, upload_id))
+        if entry is None:
+            return None
+        status, pages_done, total_pages, ocr_job_id, _ = entry
+        return {"status": status, "pages_done": pages_done, "total_pages": total_pages, "ocr_job_id": ocr_job_id}
+
+
+extraction_progress = ExtractionProgress()
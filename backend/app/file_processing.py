@@ -1,4 +1,6 @@
 import os
+import subprocess
+from typing import List
 import fitz  # PyMuPDF
 import docx
 
@@ -21,6 +23,47 @@ def extract_text_from_pdf(file_path: str) -> str:
         print(f"Error reading pdf file {file_path}: {e}")
         return ""
 
+def count_pdf_pages(file_path: str) -> int:
+    """Returns the number of pages in a .pdf file, or 0 if it can't be read."""
+    try:
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except Exception as e:
+        print(f"Error reading pdf file {file_path}: {e}")
+        return 0
+
+def extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """Extracts the text of pages start to stop - 1 (0-based) of a .pdf file, one string per page."""
+    try:
+        with fitz.open(file_path) as doc:
+            return [doc[number].get_text() for number in range(start, min(stop, doc.page_count))]
+    except Exception as e:
+        print(f"Error reading pages {start}-{stop - 1} of pdf file {file_path}: {e}")
+        return [""] * (stop - start)
+
+def render_pdf_page(file_path: str, page_index: int, dpi: int = 300) -> bytes:
+    """Renders one page (0-based) of a .pdf file as a grayscale PNG for OCR, or b"" if it can't be read."""
+    try:
+        with fitz.open(file_path) as doc:
+            return doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).tobytes("png")
+    except Exception as e:
+        print(f"Error rendering page {page_index} of pdf file {file_path}: {e}")
+        return b""
+
+def ocr_image(image: bytes, languages: str = "eng", timeout: float = 120, command: str = "tesseract") -> str:
+    """Reads the text in an image with the tesseract command line tool."""
+    result = subprocess.run(
+        [command, "stdin", "stdout", "-l", languages],
+        input=image,
+        capture_output=True,
+        timeout=timeout,
+        # One thread per call; parallelism comes from the OCR process pool
+        env={**os.environ, "OMP_THREAD_LIMIT": "1"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"tesseract failed: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+    return result.stdout.decode("utf-8", errors="ignore")
+
 def extract_text_from_docx(file_path: str) -> str:
     """Extracts text from a .docx file."""
     try:
@@ -0,0 +1,193 @@
+"""
+Generation Cache for Professor AI Helper
+
+This module caches structured AI results (quizzes, questions, summaries) so
+the same document with the same parameters is only generated once. Lookups go
+through an in-memory LRU tier first and then the generation_cache table.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from app import models
+from app.database import SessionLocal
+from app.metrics import metrics
+
+# Cache settings
+GENERATION_CACHE_TTL_SECONDS = int(os.getenv("GENERATION_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+GENERATION_CACHE_MEMORY_BYTES = int(os.getenv("GENERATION_CACHE_MEMORY_BYTES", 16 * 1024 * 1024))
+GENERATION_CACHE_MAX_ROWS = int(os.getenv("GENERATION_CACHE_MAX_ROWS", 10000))
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 of document text; identical content shares cache entries."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def make_cache_key(text_hash: str, task: str, params: dict, model_name: str, prompt_version: str) -> str:
+    """Stable key over everything that affects the generated output."""
+    payload = json.dumps(
+        {"content": text_hash, "task": task, "params": params, "model": model_name, "prompt": prompt_version},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, so comparisons behave the same on SQLite and PostgreSQL
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class GenerationCache:
+    """Two-tier (memory LRU + database) cache of JSON-serialisable results."""
+
+    def __init__(
+        self,
+        ttl_seconds: int = GENERATION_CACHE_TTL_SECONDS,
+        memory_bytes: int = GENERATION_CACHE_MEMORY_BYTES,
+        max_rows: int = GENERATION_CACHE_MAX_ROWS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = memory_bytes
+        self.max_rows = max_rows
+        self._memory_used = 0
+        # cache_key -> (content_hash, encoded result, size, monotonic expiry)
+        self._memory: "OrderedDict[str, tuple[str, str, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Memory tier
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                self._memory_discard(key)
+                return None
+            self._memory.move_to_end(key)
+            return entry[1]
+
+    def _memory_put(self, key: str, text_hash: str, encoded: str, ttl_seconds: float) -> None:
+        size = len(encoded.encode("utf-8"))
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            self._memory_discard(key)
+            self._memory[key] = (text_hash, encoded, size, time.monotonic() + ttl_seconds)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                evicted_key = next(iter(self._memory))
+                self._memory_discard(evicted_key)
+
+    def _memory_discard(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_used -= entry[2]
+
+    # Database tier
+
+    def _db_get(self, key: str) -> Optional[models.GenerationCacheEntry]:
+        with SessionLocal() as db:
+            entry = db.query(models.GenerationCacheEntry).filter(
+                models.GenerationCacheEntry.cache_key == key,
+                models.GenerationCacheEntry.expires_at > _utcnow(),
+            ).first()
+            if entry is not None:
+                db.expunge(entry)
+            return entry
+
+    def _db_put(self, key: str, text_hash: str, task: str, encoded: str) -> None:
+        now = _utcnow()
+        with SessionLocal() as db:
+            db.query(models.GenerationCacheEntry).filter(models.GenerationCacheEntry.cache_key == key).delete()
+            db.add(models.GenerationCacheEntry(
+                cache_key=key,
+                content_hash=text_hash,
+                task=task,
+                result=encoded,
+                size_bytes=len(encoded.encode("utf-8")),
+                created_at=now,
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+            ))
+            db.commit()
+            self._db_evict(db)
+
+    def _db_evict(self, db) -> None:
+        """Drop expired rows, then the oldest rows beyond max_rows."""
+        db.query(models.GenerationCacheEntry).filter(
+            models.GenerationCacheEntry.expires_at <= _utcnow()
+        ).delete(synchronize_session=False)
+        excess = db.query(models.GenerationCacheEntry).count() - self.max_rows
+        if excess > 0:
+            oldest_ids = [
+                row.id for row in db.query(models.GenerationCacheEntry.id)
+                .order_by(models.GenerationCacheEntry.created_at.asc(), models.GenerationCacheEntry.id.asc())
+                .limit(excess)
+            ]
+            db.query(models.GenerationCacheEntry).filter(
+                models.GenerationCacheEntry.id.in_(oldest_ids)
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    # Public API
+
+    def get(self, key: str) -> Optional[Any]:
+        encoded = self._memory_get(key)
+        if encoded is not None:
+            metrics.increment("generation_cache.hits.memory")
+            return json.loads(encoded)
+
+        entry = self._db_get(key)
+        if entry is None:
+            metrics.increment("generation_cache.misses")
+            return None
+
+        metrics.increment("generation_cache.hits.db")
+        remaining = (entry.expires_at - _utcnow()).total_seconds()
+        self._memory_put(key, entry.content_hash, entry.result, remaining)
+        return json.loads(entry.result)
+
+    def set(self, key: str, text_hash: str, task: str, value: Any) -> None:
+        encoded = json.dumps(value, ensure_ascii=False)
+        self._memory_put(key, text_hash, encoded, self.ttl_seconds)
+        try:
+            self._db_put(key, text_hash, task, encoded)
+        except Exception as e:
+            # The memory tier still serves this worker; don't fail the request
+            print(f"Error writing generation cache entry: {e}")
+
+    async def aget(self, key: str) -> Optional[Any]:
+        """Like get(), but runs the database lookup off the event loop."""
+        encoded = self._memory_get(key)
+        if encoded is not None:
+            metrics.increment("generation_cache.hits.memory")
+            return json.loads(encoded)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, text_hash: str, task: str, value: Any) -> None:
+        await asyncio.to_thread(self.set, key, text_hash, task, value)
+
+    def invalidate_content(self, text_hash: str) -> None:
+        """Remove every cached result generated from the given content."""
+        with self._lock:
+            for key in [k for k, entry in self._memory.items() if entry[0] == text_hash]:
+                self._memory_discard(key)
+        with SessionLocal() as db:
+            db.query(models.GenerationCacheEntry).filter(
+                models.GenerationCacheEntry.content_hash == text_hash
+            ).delete(synchronize_session=False)
+            db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"memory_entries": len(self._memory), "memory_bytes": self._memory_used}
+
+
+generation_cache = GenerationCache()
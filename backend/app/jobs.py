@@ -0,0 +1,261 @@
+"""
+Background Jobs for Professor AI Helper
+
+Long-running AI tasks are stored in the jobs table and processed by a pool
+of in-process async workers, so HTTP requests can return immediately with a
+job id. Because the queue lives in the database, queued jobs survive a
+restart, and jobs left running by a dead worker are picked up again once
+their heartbeat goes stale.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import os
+import random
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.rate_limit import current_user_id
+
+# Worker pool settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", 2))  # Jobs one user may have running at once
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 2))  # Seconds
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", 10))  # Seconds
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 60))  # Seconds without heartbeat before a running job is requeued
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", 5))  # Seconds, doubled per attempt
+
+# Directory for uploads that must outlive the request that received them
+JOB_UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "job_uploads"))
+
+
+def _utcnow() -> datetime:
+    # Naive UTC, so comparisons behave the same on SQLite and PostgreSQL
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobContext:
+    """What a handler sees of its job: the payload and a way to report progress."""
+
+    def __init__(self, job_id: int, user_id: int, payload: dict, attempt: int):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.payload = payload
+        self.attempt = attempt
+
+    async def set_progress(self, percent: int) -> None:
+        await asyncio.to_thread(_update_job, self.job_id, progress=max(0, min(100, int(percent))))
+
+
+JobHandler = Callable[[JobContext], Awaitable[Any]]
+_handlers: Dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    """Register an async function as the handler for a job kind.
+
+    The handler's return value must be JSON-serialisable and becomes the
+    job result. Raising marks the attempt as failed and schedules a retry
+    until max_attempts is reached.
+    """
+    def decorator(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue_job(db: Session, user_id: int, kind: str, payload: dict, temp_files: Optional[List[str]] = None) -> models.Job:
+    """
+    Create a queued job and wake the worker pool.
+
+    temp_files are deleted once the job reaches a final state, so uploads
+    can be handed to a job without leaking if it ultimately fails.
+    """
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+    job = models.Job(
+        user_id=user_id,
+        kind=kind,
+        status="queued",
+        payload=json.dumps({**payload, "temp_files": temp_files or []}),
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    worker_pool.notify()
+    return job
+
+
+def get_job(db: Session, job_id: int, user_id: int) -> Optional[models.Job]:
+    return db.query(models.Job).filter(models.Job.id == job_id, models.Job.user_id == user_id).first()
+
+
+def _update_job(job_id: int, **fields) -> None:
+    with SessionLocal() as db:
+        db.query(models.Job).filter(models.Job.id == job_id).update(fields, synchronize_session=False)
+        db.commit()
+
+
+def _requeue_stale_jobs(db: Session) -> None:
+    """Return running jobs whose worker stopped heartbeating to the queue."""
+    cutoff = _utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+    db.query(models.Job).filter(
+        models.Job.status == "running",
+        models.Job.heartbeat_at < cutoff,
+    ).update({"status": "queued"}, synchronize_session=False)
+    db.commit()
+
+
+def _claim_next_job() -> Optional[models.Job]:
+    """Atomically move the oldest eligible queued job to running and return it."""
+    with SessionLocal() as db:
+        _requeue_stale_jobs(db)
+        now = _utcnow()
+        running_per_user = dict(
+            db.query(models.Job.user_id, func.count(models.Job.id))
+            .filter(models.Job.status == "running")
+            .group_by(models.Job.user_id)
+            .all()
+        )
+        candidates = (
+            db.query(models.Job)
+            .filter(
+                models.Job.status == "queued",
+                (models.Job.run_after.is_(None)) | (models.Job.run_after <= now),
+            )
+            .order_by(models.Job.created_at.asc(), models.Job.id.asc())
+            .limit(50)
+            .all()
+        )
+        for job in candidates:
+            if running_per_user.get(job.user_id, 0) >= JOB_MAX_PER_USER:
+                continue
+            # Conditional update so two workers (or processes) can't both claim it
+            claimed = db.query(models.Job).filter(
+                models.Job.id == job.id, models.Job.status == "queued"
+            ).update({
+                "status": "running",
+                "attempts": models.Job.attempts + 1,
+                "started_at": now,
+                "heartbeat_at": now,
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                db.refresh(job)
+                db.expunge(job)
+                return job
+        return None
+
+
+def _remove_temp_files(payload: dict) -> None:
+    for path in payload.get("temp_files", []):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            print(f"Warning: Could not remove job file {path}: {e}")
+
+
+class JobWorkerPool:
+    """A fixed number of asyncio workers pulling jobs from the database."""
+
+    def __init__(self, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers; called when a job is enqueued, possibly from a worker thread."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(_claim_next_job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self._run(job)
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await asyncio.to_thread(_update_job, job_id, heartbeat_at=_utcnow())
+            except Exception as e:
+                # A missed beat is harmless; a dead heartbeat task would get the job requeued while it runs
+                print(f"Warning: Could not record heartbeat for job {job_id}: {e}")
+
+    async def _run(self, job: models.Job) -> None:
+        payload = json.loads(job.payload or "{}")
+        handler = _handlers.get(job.kind)
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            if handler is None:
+                raise RuntimeError(f"No handler registered for job kind '{job.kind}'")
+            if job.attempts > job.max_attempts:
+                # Requeued after stale heartbeats more often than it is allowed to retry
+                raise RuntimeError("Job was interrupted too many times")
+            current_user_id.set(job.user_id)
+            result = await handler(JobContext(job.id, job.user_id, payload, job.attempts))
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so the next start picks it up
+            await asyncio.to_thread(_update_job, job.id, status="queued", attempts=job.attempts - 1)
+            raise
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) attempt {job.attempts} failed: {e}")
+            if job.attempts < job.max_attempts:
+                delay = JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+                await asyncio.to_thread(
+                    _update_job, job.id,
+                    status="queued", error=str(e), run_after=_utcnow() + timedelta(seconds=delay),
+                )
+            else:
+                await asyncio.to_thread(
+                    _update_job, job.id, status="failed", error=str(e), finished_at=_utcnow(),
+                )
+                _remove_temp_files(payload)
+        else:
+            await asyncio.to_thread(
+                _update_job, job.id,
+                status="succeeded", result=json.dumps(result, ensure_ascii=False),
+                error=None, progress=100, finished_at=_utcnow(),
+            )
+            _remove_temp_files(payload)
+        finally:
+            heartbeat.cancel()
+
+
+worker_pool = JobWorkerPool()
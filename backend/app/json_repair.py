@@ -0,0 +1,139 @@
+"""
+JSON Repair for Professor AI Helper
+
+Best-effort local fix-ups for almost-JSON model output: code fences and
+prose around the value, trailing commas, single-quoted strings, Python
+literals (True/False/None) and output cut off before its closing brackets.
+Cheap enough to try before asking the model to fix its own output.
+"""
+from typing import Any, List, Optional
+import json
+
+from app.json_stream import extract_json
+
+_MISSING = object()
+
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _loads(text: str) -> Any:
+    try:
+        # strict=False accepts raw newlines inside strings, which models emit a lot
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        return _MISSING
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _drop_dangling_member(out: List[str]) -> None:
+    """Removes an unfinished trailing `"key":` or `,` left by truncated output."""
+    text = "".join(out).rstrip()
+    if text.endswith(":"):
+        # Cut back to the comma or brace before the key
+        cut = max(text.rfind(",", 0, len(text) - 1), text.rfind("{", 0, len(text) - 1))
+        text = text[:cut + 1] if text[cut] == "{" else text[:cut]
+    text = text.rstrip()
+    if text.endswith(","):
+        text = text[:-1]
+    out[:] = list(text)
+
+
+def _rewrite(text: str) -> str:
+    """Single pass turning almost-JSON into JSON, as far as that is possible locally."""
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return text
+    out: List[str] = []
+    stack: List[str] = []
+    quote = None  # Quote character of the string being copied
+    escaped = False
+    i = start
+    while i < len(text):
+        char = text[i]
+        if quote is not None:
+            if escaped:
+                escaped = False
+                # \' is not a valid JSON escape
+                out[-1:] = ["'"] if char == "'" else ["\\", char]
+            elif char == "\\":
+                escaped = True
+                out.append("\\")
+            elif char == quote:
+                quote = None
+                out.append('"')
+            elif char == '"':
+                out.append('\\"')  # A double quote inside a single-quoted string
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char in "\"'":
+            quote = char
+            out.append('"')
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            if char not in (_CLOSERS[c] for c in stack):
+                i += 1
+                continue  # Stray closer
+            _drop_trailing_comma(out)
+            # Close anything the model forgot before this closer
+            while _CLOSERS[stack[-1]] != char:
+                out.append(_CLOSERS[stack.pop()])
+            stack.pop()
+            out.append(char)
+            if not stack:
+                break  # Anything after the top-level value is prose
+        elif char.isalpha() or char == "_":
+            end = i
+            while end < len(text) and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[i:end]
+            out.append(_PYTHON_LITERALS.get(word, word))
+            i = end
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    if quote is not None:
+        out.append('"')
+    if stack:
+        _drop_dangling_member(out)
+        out.extend(_CLOSERS[c] for c in reversed(stack))
+    return "".join(out)
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Parses model output that should be JSON, repairing it locally if needed.
+    Returns None if the output can't be turned into valid JSON.
+    """
+    if not text:
+        return None
+    value = extract_json(text)
+    if value is not None:
+        return value
+    value = _loads(_rewrite(text))
+    return None if value is _MISSING else value
+
+
+def repair_prompt(broken: str, schema: dict, problem: str) -> str:
+    """Prompt asking the model to fix its own malformed output, without regenerating it."""
+    return f"""
+        Task: The JSON below is malformed or does not match the required schema. Fix it.
+        Problem: {problem}
+        Required JSON schema: {json.dumps(schema, ensure_ascii=False)}
+        JSON to fix:
+        {broken}
+        Output only the corrected JSON. Keep all existing content; do not add, remove or rewrite items.
+        """
@@ -0,0 +1,126 @@
+"""
+Incremental JSON Parsing for Professor AI Helper
+
+Model output arrives in chunks and is often wrapped in code fences or
+followed by prose. StreamingJsonParser scans it as it arrives, hands out
+each element of a chosen array (e.g. the quiz "questions") the moment its
+closing brace arrives, and returns the complete value once the top-level
+JSON closes.
+"""
+from typing import Any, List, Optional
+import json
+
+_MISSING = object()
+
+
+class StreamingJsonParser:
+    """
+    Character-level scanner over a stream of text containing one JSON value.
+
+    Anything before the first '{' or '[' (code fences, preambles) and
+    anything after the value closes (closing fences, trailing prose) is
+    ignored. item_key selects the array whose elements are emitted: the
+    value of that key in any object, or the top-level array if None.
+    """
+
+    def __init__(self, item_key: Optional[str] = "questions"):
+        self.item_key = item_key
+        self._data = ""
+        self._started = False
+        self._finished = False
+        self._root_start = 0
+        self._root_end = 0
+        # One frame per open container: [kind, key, expecting_key, item_start]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escaped = False
+        self._string_is_key = False
+        self._string_start = 0
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def _is_item_array(self) -> bool:
+        """True if the innermost open container is the array we emit items from."""
+        if not self._stack or self._stack[-1][0] != "[":
+            return False
+        if self.item_key is None:
+            return len(self._stack) == 1
+        return len(self._stack) >= 2 and self._stack[-2][0] == "{" and self._stack[-2][1] == self.item_key
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Consume a chunk and return the items completed in it."""
+        items: List[Any] = []
+        if self._finished or not chunk:
+            return items
+        offset = len(self._data)
+        self._data += chunk
+
+        for i, char in enumerate(chunk):
+            position = offset + i
+            if not self._started:
+                if char in "{[":
+                    self._started = True
+                    self._root_start = position
+                else:
+                    continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        frame = self._stack[-1]
+                        # A malformed key (e.g. a bad escape) matches no item_key; the caller's repair path recovers it
+                        key = self._parse(self._data[self._string_start:position + 1])
+                        frame[1] = None if key is _MISSING else key
+                        frame[2] = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+                self._string_is_key = bool(self._stack) and self._stack[-1][0] == "{" and self._stack[-1][2]
+            elif char in "{[":
+                item_start = position if char == "{" and self._is_item_array() else None
+                self._stack.append([char, None, char == "{", item_start])
+            elif char in "}]":
+                if not self._stack:
+                    continue
+                frame = self._stack.pop()
+                if frame[3] is not None:
+                    item = self._parse(self._data[frame[3]:position + 1])
+                    if item is not _MISSING:
+                        items.append(item)
+                if not self._stack:
+                    self._finished = True
+                    self._root_end = position + 1
+                    break
+            elif char == "," and self._stack and self._stack[-1][0] == "{":
+                self._stack[-1][2] = True
+        return items
+
+    @staticmethod
+    def _parse(text: str) -> Any:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return _MISSING
+
+    def result(self) -> Any:
+        """The complete top-level value, or None if it never closed or is invalid."""
+        if not self._finished:
+            return None
+        value = self._parse(self._data[self._root_start:self._root_end])
+        return None if value is _MISSING else value
+
+
+def extract_json(text: str) -> Any:
+    """First complete JSON object or array in text, ignoring fences and prose around it."""
+    parser = StreamingJsonParser(item_key=None)
+    parser.feed(text or "")
+    return parser.result()
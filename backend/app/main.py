@@ -1,21 +1,83 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Session
 from datetime import timedelta
 import os
 
 from app import models, schemas, security
+from app.auth import get_current_active_user
 from app.database import engine, get_db
+from app.metrics import metrics
+from app.generation_cache import generation_cache
+from app.semantic_cache import semantic_cache
+from app.jobs import worker_pool
+from app.chat_writer import chat_writer
+from app.extraction import extraction_pool
+from app.uploads import UploadSizeLimitMiddleware
+from app.ocr import ocr_pool
+from app.rate_limit import AIOverloadedError, admission
+from app.ai_services import teaching_assistant
 from app.routers.ai_router import router as ai_router
 from app.routers.auth_router import auth_router
 from app.routers.documents_router import router as documents_router
 from app.routers.classes_router import router as classes_router
+from app.routers.jobs_router import router as jobs_router
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
+# create_all doesn't add new columns to existing tables either; they are all nullable, so ADD COLUMN is enough
+_inspector = inspect(engine)
+for table in models.Base.metadata.sorted_tables:
+    existing_columns = {column["name"] for column in _inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing_columns:
+            with engine.begin() as connection:
+                connection.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                ))
+# Documents indexed twice before chunks were unique would block that index; drop
+# their retrieval index instead, chat rebuilds it on first use
+if "ix_document_chunks_document_chunk" not in {index["name"] for index in _inspector.get_indexes("document_chunks")}:
+    with engine.begin() as connection:
+        duplicated = (
+            "SELECT document_id FROM document_chunks GROUP BY document_id, chunk_index HAVING COUNT(*) > 1"
+        )
+        connection.execute(text(f"DELETE FROM chunk_terms WHERE document_id IN ({duplicated})"))
+        connection.execute(text(f"DELETE FROM document_chunks WHERE document_id IN ({duplicated})"))
+# create_all skips new indexes on tables that already exist
+for table in models.Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start background job workers; queued jobs from a previous run resume here
+    worker_pool.start()
+    chat_writer.start()
+    extraction_pool.start()
+    yield
+    await worker_pool.stop()
+    await chat_writer.stop()
+    extraction_pool.stop()
+    ocr_pool.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.exception_handler(AIOverloadedError)
+async def ai_overloaded_handler(request, exc: AIOverloadedError):
+    # Shed load cleanly; clients should wait Retry-After instead of hammering the API
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+# Refuse oversized uploads before Starlette spools them to disk
+app.add_middleware(UploadSizeLimitMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -40,10 +102,25 @@ api_v1_router.include_router(auth_router, tags=["Authentication"])
 api_v1_router.include_router(ai_router, tags=["AI Services"])
 api_v1_router.include_router(documents_router, tags=["Documents"])
 api_v1_router.include_router(classes_router, tags=["Classes"])
+api_v1_router.include_router(jobs_router, tags=["Jobs"])
 
 @api_v1_router.get("/health", tags=["Health"])
 async def health_check():
-    return {"status": "healthy"}
+    # Stays 200 while an AI breaker is open: the rest of the API still works,
+    # so load balancers should read each tier's "state" rather than pull the instance
+    ai = teaching_assistant.router.snapshot()
+    healthy = all(tier["state"] == "closed" for tier in ai.values())
+    return {"status": "healthy" if healthy else "degraded", "ai": ai}
+
+@api_v1_router.get("/metrics", tags=["Health"])
+async def get_metrics(current_user: models.User = Depends(get_current_active_user)):
+    # Cache and admission stats describe every user's traffic, so they aren't public like /health
+    return {
+        **metrics.snapshot(),
+        "generation_cache": generation_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "ai_admission": admission.stats(),
+    }
 
 # Include the versioned API router in the main app
 app.include_router(api_v1_router)
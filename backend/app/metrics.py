@@ -0,0 +1,47 @@
+"""
+Metrics for Professor AI Helper
+
+A small in-process registry of counters and timings, exposed through the
+/api/v1/metrics endpoint.
+"""
+from collections import defaultdict
+from typing import Dict
+import threading
+
+
+class Metrics:
+    """Thread-safe named counters and running timing summaries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        """Record one observation (e.g. a latency in seconds) under a name."""
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            timing["count"] += 1
+            timing["total"] += value
+            timing["max"] = max(timing["max"], value)
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timings": {
+                    name: {**timing, "avg": timing["total"] / timing["count"] if timing["count"] else 0.0}
+                    for name, timing in self._timings.items()
+                },
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,126 @@
+"""
+Model Routing for Professor AI Helper
+
+Calls are served by one of two model tiers: "fast" (cheap, low latency)
+and "strong" (better at long or demanding tasks, several times the
+price). The router picks a tier per call from the task's profile, the
+estimated prompt size and how each tier is currently doing, and lists the
+other tier as the fallback for timeouts and overload. Each tier has its
+own circuit breaker, so one struggling model doesn't take the other down.
+"""
+from typing import Dict, List, Optional
+import asyncio
+import os
+import time
+
+from app.ai_providers import DEFAULT_MODEL_NAME, ProviderError, ProviderRateLimitError
+from app.circuit_breaker import OPEN, CircuitBreaker
+from app.metrics import metrics
+
+FAST = "fast"
+STRONG = "strong"
+
+# Models behind each tier; when both name the same model there is no fallback
+AI_FAST_MODEL = os.getenv("AI_FAST_MODEL", DEFAULT_MODEL_NAME)
+AI_STRONG_MODEL = os.getenv("AI_STRONG_MODEL", "gemini-1.5-pro")
+
+# Routing policy
+AI_ROUTER_STRONG_MAX_PROMPT_TOKENS = int(os.getenv("AI_ROUTER_STRONG_MAX_PROMPT_TOKENS", 100000))  # Larger prompts stay on the fast tier (cost cap)
+AI_ROUTER_SLOW_FRACTION = float(os.getenv("AI_ROUTER_SLOW_FRACTION", 0.5))  # Reroute when a tier's recent latency exceeds this share of the deadline
+AI_ROUTER_PRIMARY_SHARE = float(os.getenv("AI_ROUTER_PRIMARY_SHARE", 0.7))  # Share of the deadline the first tier gets when a fallback exists
+
+_LATENCY_SMOOTHING = 0.2  # Weight of the newest call in the moving latency average
+_LATENCY_MAX_AGE = 60.0  # Seconds; older measurements are ignored so a rerouted tier gets retried
+
+
+class ModelRouter:
+    """Chooses a tier per call and tracks per-tier latency, tokens and health."""
+
+    def __init__(self, models: Optional[Dict[str, str]] = None):
+        self.models = models or {FAST: AI_FAST_MODEL, STRONG: AI_STRONG_MODEL}
+        self.breakers = {
+            tier: CircuitBreaker(
+                f"ai.breaker.{tier}",
+                # Upstream errors and timeouts trip the breaker; rate limits are handled by backoff instead
+                failure_exceptions=(ProviderError, asyncio.TimeoutError),
+                ignored_exceptions=(ProviderRateLimitError,),
+            )
+            for tier in self.models
+        }
+        self._latency: Dict[str, Optional[float]] = {tier: None for tier in self.models}
+        self._observed_at: Dict[str, float] = {tier: 0.0 for tier in self.models}
+
+    def model_for(self, tier: str) -> str:
+        return self.models[tier]
+
+    def _alternate(self, tier: str) -> Optional[str]:
+        for other, model in self.models.items():
+            if other != tier and model != self.models[tier]:
+                return other
+        return None
+
+    def _recent_latency(self, tier: str) -> Optional[float]:
+        if time.monotonic() - self._observed_at[tier] > _LATENCY_MAX_AGE:
+            return None
+        return self._latency[tier]
+
+    def _unhealthy(self, tier: str, timeout: float) -> bool:
+        latency = self._recent_latency(tier)
+        slow = latency is not None and latency > timeout * AI_ROUTER_SLOW_FRACTION
+        return slow or self.breakers[tier].state == OPEN
+
+    def route(self, preferred: str, prompt_tokens: int, timeout: float, escalate_above: Optional[int] = None) -> List[str]:
+        """
+        Tiers to try in order for one call: the chosen tier, then the
+        fallback if there is one.
+
+        Prompts of at least escalate_above tokens move up to the strong
+        tier, unless they exceed AI_ROUTER_STRONG_MAX_PROMPT_TOKENS. A tier
+        whose breaker is open, or whose recent latency would eat most of
+        the deadline, is swapped for the alternate while that one is healthy.
+        """
+        tier = preferred
+        if escalate_above is not None and prompt_tokens >= escalate_above and tier != STRONG:
+            tier = STRONG
+            metrics.increment("ai.router.escalated")
+        if tier == STRONG and prompt_tokens > AI_ROUTER_STRONG_MAX_PROMPT_TOKENS:
+            tier = FAST
+            metrics.increment("ai.router.cost_capped")
+
+        alternate = self._alternate(tier)
+        if alternate is None:
+            return [tier]
+        if self._unhealthy(tier, timeout) and not self._unhealthy(alternate, timeout):
+            metrics.increment("ai.router.rerouted")
+            tier, alternate = alternate, tier
+        return [tier, alternate]
+
+    def _update_latency(self, tier: str, latency: float) -> None:
+        previous = self._recent_latency(tier)
+        self._latency[tier] = latency if previous is None else previous + _LATENCY_SMOOTHING * (latency - previous)
+        self._observed_at[tier] = time.monotonic()
+
+    def observe(self, tier: str, latency: float, prompt_tokens: int, output_tokens: int) -> None:
+        """Record one completed call on a tier."""
+        self._update_latency(tier, latency)
+        metrics.increment(f"ai.tier.{tier}.calls")
+        metrics.observe(f"ai.tier.{tier}.latency_seconds", latency)
+        metrics.increment(f"ai.tier.{tier}.prompt_tokens", prompt_tokens)
+        metrics.increment(f"ai.tier.{tier}.output_tokens", output_tokens)
+
+    def observe_timeout(self, tier: str, elapsed: float) -> None:
+        """A call on tier gave up after elapsed seconds; the tier counts as at least that slow."""
+        self._update_latency(tier, elapsed)
+        self._latency[tier] = max(self._latency[tier], elapsed)
+        metrics.increment(f"ai.tier.{tier}.timeouts")
+
+    def snapshot(self) -> dict:
+        tiers = {}
+        for tier, model in self.models.items():
+            latency = self._recent_latency(tier)
+            tiers[tier] = {
+                "model": model,
+                "latency_seconds": round(latency, 3) if latency is not None else None,
+                **self.breakers[tier].snapshot(),
+            }
+        return tiers
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -14,6 +14,7 @@ class User(Base):
     documents = relationship("Document", back_populates="owner")
     chat_history = relationship("ChatHistory", back_populates="user")
     classes = relationship("Class", back_populates="owner")
+    jobs = relationship("Job", back_populates="user")
 
 class Document(Base):
     __tablename__ = "documents"
@@ -26,9 +27,97 @@ class Document(Base):
     file_size = Column(Integer, nullable=False, default=0)  # Size in bytes
     extracted_text_content = Column(Text, nullable=True)
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Content-addressed file this document references; NULL for files stored before deduplication
+    stored_file_id = Column(Integer, ForeignKey("stored_files.id"), nullable=True, index=True)
+    # Bumped whenever extracted_text_content is rewritten (e.g. by OCR), so caches can tell versions apart
+    text_revision = Column(Integer, nullable=True, default=0)
 
     owner = relationship("User", back_populates="documents")
     chat_history = relationship("ChatHistory", back_populates="document", cascade="all, delete-orphan")
+    chunks = relationship("DocumentChunk", back_populates="document", passive_deletes=True)
+
+class StoredFile(Base):
+    """An uploaded file stored once per content hash and shared by every document with that content."""
+    __tablename__ = "stored_files"
+
+    id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), nullable=False)
+    extension = Column(String, nullable=False)  # Part of the identity: extraction depends on it
+    file_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False, default=0)
+    extracted_text = Column(Text, nullable=True)  # NULL until the first extraction finishes
+    ref_count = Column(Integer, nullable=False, default=0)  # Documents referencing this file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_stored_files_sha256_extension", "sha256", "extension", unique=True),
+    )
+
+class DocumentPage(Base):
+    """Extracted text of one page of a stored file; formats without pages are stored as a single page."""
+    __tablename__ = "document_pages"
+
+    id = Column(Integer, primary_key=True)
+    stored_file_id = Column(Integer, ForeignKey("stored_files.id", ondelete="CASCADE"), nullable=False)
+    page_number = Column(Integer, nullable=False)  # 1-based
+    content = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_document_pages_file_page", "stored_file_id", "page_number", unique=True),
+    )
+
+class DocumentChunk(Base):
+    """An overlapping slice of a document's extracted text used for retrieval."""
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    content = Column(Text, nullable=False)
+    term_count = Column(Integer, nullable=False, default=0)  # Chunk length in terms, for BM25 normalisation
+
+    document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        # Makes indexing a document idempotent: a concurrent second index fails instead of doubling the chunks
+        Index("ix_document_chunks_document_chunk", "document_id", "chunk_index", unique=True),
+    )
+
+class ChunkTerm(Base):
+    """Inverted index entry: how often a term occurs in a chunk."""
+    __tablename__ = "chunk_terms"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    chunk_id = Column(Integer, ForeignKey("document_chunks.id", ondelete="CASCADE"), nullable=False)
+    term = Column(String, nullable=False)
+    frequency = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_chunk_terms_document_term", "document_id", "term"),
+    )
+
+class GenerationCacheEntry(Base):
+    """A cached AI generation result, keyed on content hash, task and parameters."""
+    __tablename__ = "generation_cache"
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String(64), unique=True, nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False, index=True)
+    task = Column(String, nullable=False)
+    result = Column(Text, nullable=False)  # JSON-encoded
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class OcrCacheEntry(Base):
+    """OCR output for a page image, keyed on the image hash and OCR languages."""
+    __tablename__ = "ocr_cache"
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String(64), unique=True, nullable=False, index=True)
+    text = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class ChatHistory(Base):
     __tablename__ = "chat_history"
@@ -43,6 +132,11 @@ class ChatHistory(Base):
     user = relationship("User", back_populates="chat_history")
     document = relationship("Document", back_populates="chat_history")
 
+    __table_args__ = (
+        # Serves the keyset-paginated history of one document's conversation
+        Index("ix_chat_history_user_document_time", "user_id", "document_id", "timestamp", "id"),
+    )
+
 
 class Class(Base):
     __tablename__ = "classes"
@@ -88,3 +182,26 @@ class Grade(Base):
 
     student = relationship("Student", back_populates="grades")
     assignment = relationship("Assignment", back_populates="grades")
+
+
+class Job(Base):
+    """A long-running AI task processed by the background worker pool."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    payload = Column(Text, nullable=False, default="{}")  # JSON-encoded handler input
+    result = Column(Text, nullable=True)  # JSON-encoded handler output
+    error = Column(Text, nullable=True)
+    progress = Column(Integer, nullable=False, default=0)  # Percent complete
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=True)  # Retry backoff
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    user = relationship("User", back_populates="jobs")
@@ -0,0 +1,85 @@
+"""
+OCR for Professor AI Helper
+
+Scanned PDFs have pages without a text layer, which extract as (nearly)
+empty text. After upload, only those pages are rasterized with PyMuPDF and
+read with tesseract, in a background job and a small process pool of
+their own, so the upload returns right away and the page text fills in
+later. OCR output is cached by the hash of the page image, so an
+identical scanned page is only read once.
+"""
+from typing import List, Optional
+import asyncio
+import hashlib
+import os
+import shutil
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import file_processing, models
+from app.database import SessionLocal
+from app.extraction import EXTRACTION_MEMORY_LIMIT_MB, ExtractionPool
+from app.metrics import metrics
+
+# OCR settings
+OCR_ENABLED = os.getenv("OCR_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_TESSERACT_CMD = os.getenv("OCR_TESSERACT_CMD", "tesseract")
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "eng")  # tesseract -l value, e.g. "eng+rus"; each needs its language pack
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 2))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", 120))  # Seconds per page
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 16))  # Pages with less extracted text are OCR'd
+
+# Separate from the extraction pool, so slow OCR never delays text extraction of new uploads.
+# Its deadline leaves tesseract's own timeout room to fire first.
+ocr_pool = ExtractionPool(workers=OCR_WORKERS, timeout=OCR_TIMEOUT + 30, memory_limit_mb=EXTRACTION_MEMORY_LIMIT_MB)
+
+
+def ocr_available() -> bool:
+    return OCR_ENABLED and shutil.which(OCR_TESSERACT_CMD) is not None
+
+
+def pages_needing_ocr(db: Session, stored_file_id: int) -> List[int]:
+    """Numbers of the stored file's pages whose extracted text is (nearly) empty."""
+    rows = db.query(models.DocumentPage.page_number).filter(
+        models.DocumentPage.stored_file_id == stored_file_id,
+        func.length(func.trim(models.DocumentPage.content)) < OCR_MIN_TEXT_CHARS,
+    ).order_by(models.DocumentPage.page_number.asc()).all()
+    return [number for (number,) in rows]
+
+
+def _cache_key(image: bytes) -> str:
+    return hashlib.sha256(image + f"|{OCR_LANGUAGES}".encode("utf-8")).hexdigest()
+
+
+def _cached_text(cache_key: str) -> Optional[str]:
+    with SessionLocal() as db:
+        entry = db.query(models.OcrCacheEntry.text).filter(models.OcrCacheEntry.cache_key == cache_key).first()
+        return entry[0] if entry else None
+
+
+def _cache_text(cache_key: str, text: str) -> None:
+    with SessionLocal() as db:
+        db.add(models.OcrCacheEntry(cache_key=cache_key, text=text))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()  # Same image read concurrently
+
+
+async def ocr_page(file_path: str, page_number: int) -> str:
+    """Text of one page (1-based) of a PDF read by OCR, from the cache when the page image was read before."""
+    image = await ocr_pool.run(file_processing.render_pdf_page, file_path, page_number - 1, OCR_DPI)
+    if not image:
+        return ""
+    cache_key = _cache_key(image)
+    cached = await asyncio.to_thread(_cached_text, cache_key)
+    if cached is not None:
+        metrics.increment("ocr.cache_hits")
+        return cached
+    text = await ocr_pool.run(file_processing.ocr_image, image, OCR_LANGUAGES, OCR_TIMEOUT, OCR_TESSERACT_CMD)
+    metrics.increment("ocr.pages")
+    await asyncio.to_thread(_cache_text, cache_key, text)
+    return text
@@ -0,0 +1,188 @@
+"""
+AI Admission Control for Professor AI Helper
+
+Every upstream model call is admitted through token buckets sized in
+requests and estimated tokens, both globally and per user. Callers that
+would have to wait longer than AI_ADMISSION_MAX_WAIT are shed with
+AIOverloadedError (served as HTTP 503) instead of queueing indefinitely.
+When the provider answers 429 the whole worker backs off from that
+upstream for the retry-after period, so clients retrying immediately
+don't make it worse. Calls one request fans out into (see fan_out) are
+never shed: they wait their turn within the request's own deadline.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+import asyncio
+import os
+import random
+import time
+
+from app.metrics import metrics
+
+# Global limits (per worker process); 0 disables a bucket
+AI_RATE_LIMIT_RPM = float(os.getenv("AI_RATE_LIMIT_RPM", 60))  # Requests per minute
+AI_RATE_LIMIT_TPM = float(os.getenv("AI_RATE_LIMIT_TPM", 1000000))  # Estimated tokens per minute
+# Per-user limits
+AI_USER_RATE_LIMIT_RPM = float(os.getenv("AI_USER_RATE_LIMIT_RPM", 20))
+AI_USER_RATE_LIMIT_TPM = float(os.getenv("AI_USER_RATE_LIMIT_TPM", 250000))
+# Queueing and backoff
+AI_ADMISSION_MAX_WAIT = float(os.getenv("AI_ADMISSION_MAX_WAIT", 10))  # Seconds a call may wait for capacity
+AI_ADMISSION_MAX_QUEUE = int(os.getenv("AI_ADMISSION_MAX_QUEUE", 100))  # Calls waiting for capacity at once
+AI_RATE_LIMIT_MAX_RETRIES = int(os.getenv("AI_RATE_LIMIT_MAX_RETRIES", 3))  # Retries after an upstream 429
+AI_BACKOFF_BASE_DELAY = float(os.getenv("AI_BACKOFF_BASE_DELAY", 1))  # Seconds, doubled per retry
+AI_BACKOFF_MAX_DELAY = float(os.getenv("AI_BACKOFF_MAX_DELAY", 30))
+
+# User the current request or job is running for; charged against the per-user buckets
+current_user_id: ContextVar[Optional[int]] = ContextVar("current_user_id", default=None)
+# Set while one request fans out into many model calls (map-reduce summaries,
+# quiz batches); those calls queue for capacity instead of being shed
+internal_fan_out: ContextVar[bool] = ContextVar("internal_fan_out", default=False)
+
+_MAX_TRACKED_USERS = 10000
+
+
+class AIOverloadedError(Exception):
+    """The AI service cannot take the call right now; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at rate_per_minute.
+
+    Reservations may drive the level negative; the deficit is the time the
+    reserving caller has to wait, which keeps admission FIFO-fair without a
+    separate queue per bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount could be taken, without taking it."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        # A single request larger than the bucket is admitted once the bucket is full
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self._level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.rate > 0:
+            self._level -= min(amount, self.capacity)
+
+
+class AdmissionController:
+    """Global and per-user request/token buckets with a bounded wait queue."""
+
+    def __init__(
+        self,
+        rpm: float = AI_RATE_LIMIT_RPM,
+        tpm: float = AI_RATE_LIMIT_TPM,
+        user_rpm: float = AI_USER_RATE_LIMIT_RPM,
+        user_tpm: float = AI_USER_RATE_LIMIT_TPM,
+        max_wait: float = AI_ADMISSION_MAX_WAIT,
+        max_queue: int = AI_ADMISSION_MAX_QUEUE,
+    ):
+        self.user_rpm = user_rpm
+        self.user_tpm = user_tpm
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._users: "OrderedDict[int, Tuple[TokenBucket, TokenBucket]]" = OrderedDict()
+        # Per upstream (e.g. model), after it reported a rate limit
+        self._cooldown_until: Dict[Optional[str], float] = {}
+        self._waiting = 0
+
+    def _user_buckets(self, user_id: int) -> Tuple[TokenBucket, TokenBucket]:
+        buckets = self._users.get(user_id)
+        if buckets is None:
+            buckets = (TokenBucket(self.user_rpm), TokenBucket(self.user_tpm))
+            self._users[user_id] = buckets
+            if len(self._users) > _MAX_TRACKED_USERS:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return buckets
+
+    async def admit(self, estimated_tokens: int, user_id: Optional[int] = None, upstream: Optional[str] = None) -> None:
+        """
+        Wait until the call fits in every bucket and upstream is out of its
+        cooldown, or raise AIOverloadedError if that would take longer than
+        max_wait or too many calls are queued. Calls made under fan_out()
+        always wait; the caller's deadline bounds them instead.
+        """
+        now = time.monotonic()
+        buckets = [(self._requests, 1), (self._tokens, estimated_tokens)]
+        if user_id is not None:
+            user_requests, user_tokens = self._user_buckets(user_id)
+            buckets += [(user_requests, 1), (user_tokens, estimated_tokens)]
+
+        cooldown = max(self._cooldown_until.get(None, 0.0), self._cooldown_until.get(upstream, 0.0)) - now
+        wait = max(cooldown, *(bucket.wait_time(amount, now) for bucket, amount in buckets))
+        if not internal_fan_out.get():
+            if wait > self.max_wait:
+                metrics.increment("ai.admission.shed")
+                raise AIOverloadedError("AI service is at capacity, please retry later", retry_after=wait)
+            if wait > 0 and self._waiting >= self.max_queue:
+                metrics.increment("ai.admission.shed")
+                raise AIOverloadedError("Too many AI requests are queued, please retry later", retry_after=wait)
+
+        # Reserve before sleeping so later callers queue behind this one
+        for bucket, amount in buckets:
+            bucket.take(amount)
+        metrics.increment("ai.admission.admitted")
+        if wait > 0:
+            metrics.observe("ai.admission.wait_seconds", wait)
+            self._waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waiting -= 1
+
+    def penalize(self, retry_after: float, upstream: Optional[str] = None) -> None:
+        """Pause admission to upstream (all upstreams if None) after it reported a rate limit."""
+        until = time.monotonic() + retry_after
+        self._cooldown_until[upstream] = max(self._cooldown_until.get(upstream, 0.0), until)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "waiting": self._waiting,
+            "cooldown_seconds": max(0.0, round(max(self._cooldown_until.values(), default=now) - now, 3)),
+        }
+
+
+@contextmanager
+def fan_out():
+    """Marks the model calls made inside the block as internal fan-out of one request."""
+    token = internal_fan_out.set(True)
+    try:
+        yield
+    finally:
+        internal_fan_out.reset(token)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Jittered exponential delay before retry number attempt (1-based)."""
+    delay = min(AI_BACKOFF_MAX_DELAY, AI_BACKOFF_BASE_DELAY * 2 ** (attempt - 1))
+    delay *= random.uniform(0.5, 1.5)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+admission = AdmissionController()
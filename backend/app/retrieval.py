@@ -0,0 +1,212 @@
+"""
+Document Retrieval for Professor AI Helper
+
+This module splits extracted document text into overlapping chunks, stores
+them with an inverted index in the database, and ranks chunks against a
+query with BM25 so chat prompts only carry the relevant passages.
+"""
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+import math
+import os
+import re
+
+from sqlalchemy import and_, func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from app import models
+
+# Chunking and ranking settings
+CHUNK_SIZE = int(os.getenv("RETRIEVAL_CHUNK_SIZE", 1500))  # Characters
+CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", 200))  # Characters
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 6))
+# Documents shorter than this are sent whole; retrieval only pays off for long texts
+RETRIEVAL_MIN_DOCUMENT_LENGTH = int(os.getenv("RETRIEVAL_MIN_DOCUMENT_LENGTH", 12000))  # Characters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, ignoring single characters."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def split_into_chunks(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into overlapping chunks, breaking on whitespace where possible."""
+    chunks = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_size, length)
+        if end < length:
+            # Prefer to end on a line or word boundary in the second half of the window
+            boundary = max(text.rfind("\n", start + chunk_size // 2, end), text.rfind(" ", start + chunk_size // 2, end))
+            if boundary > start:
+                end = boundary
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= length:
+            break
+        next_start = max(end - overlap, start + 1)
+        # Don't start the next chunk in the middle of a word
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+def _chunk_count(db: Session, document_id: int) -> int:
+    return db.query(func.count(models.DocumentChunk.id)).filter(models.DocumentChunk.document_id == document_id).scalar()
+
+
+def index_document(db: Session, document_id: int, text: str, stored_file_id: Optional[int] = None) -> int:
+    """
+    Chunk a document and write its chunks and inverted index, unless it is
+    already indexed. Returns the chunk count.
+
+    If another document with the same stored file is already indexed, its
+    index is copied instead of chunking and tokenizing the text again.
+    Safe to run concurrently for the same document (e.g. the upload and a
+    lazy index from chat): chunks are unique per (document, index), so the
+    slower writer fails, rolls back and keeps the other one's index.
+    """
+    existing = _chunk_count(db, document_id)
+    if existing:
+        return existing
+
+    source_id = None
+    if stored_file_id is not None:
+        source_id = (
+            db.query(models.DocumentChunk.document_id)
+            .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+            .filter(models.Document.stored_file_id == stored_file_id, models.Document.id != document_id)
+            .limit(1)
+            .scalar()
+        )
+    try:
+        if source_id is not None:
+            _copy_index(db, source_id, document_id)
+        else:
+            _write_index(db, document_id, text)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    return _chunk_count(db, document_id)
+
+
+def _write_index(db: Session, document_id: int, text: str) -> None:
+    chunks = [(content, Counter(tokenize(content))) for content in split_into_chunks(text or "")]
+    if not chunks:
+        return
+    db.execute(
+        insert(models.DocumentChunk),
+        [
+            {"document_id": document_id, "chunk_index": chunk_index, "content": content, "term_count": sum(terms.values())}
+            for chunk_index, (content, terms) in enumerate(chunks)
+        ],
+    )
+    chunk_ids = dict(
+        db.query(models.DocumentChunk.chunk_index, models.DocumentChunk.id)
+        .filter(models.DocumentChunk.document_id == document_id)
+        .all()
+    )
+    postings = [
+        {"document_id": document_id, "chunk_id": chunk_ids[chunk_index], "term": term, "frequency": frequency}
+        for chunk_index, (_, terms) in enumerate(chunks)
+        for term, frequency in terms.items()
+    ]
+    if postings:
+        db.execute(insert(models.ChunkTerm), postings)
+
+
+def _copy_index(db: Session, source_id: int, target_id: int) -> None:
+    """Copy one document's chunks and inverted index to another with the same text."""
+    chunk = models.DocumentChunk
+    db.execute(insert(chunk).from_select(
+        ["document_id", "chunk_index", "content", "term_count"],
+        select(literal(target_id), chunk.chunk_index, chunk.content, chunk.term_count).where(chunk.document_id == source_id),
+    ))
+    source_chunk, target_chunk = aliased(models.DocumentChunk), aliased(models.DocumentChunk)
+    db.execute(insert(models.ChunkTerm).from_select(
+        ["document_id", "chunk_id", "term", "frequency"],
+        select(literal(target_id), target_chunk.id, models.ChunkTerm.term, models.ChunkTerm.frequency)
+        .join(source_chunk, models.ChunkTerm.chunk_id == source_chunk.id)
+        .join(target_chunk, and_(target_chunk.document_id == target_id, target_chunk.chunk_index == source_chunk.chunk_index))
+        .where(models.ChunkTerm.document_id == source_id),
+    ))
+
+
+def drop_document_index(db: Session, document_id: int) -> None:
+    """Delete a document's chunks and inverted index, e.g. before re-indexing changed text."""
+    db.query(models.ChunkTerm).filter(models.ChunkTerm.document_id == document_id).delete(synchronize_session=False)
+    db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id == document_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def search_chunks(db: Session, document_id: int, query: str, top_k: int = RETRIEVAL_TOP_K) -> List[models.DocumentChunk]:
+    """
+    Return the top-k chunks of a document for the query, in document order.
+
+    Falls back to the opening chunks when no query term occurs in the document.
+    """
+    chunk_count, avg_length = db.query(
+        func.count(models.DocumentChunk.id), func.avg(models.DocumentChunk.term_count)
+    ).filter(models.DocumentChunk.document_id == document_id).one()
+    if not chunk_count:
+        return []
+
+    query_terms = set(tokenize(query))
+    postings = []
+    if query_terms:
+        postings = db.query(
+            models.ChunkTerm.chunk_id, models.ChunkTerm.term, models.ChunkTerm.frequency
+        ).filter(
+            models.ChunkTerm.document_id == document_id,
+            models.ChunkTerm.term.in_(query_terms),
+        ).all()
+
+    if postings:
+        chunk_lengths = dict(
+            db.query(models.DocumentChunk.id, models.DocumentChunk.term_count)
+            .filter(models.DocumentChunk.id.in_({chunk_id for chunk_id, _, _ in postings}))
+            .all()
+        )
+        document_frequency = Counter(term for _, term, _ in postings)
+        avg_length = float(avg_length or 1)
+        scores: Dict[int, float] = defaultdict(float)
+        for chunk_id, term, frequency in postings:
+            idf = math.log(1 + (chunk_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk_lengths[chunk_id] / avg_length)
+            scores[chunk_id] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        best_ids = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        query_filter = models.DocumentChunk.id.in_(best_ids)
+    else:
+        query_filter = models.DocumentChunk.chunk_index < top_k
+
+    return (
+        db.query(models.DocumentChunk)
+        .filter(models.DocumentChunk.document_id == document_id, query_filter)
+        .order_by(models.DocumentChunk.chunk_index)
+        .all()
+    )
+
+
+def build_document_context(db: Session, document_id: int, document_text: str, query: str, history: List[Dict] = None) -> str:
+    """
+    Return the document context for a chat turn.
+
+    Short documents are returned whole. Longer ones are reduced to the
+    passages that best match the question and the recent user turns; the
+    index is built on first use for documents uploaded before it existed.
+    """
+    if len(document_text) <= RETRIEVAL_MIN_DOCUMENT_LENGTH:
+        return document_text
+
+    index_document(db, document_id, document_text)
+
+    recent_questions = [h.get("content", "") for h in (history or [])[-4:] if h.get("role") == "user"]
+    chunks = search_chunks(db, document_id, " ".join([query, *recent_questions]))
+    return "\n\n[...]\n\n".join(chunk.content for chunk in chunks)
@@ -3,48 +3,167 @@ AI Router for Professor AI Helper
 
 This module provides API endpoints for AI-powered teaching assistant features.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from contextlib import aclosing
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import logging
 import json
+import os
+import time
 
 from app.models import User
 from app.database import get_db
+from app import crud, schemas
+from app.chat_writer import chat_writer
+from app.jobs import JobContext, enqueue_job, job_handler
+from app.routers.jobs_router import job_accepted
 from app.auth import get_current_active_user
-from app.ai_services import teaching_assistant
+from app.ai_services import _is_error_result, teaching_assistant
+from app.rate_limit import AIOverloadedError, current_user_id, fan_out
+from app.document_cache import get_document_content, get_document_text
+from app.retrieval import build_document_context
 from app.schemas_ai import (
-    ChatRequest, ChatResponse, DocumentRequest
+    ChatRequest, ChatResponse, DocumentRequest, QuizBatchItem, QuizBatchRequest, QuizRequest, SummaryRequest
 )
 
+# Stored turns loaded as context when the client doesn't send its history
+CHAT_STORED_HISTORY_TURNS = 200
+# Quizzes of one batch request generated at the same time
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", 4))
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+async def bind_ai_user(current_user: User = Depends(get_current_active_user)):
+    """Charges this request's model calls to the user's rate limit buckets."""
+    current_user_id.set(current_user.id)
+
 router = APIRouter(
     prefix="/ai",
     tags=["AI Services"],
-    responses={404: {"description": "Not found"}},
+    dependencies=[Depends(bind_ai_user)],
+    responses={404: {"description": "Not found"}, 503: {"description": "AI service overloaded"}},
 )
 
+def _resolve_history(request: ChatRequest, db: Session, current_user: User) -> Tuple[List[Dict], int, Optional[str]]:
+    """
+    Returns the conversation so far: the client's history if it sent one,
+    otherwise the newest turns stored for the document (including turns
+    still waiting to be written). Also returns the number of earlier
+    messages left out and a key identifying the stored conversation, which
+    keep its history summaries stable as the loaded window moves.
+    """
+    if request.history is not None or request.document_id is None:
+        return request.history or [], 0, None
+
+    turns = crud.get_chat_history_page(
+        db, document_id=request.document_id, user_id=current_user.id, limit=CHAT_STORED_HISTORY_TURNS
+    )
+    stored_count, first_turn_id = crud.get_chat_history_extent(db, document_id=request.document_id, user_id=current_user.id)
+    history_offset = 2 * max(stored_count - len(turns), 0)
+    # The first turn's id changes if the conversation is cleared and started over
+    conversation_key = f"{current_user.id}:{request.document_id}:{first_turn_id}"
+    turns = [{"user_query": t.user_query, "ai_response": t.ai_response} for t in reversed(turns)]
+    turns += chat_writer.pending_turns(current_user.id, request.document_id)
+    history = []
+    for turn in turns:
+        history.append({"role": "user", "content": turn["user_query"]})
+        history.append({"role": "assistant", "content": turn["ai_response"]})
+    return history, history_offset, conversation_key
+
+def _resolve_document_text(
+    request: ChatRequest, history: List[Dict], db: Session, current_user: User
+) -> Tuple[str, Optional[str]]:
+    """
+    Returns the chat context, loading it server-side when a document_id is
+    given, and the document's content version (None for inline text).
+
+    Long documents are narrowed to the passages most relevant to the query.
+    """
+    if request.document_id is None:
+        return request.document_text or "", None
+
+    content = get_document_content(db, document_id=request.document_id, user_id=current_user.id)
+    if content is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+    document_text, version = content
+    return build_document_context(db, request.document_id, document_text, request.query, history), version
+
+# Non-standard status (as used by nginx) for requests the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+class ClientDisconnected(Exception):
+    """The HTTP client went away before the AI result was ready."""
+
+async def _wait_for_disconnect(http_request: Request) -> None:
+    # The body has already been read, so the next message is the disconnect
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+async def _cancel_on_disconnect(http_request: Request, coro):
+    """
+    Awaits coro, cancelling it (and the model call behind it) if the client
+    disconnects first. Raises ClientDisconnected in that case.
+    """
+    work = asyncio.ensure_future(coro)
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect.cancel()
+        if not work.done():
+            work.cancel()
+    if not work.done() or work.cancelled():
+        try:
+            await work
+        except asyncio.CancelledError:
+            pass
+        raise ClientDisconnected()
+    return work.result()
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_ai(
     request: ChatRequest,
-    current_user: User = Depends(get_current_active_user)
+    http_request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
 ):
     """
     Handles chat interactions, using document context if provided.
     """
+    history, history_offset, conversation_key = _resolve_history(request, db, current_user)
+    # Loading and ranking a long document's passages is blocking database work
+    document_text, document_version = await asyncio.to_thread(_resolve_document_text, request, history, db, current_user)
     try:
         logger.info(f"Processing chat request for user {current_user.id}")
         
-        response_text = teaching_assistant.analyze_document_chat(
-            document_text=request.document_text or "",
+        response_text = await _cancel_on_disconnect(http_request, teaching_assistant.analyze_document_chat(
+            document_text=document_text,
             query=request.query,
-            chat_history=request.history or []
-        )
+            chat_history=history,
+            history_offset=history_offset,
+            conversation_key=conversation_key,
+            cache_document_id=request.document_id,
+            cache_document_version=document_version,
+            use_cache=request.use_cache
+        ))
         
+        if request.document_id is not None:
+            chat_writer.submit(current_user.id, request.document_id, request.query, response_text)
         return ChatResponse(message=response_text)
         
+    except ClientDisconnected:
+        logger.info(f"Chat request for user {current_user.id} cancelled, client disconnected")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except AIOverloadedError:
+        raise
     except Exception as e:
         logger.exception("Error in chat_with_ai endpoint")
         raise HTTPException(
@@ -52,21 +171,291 @@ async def chat_with_ai(
             detail=f"Error processing chat request: {str(e)}"
         )
 
-@router.post("/generate-report", response_model=dict)
+def _sse_event(data: dict, event: str = None) -> str:
+    """Formats a payload as a single Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_with_ai_stream(
+    request: ChatRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Streams the chat answer as Server-Sent Events while the model generates it.
+
+    Each chunk is sent as a default ``message`` event with ``{"text": ...}``.
+    The stream ends with a ``done`` event carrying response metadata, or an
+    ``error`` event if generation fails part-way.
+    """
+    history, history_offset, conversation_key = _resolve_history(request, db, current_user)
+    # Loading and ranking a long document's passages is blocking database work
+    document_text, document_version = await asyncio.to_thread(_resolve_document_text, request, history, db, current_user)
+    logger.info(f"Processing streaming chat request for user {current_user.id}")
+
+    async def event_stream():
+        started = time.monotonic()
+        first_chunk_at = None
+        chunk_count = 0
+        parts = []
+        # Filled in by the service: the model that actually served the answer
+        stream_info = {}
+        try:
+            # Starlette cancels this generator when the client disconnects;
+            # aclosing makes sure the model stream is closed right away too
+            async with aclosing(teaching_assistant.stream_document_chat(
+                document_text=document_text,
+                query=request.query,
+                chat_history=history,
+                history_offset=history_offset,
+                conversation_key=conversation_key,
+                cache_document_id=request.document_id,
+                cache_document_version=document_version,
+                use_cache=request.use_cache,
+                stream_info=stream_info
+            )) as chunks:
+                async for text in chunks:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.monotonic()
+                    chunk_count += 1
+                    parts.append(text)
+                    yield _sse_event({"text": text})
+        except AIOverloadedError as e:
+            yield _sse_event({"detail": str(e), "retry_after": round(e.retry_after, 1)}, event="error")
+            return
+        except Exception as e:
+            logger.exception("Error in chat_with_ai_stream endpoint")
+            yield _sse_event({"detail": f"Error processing chat request: {str(e)}"}, event="error")
+            return
+
+        response_text = "".join(parts)
+        if request.document_id is not None:
+            chat_writer.submit(current_user.id, request.document_id, request.query, response_text)
+        yield _sse_event({
+            "model": stream_info.get("model"),
+            "cached": stream_info.get("cached", False),
+            "chunks": chunk_count,
+            "characters": len(response_text),
+            "time_to_first_chunk_ms": round((first_chunk_at - started) * 1000) if first_chunk_at else None,
+            "total_time_ms": round((time.monotonic() - started) * 1000),
+        }, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/quiz/stream")
+async def generate_quiz_stream(
+    request: QuizRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Generates a quiz and streams it as Server-Sent Events, one ``question``
+    event per question as soon as the model has finished writing it.
+
+    The stream ends with a ``done`` event carrying the quiz title,
+    description and timings, or an ``error`` event.
+    """
+    document_text = get_document_text(db, document_id=request.document_id, user_id=current_user.id)
+    if document_text is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+    if not document_text.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Document has no extracted text to build a quiz from"
+        )
+    logger.info(f"Streaming quiz for document {request.document_id} for user {current_user.id}")
+
+    async def event_stream():
+        started = time.monotonic()
+        first_question_at = None
+        count = 0
+        try:
+            async with aclosing(teaching_assistant.stream_quiz(
+                document_text, request.question_count, request.difficulty, request.question_type
+            )) as events:
+                async for event in events:
+                    if "question" in event:
+                        if first_question_at is None:
+                            first_question_at = time.monotonic()
+                        yield _sse_event({"index": count, "question": event["question"]}, event="question")
+                        count += 1
+                    else:
+                        quiz = event["quiz"]
+        except AIOverloadedError as e:
+            yield _sse_event({"detail": str(e), "retry_after": round(e.retry_after, 1)}, event="error")
+            return
+        except Exception as e:
+            logger.exception("Error in generate_quiz_stream endpoint")
+            yield _sse_event({"detail": f"Error generating quiz: {str(e)}"}, event="error")
+            return
+
+        yield _sse_event({
+            "title": quiz.get("title"),
+            "description": quiz.get("description"),
+            "question_count": count,
+            "time_to_first_question_ms": round((first_question_at - started) * 1000) if first_question_at else None,
+            "total_time_ms": round((time.monotonic() - started) * 1000),
+        }, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/quizzes/batch")
+async def generate_quiz_batch(
+    request: QuizBatchRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Generates quizzes for several documents in parallel and streams each
+    result as Server-Sent Events as soon as it is ready.
+
+    Every item produces one ``result`` event with its ``index`` in the
+    request, ``document_id`` and either ``quiz`` or ``detail`` (status
+    "ok" or "error"), in completion order. A final ``done`` event carries
+    the counts and total time. At most QUIZ_BATCH_CONCURRENCY quizzes are
+    generated at once; repeated documents are served from the cache.
+    """
+    # Load texts up front, while the request's database session is open
+    texts = {
+        document_id: get_document_text(db, document_id=document_id, user_id=current_user.id)
+        for document_id in {item.document_id for item in request.items}
+    }
+    logger.info(f"Generating {len(request.items)} quizzes for user {current_user.id}")
+    limiter = asyncio.Semaphore(QUIZ_BATCH_CONCURRENCY)
+
+    async def generate(index: int, item: QuizBatchItem) -> dict:
+        result = {"index": index, "document_id": item.document_id}
+        document_text = texts[item.document_id]
+        if document_text is None:
+            return {**result, "status": "error", "detail": "Document not found or access denied"}
+        if not document_text.strip():
+            return {**result, "status": "error", "detail": "Document has no extracted text"}
+        try:
+            # Items queue for the user's budget rather than being shed one by one
+            async with limiter:
+                with fan_out():
+                    quiz = await teaching_assistant.generate_quiz(
+                        document_text, item.question_count, item.difficulty, item.question_type
+                    )
+        except Exception as e:
+            logger.warning(f"Quiz for document {item.document_id} failed: {e}")
+            return {**result, "status": "error", "detail": str(e)}
+        if "error" in quiz:
+            return {**result, "status": "error", "detail": quiz["error"]}
+        return {**result, "status": "ok", "quiz": quiz}
+
+    async def event_stream():
+        started = time.monotonic()
+        tasks = [asyncio.ensure_future(generate(i, item)) for i, item in enumerate(request.items)]
+        succeeded = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                succeeded += result["status"] == "ok"
+                yield _sse_event(result, event="result")
+        finally:
+            # Client disconnected: stop the quizzes still being generated
+            for task in tasks:
+                task.cancel()
+
+        yield _sse_event({
+            "total": len(tasks),
+            "succeeded": succeeded,
+            "failed": len(tasks) - succeeded,
+            "total_time_ms": round((time.monotonic() - started) * 1000),
+        }, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/summarize", response_model=dict)
+async def summarize_document(
+    request: SummaryRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Summarizes an uploaded document. Long documents are summarized section
+    by section, and results are cached per content and parameters.
+    """
+    document_text = get_document_text(db, document_id=request.document_id, user_id=current_user.id)
+    if document_text is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+    if not document_text.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Document has no extracted text to summarize"
+        )
+
+    try:
+        logger.info(f"Summarizing document {request.document_id} for user {current_user.id}")
+        summary = await _cancel_on_disconnect(http_request, teaching_assistant.summarize_document(
+            document_text, summary_type=request.summary_type, length=request.length
+        ))
+    except ClientDisconnected:
+        logger.info(f"Summary for user {current_user.id} cancelled, client disconnected")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except AIOverloadedError:
+        raise
+    except Exception as e:
+        logger.exception("Error in summarize_document endpoint")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error summarizing document: {str(e)}"
+        )
+
+    if "error" in summary:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error summarizing document: {summary['error']}"
+        )
+    return summary
+
+@router.post("/generate-report", response_model=schemas.JobAccepted, status_code=status.HTTP_202_ACCEPTED)
 async def generate_report_from_data(
     request: DocumentRequest, # Using a generic request for simplicity
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
 ):
     """
-    Generates a detailed class report from a string of class data.
+    Queues a detailed class report from a string of class data.
+    Poll GET /jobs/{job_id} for the report.
     """
     try:
-        logger.info(f"Generating class report for user {current_user.id}")
-        report = teaching_assistant.generate_class_report(request.text)
-        return {"report": report}
+        logger.info(f"Queueing class report for user {current_user.id}")
+        job = enqueue_job(db, user_id=current_user.id, kind="class_report", payload={"text": request.text})
+        return job_accepted(job)
     except Exception as e:
         logger.exception("Error in generate_report_from_data endpoint")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error generating report: {str(e)}"
         )
+
+@job_handler("class_report")
+async def run_class_report_job(job: JobContext) -> dict:
+    """Background half of generate_report_from_data."""
+    report = await teaching_assistant.generate_class_report(job.payload["text"])
+    if _is_error_result(report):
+        # Raising lets the worker pool retry with backoff, then mark the job failed
+        raise RuntimeError(f"Class report generation failed: {report}")
+    return {"report": report}
@@ -6,12 +6,16 @@ Handles class management operations.
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List
+import asyncio
 import os
-import uuid
 
-from app.database import get_db
+from app.database import get_db, SessionLocal
 from app import models, schemas, crud
 from app.auth import get_current_active_user
+from app.file_processing import extract_text_from_pdf
+from app.jobs import JobContext, JOB_UPLOAD_DIR, enqueue_job, job_handler
+from app.routers.jobs_router import job_accepted
+from app.uploads import save_upload
 
 router = APIRouter(
     tags=["classes"],
@@ -198,7 +202,35 @@ def set_grade_for_student(
         raise HTTPException(status_code=404, detail="Student, assignment not found, or you do not have permission")
     return updated_grade
 
-@router.post("/classes/{class_id}/file-report", response_model=dict)
+REPORT_FILE_EXTENSIONS = ['.csv', '.txt', '.md', '.xlsx', '.xls', '.docx', '.doc', '.pdf']
+
+async def _save_job_upload(file: UploadFile, file_extension: str) -> str:
+    """Saves an upload where it survives until the job that reads it finishes."""
+    stored = await save_upload(file, JOB_UPLOAD_DIR, file_extension)
+    return stored.path
+
+def _read_report_file(file_path: str, file_extension: str) -> str:
+    """Reads an uploaded report file as text for AI processing."""
+    file_extension = file_extension.lower()
+    if file_extension in ['.csv', '.txt', '.md']:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    elif file_extension in ['.xlsx', '.xls']:
+        # For Excel files, we'll use pandas to read and convert to text format
+        import pandas as pd
+        df = pd.read_excel(file_path)
+        return df.to_string(index=False)
+    elif file_extension in ['.docx', '.doc']:
+        # For Word files, we'll use python-docx to read
+        import docx
+        doc = docx.Document(file_path)
+        return "\n".join([paragraph.text for paragraph in doc.paragraphs])
+    elif file_extension == '.pdf':
+        # Same PyMuPDF reader as document uploads
+        return extract_text_from_pdf(file_path)
+    raise ValueError(f"Unsupported file format: {file_extension}")
+
+@router.post("/classes/{class_id}/file-report", response_model=schemas.JobAccepted, status_code=status.HTTP_202_ACCEPTED)
 async def generate_file_report(
     class_id: int,
     file: UploadFile = File(...),
@@ -206,84 +238,29 @@ async def generate_file_report(
     db: Session = Depends(get_db)
 ):
     """
-    Generate a report from an uploaded file for a specific class.
-    The file is temporarily saved, processed using AI, and then deleted.
+    Queue a report on an uploaded file for a specific class.
+    The file is kept until the background job has processed it, then deleted.
+    Poll GET /jobs/{job_id} for the report.
     """
     # Verify the class exists and belongs to the user
     db_class = crud.get_class(db=db, class_id=class_id, user_id=current_user.id)
     if not db_class:
         raise HTTPException(status_code=404, detail="Class not found")
     
-    # Create a temporary directory if it doesn't exist
-    temp_dir = "temp_uploads"
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    temp_filepath = None
+    file_extension = os.path.splitext(file.filename)[1] if file.filename else '.txt'
+    if file_extension.lower() not in REPORT_FILE_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file format: {file_extension}"
+        )
+
     try:
-        # Generate a unique filename
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.txt'
-        temp_filename = f"{uuid.uuid4()}{file_extension}"
-        temp_filepath = os.path.join(temp_dir, temp_filename)
-        
-        # Save the uploaded file temporarily
-        with open(temp_filepath, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Read file content as text for AI processing
-        file_content = ""
-        if file_extension.lower() in ['.csv', '.txt', '.md']:
-            with open(temp_filepath, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-        elif file_extension.lower() in ['.xlsx', '.xls']:
-            # For Excel files, we'll use pandas to read and convert to text format
-            import pandas as pd
-            df = pd.read_excel(temp_filepath)
-            file_content = df.to_string(index=False)
-        elif file_extension.lower() in ['.docx', '.doc']:
-            # For Word files, we'll use python-docx to read
-            try:
-                import docx
-                doc = docx.Document(temp_filepath)
-                file_content = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            except ImportError:
-                raise HTTPException(
-                    status_code=500,
-                    detail="python-docx library not installed. Cannot process Word documents."
-                )
-        elif file_extension.lower() == '.pdf':
-            # For PDF files, we'll use PyPDF2 to read
-            try:
-                import PyPDF2
-                with open(temp_filepath, 'rb') as pdf_file:
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    file_content = "\n".join([page.extract_text() for page in pdf_reader.pages])
-            except ImportError:
-                raise HTTPException(
-                    status_code=500,
-                    detail="PyPDF2 library not installed. Cannot process PDF documents."
-                )
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported file format: {file_extension}"
-            )
-        
-        # Process the file content using AI to generate a report
-        from app.ai_services import teaching_assistant
-        report_content = teaching_assistant.generate_file_report(file_content)
-
-        # Гарантируем, что report всегда строка
-        if not report_content or (isinstance(report_content, dict) and "error" in report_content):
-            report_content = "Не удалось сгенерировать отчёт по файлу. Проверьте формат и содержимое файла."
-
-        return {
-            "status": "success",
-            "class_id": class_id,
-            "filename": file.filename,
-            "report": report_content
-        }
-        
+        file_path = await _save_job_upload(file, file_extension)
+        job = enqueue_job(
+            db, user_id=current_user.id, kind="file_report",
+            payload={"class_id": class_id, "file_path": file_path, "filename": file.filename, "extension": file_extension},
+            temp_files=[file_path],
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -291,15 +268,29 @@ async def generate_file_report(
             status_code=500,
             detail=f"Error processing file: {str(e)}"
         )
-    finally:
-        # Clean up: remove the temporary file if it exists
-        try:
-            if temp_filepath and os.path.exists(temp_filepath):
-                os.remove(temp_filepath)
-        except Exception as e:
-            print(f"Warning: Could not remove temporary file: {e}")
-
-@router.post("/classes/{class_id}/import-data", response_model=dict)
+    return job_accepted(job)
+
+@job_handler("file_report")
+async def run_file_report_job(job: JobContext) -> dict:
+    """Background half of generate_file_report."""
+    from app.ai_services import _is_error_result, teaching_assistant
+
+    file_content = await asyncio.to_thread(_read_report_file, job.payload["file_path"], job.payload["extension"])
+    await job.set_progress(20)
+
+    report_content = await teaching_assistant.generate_file_report(file_content)
+    if _is_error_result(report_content):
+        # Raising lets the worker pool retry with backoff, then mark the job failed
+        raise RuntimeError(f"File report generation failed: {report_content}")
+
+    return {
+        "status": "success",
+        "class_id": job.payload["class_id"],
+        "filename": job.payload["filename"],
+        "report": report_content
+    }
+
+@router.post("/classes/{class_id}/import-data", response_model=schemas.JobAccepted, status_code=status.HTTP_202_ACCEPTED)
 async def import_class_data(
     class_id: int,
     file: UploadFile = File(...),
@@ -307,8 +298,9 @@ async def import_class_data(
     db: Session = Depends(get_db)
 ):
     """
-    Import data from an uploaded file for a specific class.
-    The file is temporarily saved, processed using AI, and then deleted.
+    Queue an import of class data from an uploaded file.
+    The file is kept until the background job has processed it, then deleted.
+    Poll GET /jobs/{job_id} for the outcome.
     """
     # Verify the class exists and belongs to the user
     db_class = crud.get_class(db=db, class_id=class_id, user_id=current_user.id)
@@ -322,141 +314,55 @@ async def import_class_data(
             detail="Unsupported file format. Please upload an Excel (.xlsx, .xls) or CSV file."
         )
     
-    # Create a temporary directory if it doesn't exist
-    temp_dir = "temp_uploads"
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    temp_filepath = None
     try:
-        # Generate a unique filename
         file_extension = os.path.splitext(file.filename)[1]
-        temp_filename = f"{uuid.uuid4()}{file_extension}"
-        temp_filepath = os.path.join(temp_dir, temp_filename)
-        
-        # Save the uploaded file temporarily
-        with open(temp_filepath, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Read file content as text for AI processing
-        file_content = ""
-        if file_extension.lower() == '.csv':
-            with open(temp_filepath, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-        else:
-            # For Excel files, we'll use pandas to read and convert to CSV format
-            import pandas as pd
-            df = pd.read_excel(temp_filepath)
-            file_content = df.to_csv(index=False)
-        
-        # Process the file content using AI
-        from app.ai_services import teaching_assistant
-        processed_data = teaching_assistant.process_import_file(file_content)
-        
-        if "error" in processed_data:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error processing file: {processed_data['error']}"
-            )
-        
-        # Import the processed data into the database
-        try:
-            # Import students
-            if "students" in processed_data:
-                for student_data in processed_data["students"]:
-                    student_name = student_data.get("name")
-                    if student_name:
-                        # Check if student already exists
-                        existing_student = db.query(models.Student).filter(
-                            models.Student.full_name == student_name,
-                            models.Student.class_id == class_id
-                        ).first()
-                        
-                        if not existing_student:
-                            new_student = models.Student(full_name=student_name, class_id=class_id)
-                            db.add(new_student)
-            
-            # Import assignments
-            if "assignments" in processed_data:
-                for assignment_data in processed_data["assignments"]:
-                    title = assignment_data.get("title")
-                    description = assignment_data.get("description", "")
-                    if title:
-                        # Check if assignment already exists
-                        existing_assignment = db.query(models.Assignment).filter(
-                            models.Assignment.title == title,
-                            models.Assignment.class_id == class_id
-                        ).first()
-                        
-                        if not existing_assignment:
-                            new_assignment = models.Assignment(
-                                title=title,
-                                description=description,
-                                class_id=class_id
-                            )
-                            db.add(new_assignment)
-            
-            # Import grades
-            if "grades" in processed_data:
-                for grade_data in processed_data["grades"]:
-                    student_name = grade_data.get("student_name")
-                    assignment_title = grade_data.get("assignment_title")
-                    grade_value = grade_data.get("grade")
-                    
-                    if student_name and assignment_title and grade_value:
-                        # Get student and assignment IDs
-                        student = db.query(models.Student).filter(
-                            models.Student.full_name == student_name,
-                            models.Student.class_id == class_id
-                        ).first()
-                        
-                        assignment = db.query(models.Assignment).filter(
-                            models.Assignment.title == assignment_title,
-                            models.Assignment.class_id == class_id
-                        ).first()
-                        
-                        if student and assignment:
-                            # Check if grade already exists
-                            existing_grade = db.query(models.Grade).filter(
-                                models.Grade.student_id == student.id,
-                                models.Grade.assignment_id == assignment.id
-                            ).first()
-                            
-                            if existing_grade:
-                                existing_grade.grade = str(grade_value)
-                            else:
-                                new_grade = models.Grade(
-                                    student_id=student.id,
-                                    assignment_id=assignment.id,
-                                    grade=str(grade_value)
-                                )
-                                db.add(new_grade)
-            
-            db.commit()
-            
-            return {
-                "status": "success",
-                "message": "Data imported successfully",
-                "class_id": class_id,
-                "filename": file.filename
-            }
-            
-        except Exception as db_error:
-            db.rollback()
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error importing data to database: {str(db_error)}"
-            )
-        
+        file_path = await _save_job_upload(file, file_extension)
+        job = enqueue_job(
+            db, user_id=current_user.id, kind="import_data",
+            payload={"class_id": class_id, "file_path": file_path, "filename": file.filename, "extension": file_extension},
+            temp_files=[file_path],
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error processing file: {str(e)}"
         )
-    finally:
-        # Clean up: remove the temporary file if it exists
-        try:
-            if temp_filepath and os.path.exists(temp_filepath):
-                os.remove(temp_filepath)
-        except Exception as e:
-            print(f"Warning: Could not remove temporary file: {e}")
+    return job_accepted(job)
+
+def _read_import_file(file_path: str, file_extension: str) -> str:
+    """Reads an import file as CSV text for AI processing."""
+    if file_extension.lower() == '.csv':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    # For Excel files, we'll use pandas to read and convert to CSV format
+    import pandas as pd
+    df = pd.read_excel(file_path)
+    return df.to_csv(index=False)
+
+def _import_processed_data(class_id: int, processed_data: dict) -> None:
+    with SessionLocal() as db:
+        crud.import_processed_class_data(db, class_id=class_id, processed_data=processed_data)
+
+@job_handler("import_data")
+async def run_import_data_job(job: JobContext) -> dict:
+    """Background half of import_class_data."""
+    from app.ai_services import teaching_assistant
+
+    file_content = await asyncio.to_thread(_read_import_file, job.payload["file_path"], job.payload["extension"])
+    await job.set_progress(20)
+
+    processed_data = await teaching_assistant.process_import_file(file_content)
+    if "error" in processed_data:
+        raise RuntimeError(f"Error processing file: {processed_data['error']}")
+    await job.set_progress(80)
+
+    await asyncio.to_thread(_import_processed_data, job.payload["class_id"], processed_data)
+
+    return {
+        "status": "success",
+        "message": "Data imported successfully",
+        "class_id": job.payload["class_id"],
+        "filename": job.payload["filename"]
+    }
@@ -3,20 +3,29 @@ Documents Router
 
 Handles document upload, retrieval, and management.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
 from sqlalchemy.orm import Session
+import asyncio
+import base64
 import os
-import uuid
 import logging
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-from app.database import get_db
-from app import models, schemas, crud
+from app.database import get_db, SessionLocal
+from app import models, schemas, crud, storage
 from app.auth import get_current_active_user
-from app.file_processing import extract_text
+from app.extraction import ExtractionError, extract_pages, extraction_progress
+from app.document_cache import document_text_cache
+from app.semantic_cache import semantic_cache
+from app.generation_cache import generation_cache, content_hash
+from app.retrieval import drop_document_index, index_document
+from app.jobs import JobContext, enqueue_job, job_handler
+from app.ocr import ocr_available, ocr_page, ocr_pool, pages_needing_ocr
+from app.uploads import receive_upload
+from app.metrics import metrics
 
 router = APIRouter(
     tags=["documents"],
@@ -26,12 +35,16 @@ router = APIRouter(
 @router.post("/documents/upload", response_model=schemas.Document)
 async def upload_file(
     file: UploadFile = File(...),
+    upload_id: Optional[str] = Query(None, max_length=64, description="Client-chosen ID to poll extraction progress with"),
     current_user: models.User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Upload a file and save it to the database.
     
+    PDFs are extracted page by page; pass upload_id and poll
+    GET /documents/uploads/{upload_id}/progress to follow a long extraction.
+    
     Returns:
         Document: The created document object with metadata
     """
@@ -50,51 +63,144 @@ async def upload_file(
                 detail="File type not supported. Please upload a PDF, DOC, DOCX, or TXT file."
             )
             
-        # Create upload directory if it doesn't exist
-        UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "uploaded_files"))
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        
-        # Generate a unique filename to prevent collisions
+        # Stream the file to disk, hashing it and enforcing the size cap for its type
         file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{str(uuid.uuid4())}{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, unique_filename)
-        
-        # Save file to disk with absolute path
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Extract text from the uploaded file
-        extracted_text = extract_text(file_path, file.filename)
+        upload = await receive_upload(file, storage.UPLOAD_DIR, file_extension)
         
-        # Create document in database
-        document = crud.create_user_document(
-            db=db,
-            file_name=file.filename,  # Keep original filename in DB
-            file_path=file_path,      # But use unique filename on disk
-            file_type=file.content_type,
-            file_size=len(content),
-            user_id=current_user.id,
-            extracted_text=extracted_text
-        )
+        # Files are stored once per content; a duplicate only takes a reference on the existing one
+        stored_file = storage.acquire(db, upload, file_extension)
+        try:
+            extracted_text = stored_file.extracted_text
+            extracted_here = extracted_text is None
+            if extracted_here:
+                def report_progress(pages_done: int, total_pages: int) -> None:
+                    if upload_id:
+                        extraction_progress.update(current_user.id, upload_id, "extracting", pages_done, total_pages)
+
+                # Extract pages in parallel in the extraction process pool, off the event loop
+                try:
+                    pages = await extract_pages(stored_file.file_path, file.filename, on_progress=report_progress)
+                except ExtractionError as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail=f"Could not extract text from the file: {str(e)}"
+                    )
+                extracted_text = "".join(pages)
+                storage.set_extracted_text(db, stored_file.id, extracted_text, pages)
+            else:
+                metrics.increment("storage.extraction_reused")
+            
+            # Create document in database
+            document = crud.create_user_document(
+                db=db,
+                file_name=file.filename,  # Keep original filename in DB
+                file_path=stored_file.file_path,  # But store the content under its hash on disk
+                file_type=file.content_type,
+                file_size=upload.size,
+                user_id=current_user.id,
+                extracted_text=extracted_text,
+                stored_file_id=stored_file.id
+            )
+        except BaseException:
+            db.rollback()
+            storage.release(db, stored_file.id)
+            if upload_id:
+                extraction_progress.update(current_user.id, upload_id, "failed")
+            raise
+
+        # Scanned pages are read by OCR in the background; their text fills in when the job finishes
+        ocr_job_id = None
+        if extracted_here and file_extension.lower() == ".pdf" and ocr_available():
+            try:
+                ocr_pages = pages_needing_ocr(db, stored_file.id)
+                if ocr_pages:
+                    ocr_job_id = enqueue_job(
+                        db, user_id=current_user.id, kind="ocr_pages",
+                        payload={"stored_file_id": stored_file.id, "file_path": stored_file.file_path, "pages": ocr_pages},
+                    ).id
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Failed to queue OCR for document {document.id}: {str(e)}")
+        if upload_id:
+            total_pages = crud.count_document_pages(db, stored_file.id)
+            extraction_progress.update(current_user.id, upload_id, "done", total_pages, total_pages, ocr_job_id=ocr_job_id)
+
+        # Build the retrieval index now, off the event loop; chat falls back to indexing lazily if this fails
+        try:
+            await asyncio.to_thread(_index_upload, document.id, stored_file.id, extracted_text)
+        except Exception as e:
+            logger.warning(f"Failed to index document {document.id}: {str(e)}")
         
         return document
         
     except HTTPException:
         raise
     except Exception as e:
-        # Clean up file if it was partially written
-        if 'file_path' in locals() and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-                
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error uploading file: {str(e)}"
         )
 
+def _index_upload(document_id: int, stored_file_id: int, text: str) -> None:
+    with SessionLocal() as db:
+        # A duplicate upload copies the index of a document sharing its stored file
+        index_document(db, document_id, text, stored_file_id=stored_file_id)
+
+def _apply_ocr_text(stored_file_id: int, page_text: dict) -> list:
+    with SessionLocal() as db:
+        document_ids = storage.update_pages(db, stored_file_id, page_text)
+        text = db.query(models.StoredFile.extracted_text).filter(models.StoredFile.id == stored_file_id).scalar()
+        for document_id in document_ids:
+            drop_document_index(db, document_id)
+        # Only the first document is chunked; the others copy its index
+        for document_id in document_ids:
+            index_document(db, document_id, text, stored_file_id=stored_file_id)
+        return document_ids
+
+@job_handler("ocr_pages")
+async def run_ocr_job(job: JobContext) -> dict:
+    """Background OCR of the pages of an uploaded PDF that have no text layer."""
+    file_path = job.payload["file_path"]
+    page_numbers = job.payload["pages"]
+    recognized = {}
+    failed = 0
+    done = 0
+    # Bounds how many rendered page images wait for the OCR pool at once
+    in_flight = asyncio.Semaphore(ocr_pool.workers * 2)
+
+    async def read_page(number: int) -> None:
+        nonlocal failed, done
+        async with in_flight:
+            if not os.path.exists(file_path):
+                return  # Every document using the file was deleted meanwhile
+            try:
+                text = await ocr_page(file_path, number)
+                if text.strip():
+                    recognized[number] = text
+            except Exception as e:
+                failed += 1
+                print(f"Error reading page {number} of {file_path} by OCR: {e}")
+        done += 1
+        await job.set_progress(100 * done // len(page_numbers))
+
+    await asyncio.gather(*(read_page(number) for number in page_numbers))
+    if page_numbers and failed == len(page_numbers):
+        raise RuntimeError("OCR failed on every page")
+
+    document_ids = []
+    if recognized:
+        document_ids = await asyncio.to_thread(_apply_ocr_text, job.payload["stored_file_id"], recognized)
+        for document_id in document_ids:
+            document_text_cache.invalidate(document_id)
+            semantic_cache.invalidate(document_id)
+    return {
+        "status": "success",
+        "pages": len(page_numbers),
+        "pages_recognized": len(recognized),
+        "pages_failed": failed,
+        "document_ids": document_ids,
+    }
+
 @router.get("/documents", response_model=List[schemas.Document])
 def get_documents(
     skip: int = 0,
@@ -207,8 +313,9 @@ async def delete_document(
             )
             
         file_deleted = False
-        # Delete the file from storage
-        if document.file_path and os.path.exists(document.file_path):
+        stored_file_id = document.stored_file_id
+        # Files stored before deduplication belong to this document alone
+        if stored_file_id is None and document.file_path and os.path.exists(document.file_path):
             try:
                 os.remove(document.file_path)
                 file_deleted = True
@@ -216,8 +323,19 @@ async def delete_document(
                 logger.error(f"Failed to delete file {document.file_path}: {str(e)}")
                 # Continue with DB deletion even if file deletion fails
         
+        # Hash the content before the row is gone so cached generations can be dropped
+        text_hash = content_hash(document.extracted_text_content or "")
+        
         # Delete the database record
         success = crud.delete_document(db=db, document_id=document_id, user_id=current_user.id)
+        if stored_file_id is not None:
+            # After the document row is gone; a crash in between leaks the file rather than losing it
+            file_deleted = storage.release(db, stored_file_id)
+        document_text_cache.invalidate(document_id)
+        # Other documents with the same content keep using the cached generations
+        if stored_file_id is None or file_deleted:
+            generation_cache.invalidate_content(text_hash)
+        semantic_cache.invalidate(document_id)
         
         if not success:
             raise HTTPException(
@@ -244,6 +362,93 @@ async def delete_document(
             detail=f"Error deleting document: {str(e)}"
         )
 
+def _encode_chat_cursor(turn: models.ChatHistory) -> str:
+    raw = f"{turn.timestamp.isoformat()}|{turn.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def _decode_chat_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, turn_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(turn_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+@router.get("/documents/{document_id}/chat", response_model=schemas.ChatHistoryPage)
+def get_document_chat(
+    document_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the stored chat about a document, newest page first.
+
+    Pass the returned next_cursor to get the page of older turns.
+    """
+    document = crud.get_document(db=db, document_id=document_id, user_id=current_user.id, load_text=False)
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+
+    before = _decode_chat_cursor(cursor) if cursor else None
+    # One extra row tells us whether an older page exists
+    turns = crud.get_chat_history_page(db, document_id, current_user.id, limit=limit + 1, before=before)
+    has_more = len(turns) > limit
+    turns = turns[:limit]
+    return schemas.ChatHistoryPage(
+        items=list(reversed(turns)),
+        next_cursor=_encode_chat_cursor(turns[-1]) if has_more else None,
+    )
+
+@router.get("/documents/uploads/{upload_id}/progress", response_model=schemas.UploadProgress)
+def get_upload_progress(
+    upload_id: str,
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Get the extraction progress of an upload this user started with this upload_id."""
+    progress = extraction_progress.get(current_user.id, upload_id)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown upload")
+    return progress
+
+DOCUMENT_PAGES_MAX_RANGE = 100  # Pages returned per request at most
+
+@router.get("/documents/{document_id}/pages", response_model=schemas.DocumentPages)
+def get_document_pages(
+    document_id: int,
+    first_page: int = Query(1, ge=1, alias="from"),
+    last_page: Optional[int] = Query(None, ge=1, alias="to"),
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the extracted text of pages from..to (1-based, inclusive) of a document.
+
+    At most DOCUMENT_PAGES_MAX_RANGE pages are returned; omit to for that
+    many pages starting at from. Documents uploaded before page extraction,
+    and formats without pages, have a single page.
+    """
+    document = crud.get_document(db=db, document_id=document_id, user_id=current_user.id, load_text=False)
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Document not found or access denied"
+        )
+    if last_page is not None and last_page < first_page:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'to' must not be before 'from'")
+    last_page = min(last_page or first_page + DOCUMENT_PAGES_MAX_RANGE - 1, first_page + DOCUMENT_PAGES_MAX_RANGE - 1)
+
+    total_pages = crud.count_document_pages(db, document.stored_file_id) if document.stored_file_id else 0
+    if total_pages:
+        pages = crud.get_document_pages(db, document.stored_file_id, first_page, last_page)
+    else:
+        total_pages = 1
+        pages = [schemas.DocumentPage(page_number=1, content=document.extracted_text_content or "")] if first_page == 1 else []
+    return schemas.DocumentPages(document_id=document_id, total_pages=total_pages, pages=pages)
+
 @router.get("/documents/debug/{document_id}")
 async def debug_document(
     document_id: int,
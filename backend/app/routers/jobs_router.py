@@ -0,0 +1,51 @@
+"""
+Jobs Router
+
+Reports the status, progress and result of background jobs.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+import json
+
+from app.database import get_db
+from app import models, schemas
+from app.auth import get_current_active_user
+from app.jobs import get_job
+
+router = APIRouter(
+    tags=["jobs"],
+    responses={404: {"description": "Not found"}},
+)
+
+def job_accepted(job: models.Job) -> schemas.JobAccepted:
+    """Builds the 202 response body for a freshly enqueued job."""
+    return schemas.JobAccepted(job_id=job.id, status=job.status, status_url=f"/api/v1/jobs/{job.id}")
+
+@router.get("/jobs/{job_id}", response_model=schemas.Job)
+def get_job_status(
+    job_id: int,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Get the status of a background job.
+
+    The result is included once the job has succeeded; the last error is
+    included while it is being retried and after it has failed.
+    """
+    job = get_job(db, job_id=job_id, user_id=current_user.id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+    return schemas.Job(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        progress=job.progress,
+        attempts=job.attempts,
+        result=json.loads(job.result) if job.result else None,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
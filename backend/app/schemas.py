@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, ConfigDict
 from datetime import datetime
-from typing import Optional, List
+from typing import Any, Optional, List
 
 # User Schemas
 class UserBase(BaseModel):
@@ -50,6 +50,26 @@ class ChatHistory(ChatHistoryBase):
     timestamp: datetime
     model_config = ConfigDict(from_attributes=True)
 
+class ChatHistoryPage(BaseModel):
+    items: List[ChatHistory]  # Oldest first within the page
+    next_cursor: Optional[str] = None  # Pass as cursor to fetch older turns; None when there are no more
+
+class DocumentPage(BaseModel):
+    page_number: int  # 1-based
+    content: str
+    model_config = ConfigDict(from_attributes=True)
+
+class DocumentPages(BaseModel):
+    document_id: int
+    total_pages: int
+    pages: List[DocumentPage]
+
+class UploadProgress(BaseModel):
+    status: str  # "extracting", "done" or "failed"
+    pages_done: int
+    total_pages: int
+    ocr_job_id: Optional[int] = None  # Background OCR of scanned pages; poll GET /jobs/{id}
+
 # Grade Schemas
 class GradeBase(BaseModel):
     grade: Optional[str] = None
@@ -120,4 +140,20 @@ class ClassDetails(ClassBase):
     students: List[Student] = []
     model_config = ConfigDict(from_attributes=True)
 
+# Job Schemas
+class JobAccepted(BaseModel):
+    job_id: int
+    status: str
+    status_url: str
 
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    progress: int
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -3,8 +3,8 @@ AI Service Schemas for Professor AI Helper
 
 This module defines Pydantic models for AI service requests and responses.
 """
-from typing import List, Optional, Dict
-from pydantic import BaseModel, Field
+from typing import Any, List, Optional, Dict
+from pydantic import BaseModel, ConfigDict, Field, RootModel
 
 # Generic document request for text-based AI operations
 class DocumentRequest(BaseModel):
@@ -20,9 +20,77 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     """Request model for chat interactions."""
     query: str = Field(..., description="The user's query.")
+    document_id: Optional[int] = Field(None, description="ID of an uploaded document to use as context; takes precedence over document_text.")
     document_text: Optional[str] = Field(None, description="The context from the document.")
-    history: Optional[List[Dict]] = Field([], description="The chat history.")
+    history: Optional[List[Dict]] = Field(None, description="The chat history. Omit to use the history stored for document_id.")
+    use_cache: bool = Field(True, description="Set to false to always generate a fresh answer instead of reusing one given to a similar question.")
 
 class ChatResponse(BaseModel):
     """Response model for chat interactions."""
     message: str = Field(..., description="The AI's response message.")
+
+class QuizRequest(BaseModel):
+    """Request model for generating a quiz from an uploaded document."""
+    document_id: int = Field(..., description="ID of the document to build the quiz from.")
+    question_count: int = Field(5, ge=1, le=50, description="Number of questions.")
+    difficulty: str = Field("medium", description="Difficulty: easy, medium or hard.")
+    question_type: str = Field("multiple_choice", description="Question type, e.g. multiple_choice or open.")
+
+class QuizBatchItem(QuizRequest):
+    """Quiz parameters for one document in a batch."""
+
+class QuizBatchRequest(BaseModel):
+    """Request model for generating quizzes for several documents at once."""
+    items: List[QuizBatchItem] = Field(..., min_length=1, max_length=20, description="One entry per quiz to generate.")
+
+class SummaryRequest(BaseModel):
+    """Request model for summarizing an uploaded document."""
+    document_id: int = Field(..., description="ID of the document to summarize.")
+    summary_type: str = Field("concise", description="Style of summary, e.g. concise or detailed.")
+    length: str = Field("medium", description="Desired summary length: short, medium or long.")
+
+# Structured model output; extra keys the model adds are kept
+class QuizQuestion(BaseModel):
+    """One generated quiz question."""
+    model_config = ConfigDict(extra="allow")
+    question: str = Field(..., min_length=1)
+    type: Optional[str] = None
+    options: Optional[List[Any]] = None
+    correct_answer: Optional[Any] = None
+    explanation: Optional[str] = None
+
+class QuizOutput(BaseModel):
+    """A generated quiz."""
+    model_config = ConfigDict(extra="allow")
+    title: str = ""
+    description: str = ""
+    questions: List[QuizQuestion] = Field(..., min_length=1)
+
+class StudyQuestion(BaseModel):
+    """One generated study question with its answer."""
+    model_config = ConfigDict(extra="allow")
+    question: str = Field(..., min_length=1)
+    answer: str = ""
+
+class StudyQuestionList(RootModel[List[StudyQuestion]]):
+    """Generated study questions."""
+
+class SummaryOutput(BaseModel):
+    """A document (or section) summary."""
+    model_config = ConfigDict(extra="allow")
+    title: Optional[str] = None
+    summary: str
+    key_points: List[str] = []
+    keywords: List[str] = []
+
+class ChatSummaryOutput(BaseModel):
+    """Rolling summary of an older part of a conversation."""
+    model_config = ConfigDict(extra="allow")
+    summary: str
+
+class ClassImportOutput(BaseModel):
+    """Class data extracted from an imported file."""
+    model_config = ConfigDict(extra="allow")
+    students: List[Any] = []
+    assignments: List[Any] = []
+    grades: List[Any] = []
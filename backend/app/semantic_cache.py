@@ -0,0 +1,196 @@
+"""
+Semantic Chat Cache for Professor AI Helper
+
+Students ask the same few questions about the same document over and
+over. This cache stores answers to first questions (no chat history) per
+document and serves a stored answer when a new question is similar
+enough, also later in a conversation as long as the question stands on
+its own (see is_standalone). Questions are embedded locally with hashed TF-IDF (word unigrams
+and bigrams hashed into a fixed number of dimensions), kept as rows of a
+NumPy matrix per document and compared by cosine similarity, so no
+embedding service is involved.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from app.metrics import metrics
+
+# Semantic cache settings
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.9))  # Cosine similarity needed for a hit
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 5000))  # Across all documents, LRU
+SEMANTIC_CACHE_DIMENSIONS = int(os.getenv("SEMANTIC_CACHE_DIMENSIONS", 2048))  # Hashed feature space size
+
+# Unlike retrieval.tokenize, single characters are kept: "homework 2" and
+# "homework 3" must not look like the same question
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+# Words that point back into the conversation ("explain that", "а почему он...");
+# a question containing one needs the earlier turns to be understood
+_FOLLOW_UP_WORDS = frozenset("""
+    it its this that these those they them their he him his she her above previous earlier again more
+    also else same another other former latter
+    это этот эта эти этого этой этом том тот та те того той тем там тогда он она оно они его её ее
+    их ему ей им ним ней них выше ранее ещё еще подробнее тоже также такой такая такие предыдущий
+""".split())
+
+
+def is_standalone(question: str) -> bool:
+    """True if the question can be understood without the conversation before it."""
+    tokens = _TOKEN_RE.findall(question.lower())
+    return len(tokens) >= 2 and not any(token in _FOLLOW_UP_WORDS for token in tokens)
+
+
+def _features(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def hashed_term_frequencies(text: str, dimensions: int = SEMANTIC_CACHE_DIMENSIONS) -> np.ndarray:
+    """Sublinear term frequencies of the text's features, hashed into `dimensions` buckets."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in _features(text):
+        vector[zlib.crc32(feature.encode("utf-8")) % dimensions] += 1.0
+    np.log1p(vector, out=vector)
+    return vector
+
+
+class _DocumentEntries:
+    """Questions cached for one version of a document: a term-frequency matrix plus answers."""
+
+    def __init__(self, version: str, dimensions: int):
+        self.version = version
+        self.matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self.entry_ids: List[int] = []
+        self.answers: List[str] = []
+        # Number of cached questions containing each hashed feature, for IDF
+        self.document_frequency = np.zeros(dimensions, dtype=np.float32)
+
+    def add(self, entry_id: int, vector: np.ndarray, answer: str) -> None:
+        self.matrix = np.vstack([self.matrix, vector])
+        self.entry_ids.append(entry_id)
+        self.answers.append(answer)
+        self.document_frequency += vector > 0
+
+    def remove(self, entry_id: int) -> None:
+        row = self.entry_ids.index(entry_id)
+        self.document_frequency -= self.matrix[row] > 0
+        self.matrix = np.delete(self.matrix, row, axis=0)
+        del self.entry_ids[row]
+        del self.answers[row]
+
+    def best_match(self, vector: np.ndarray) -> Tuple[Optional[int], float]:
+        """(row, cosine similarity) of the most similar cached question, TF-IDF weighted."""
+        if not self.entry_ids:
+            return None, 0.0
+        count = len(self.entry_ids)
+        idf = np.log((1.0 + count) / (1.0 + self.document_frequency)) + 1.0
+        weighted = self.matrix * idf
+        query = vector * idf
+        norms = np.linalg.norm(weighted, axis=1) * np.linalg.norm(query)
+        similarities = (weighted @ query) / np.where(norms > 0, norms, 1.0)
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+
+class SemanticChatCache:
+    """
+    Per-document similarity cache of chat answers with global LRU eviction.
+
+    Answers are kept for one content version per document (see
+    document_cache.content_version): document ids are reused after a
+    delete, so answers about another version are never served.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        dimensions: int = SEMANTIC_CACHE_DIMENSIONS,
+        enabled: bool = SEMANTIC_CACHE_ENABLED,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.enabled = enabled
+        self._documents: Dict[int, _DocumentEntries] = {}
+        # (document_id, entry_id) in least- to most-recently used order
+        self._lru: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, document_id: int, version: str, question: str) -> Optional[str]:
+        """The cached answer to a question similar enough to this one, if any."""
+        if not self.enabled:
+            return None
+        vector = hashed_term_frequencies(question, self.dimensions)
+        with self._lock:
+            entries = self._documents.get(document_id)
+            if entries is not None and entries.version != version:
+                entries = None
+            row, similarity = entries.best_match(vector) if entries else (None, 0.0)
+            if row is None or similarity < self.threshold:
+                metrics.increment("semantic_cache.misses")
+                return None
+            self._lru.move_to_end((document_id, entries.entry_ids[row]))
+            metrics.increment("semantic_cache.hits")
+            return entries.answers[row]
+
+    def store(self, document_id: int, version: str, question: str, answer: str) -> None:
+        """Cache an answer, replacing the entry for a near-identical question."""
+        if not self.enabled or not answer:
+            return
+        vector = hashed_term_frequencies(question, self.dimensions)
+        if not vector.any():
+            return
+        with self._lock:
+            stale = self._documents.get(document_id)
+            if stale is not None and stale.version != version:
+                self._drop(document_id)
+            entries = self._documents.setdefault(document_id, _DocumentEntries(version, self.dimensions))
+            row, similarity = entries.best_match(vector)
+            if row is not None and similarity >= self.threshold:
+                self._discard(document_id, entries.entry_ids[row])
+                entries = self._documents.setdefault(document_id, _DocumentEntries(version, self.dimensions))
+            entry_id = self._next_id
+            self._next_id += 1
+            entries.add(entry_id, vector, answer)
+            self._lru[(document_id, entry_id)] = None
+            while len(self._lru) > self.max_entries:
+                evicted_document, evicted_entry = next(iter(self._lru))
+                self._discard(evicted_document, evicted_entry)
+                metrics.increment("semantic_cache.evictions")
+
+    def _discard(self, document_id: int, entry_id: int) -> None:
+        self._lru.pop((document_id, entry_id), None)
+        entries = self._documents.get(document_id)
+        if entries is None:
+            return
+        entries.remove(entry_id)
+        if not entries.entry_ids:
+            del self._documents[document_id]
+
+    def invalidate(self, document_id: int) -> None:
+        """Drop every cached answer for a document (deleted or replaced)."""
+        with self._lock:
+            self._drop(document_id)
+
+    def _drop(self, document_id: int) -> None:
+        entries = self._documents.pop(document_id, None)
+        if entries is not None:
+            for entry_id in entries.entry_ids:
+                self._lru.pop((document_id, entry_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._documents), "entries": len(self._lru)}
+
+
+semantic_cache = SemanticChatCache()
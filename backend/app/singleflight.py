@@ -0,0 +1,66 @@
+"""
+Single-Flight Request Coalescing for Professor AI Helper
+
+Concurrent callers asking for the same work share one in-flight call
+instead of each starting their own.
+"""
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import json
+import re
+
+from app.metrics import metrics
+
+
+def request_key(prompt: str, config: dict) -> str:
+    """Key for a model call: whitespace-normalised prompt plus generation config."""
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    payload = json.dumps({"prompt": normalized, "config": config}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent async calls that share a key.
+
+    The first caller starts the work as a task; later callers with the same
+    key await that task. A waiter that is cancelled (e.g. its client went
+    away) only detaches itself; the shared call is cancelled once no waiters
+    remain, so nobody pays for a result that nobody will read.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, _Flight] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            metrics.increment(f"{self.name}.coalesced")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,133 @@
+"""
+Content-Addressed Document Storage for Professor AI Helper
+
+Uploaded documents are stored once per content: the file is named after
+its SHA-256 and shared, together with its extracted text, by every
+document uploaded with the same bytes. StoredFile.ref_count counts the
+documents referencing a file, and the file is deleted with its last
+reference.
+"""
+from typing import Dict, List, Optional
+import os
+
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.metrics import metrics
+from app.uploads import StoredUpload, discard_upload, place_upload
+
+UPLOAD_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "uploaded_files"))
+
+
+def object_path(sha256: str, extension: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{sha256}{extension}")
+
+
+def _add_reference(db: Session, sha256: str, extension: str) -> bool:
+    updated = db.query(models.StoredFile).filter(
+        models.StoredFile.sha256 == sha256, models.StoredFile.extension == extension
+    ).update({"ref_count": models.StoredFile.ref_count + 1}, synchronize_session=False)
+    return bool(updated)
+
+
+def acquire(db: Session, upload: StoredUpload, extension: str) -> models.StoredFile:
+    """
+    Takes a reference on the stored file holding the upload's content,
+    creating it on the first upload of that content, and moves the
+    received bytes into place unless an identical file is already there.
+    """
+    extension = extension.lower()
+    path = object_path(upload.sha256, extension)
+    if not _add_reference(db, upload.sha256, extension):
+        db.add(models.StoredFile(
+            sha256=upload.sha256, extension=extension, file_path=path, file_size=upload.size, ref_count=1,
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # The same content was stored concurrently; reference that one instead
+            db.rollback()
+            _add_reference(db, upload.sha256, extension)
+    db.commit()
+
+    # With a reference held the file can't be collected, so checking for it here is safe
+    if os.path.exists(path):
+        discard_upload(upload)
+        metrics.increment("storage.deduplicated")
+    else:
+        place_upload(upload, path)
+    return db.query(models.StoredFile).filter(
+        models.StoredFile.sha256 == upload.sha256, models.StoredFile.extension == extension
+    ).one()
+
+
+def set_extracted_text(db: Session, stored_file_id: int, text: str, pages: Optional[List[str]] = None) -> None:
+    """Saves a stored file's extraction, with its per-page text, unless a concurrent upload already did."""
+    updated = db.query(models.StoredFile).filter(
+        models.StoredFile.id == stored_file_id, models.StoredFile.extracted_text.is_(None)
+    ).update({"extracted_text": text}, synchronize_session=False)
+    if updated and pages:
+        db.execute(
+            insert(models.DocumentPage),
+            [
+                {"stored_file_id": stored_file_id, "page_number": number, "content": content}
+                for number, content in enumerate(pages, start=1)
+            ],
+        )
+    db.commit()
+
+
+def update_pages(db: Session, stored_file_id: int, page_text: Dict[int, str]) -> List[int]:
+    """
+    Replaces the text of some pages of a stored file (e.g. with OCR output)
+    and rebuilds the full text of the file and of every document using it.
+    Returns the IDs of those documents.
+    """
+    for number, content in page_text.items():
+        db.query(models.DocumentPage).filter(
+            models.DocumentPage.stored_file_id == stored_file_id, models.DocumentPage.page_number == number
+        ).update({"content": content}, synchronize_session=False)
+    text = "".join(content for (content,) in db.query(models.DocumentPage.content).filter(
+        models.DocumentPage.stored_file_id == stored_file_id
+    ).order_by(models.DocumentPage.page_number.asc()))
+    db.query(models.StoredFile).filter(models.StoredFile.id == stored_file_id).update(
+        {"extracted_text": text}, synchronize_session=False
+    )
+    documents = db.query(models.Document).filter(models.Document.stored_file_id == stored_file_id)
+    document_ids = [document_id for (document_id,) in documents.with_entities(models.Document.id)]
+    documents.update({
+        "extracted_text_content": text,
+        "text_revision": func.coalesce(models.Document.text_revision, 0) + 1,
+    }, synchronize_session=False)
+    db.commit()
+    return document_ids
+
+
+def release(db: Session, stored_file_id: Optional[int]) -> bool:
+    """Drops one reference on a stored file. Returns True if that was the last one and the file is gone."""
+    if stored_file_id is None:
+        return False
+    stored = db.query(models.StoredFile).filter(models.StoredFile.id == stored_file_id).with_for_update().first()
+    if stored is None:
+        return False
+    stored.ref_count -= 1
+    collected = stored.ref_count <= 0
+    if collected:
+        db.query(models.DocumentPage).filter(
+            models.DocumentPage.stored_file_id == stored_file_id
+        ).delete(synchronize_session=False)
+        db.delete(stored)
+        db.flush()
+        # Removed while the row is still locked, so a concurrent upload of the same
+        # content waits for this commit and then stores the file afresh
+        try:
+            os.remove(stored.file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not remove stored file {stored.file_path}: {e}")
+        metrics.increment("storage.collected")
+    db.commit()
+    return collected
@@ -0,0 +1,111 @@
+"""
+Hierarchical Summarization for Professor AI Helper
+
+Documents larger than the model's comfortable context are split into
+sections; each section is summarized on its own (map) and the partial
+summaries are merged into the final summary (reduce), recursively if there
+are too many partials to merge in one call.
+
+Section boundaries are content-defined: they fall on anchor lines chosen
+by the text itself, not at fixed offsets, so an edit only changes the
+sections around it and every other section keeps its cached summary.
+"""
+from typing import List
+import json
+import os
+import zlib
+
+from app.retrieval import split_into_chunks
+
+# Map-reduce settings
+SUMMARY_SINGLE_PASS_LENGTH = int(os.getenv("SUMMARY_SINGLE_PASS_LENGTH", 30000))  # Characters
+SUMMARY_SECTION_LENGTH = int(os.getenv("SUMMARY_SECTION_LENGTH", 12000))  # Characters, at most
+SUMMARY_SECTION_MIN_LENGTH = int(os.getenv("SUMMARY_SECTION_MIN_LENGTH", 8000))  # Characters before a section may end
+SUMMARY_MAP_CONCURRENCY = int(os.getenv("SUMMARY_MAP_CONCURRENCY", 4))
+SUMMARY_REDUCE_FAN_IN = int(os.getenv("SUMMARY_REDUCE_FAN_IN", 8))  # Partial summaries per reduce call
+
+
+def needs_map_reduce(document_text: str) -> bool:
+    return len(document_text or "") > SUMMARY_SINGLE_PASS_LENGTH
+
+
+# About one non-blank line in this many is an anchor a section may end on
+_ANCHOR_MODULUS = 8
+
+
+def _is_anchor(line: str) -> bool:
+    stripped = line.strip()
+    return not stripped or zlib.crc32(stripped.encode("utf-8")) % _ANCHOR_MODULUS == 0
+
+
+def split_into_sections(document_text: str) -> List[str]:
+    """
+    Split a document into non-overlapping sections at content-defined boundaries.
+
+    A section ends after the first anchor line (a blank line, or a line its
+    hash picks) once it holds SUMMARY_SECTION_MIN_LENGTH characters, and is
+    cut at SUMMARY_SECTION_LENGTH at the latest. Since a boundary depends
+    only on the text just before it, the boundaries after an edit fall back
+    into place at the next anchor.
+    """
+    sections: List[str] = []
+    current: List[str] = []
+    length = 0
+
+    def close() -> None:
+        nonlocal length
+        section = "".join(current).strip()
+        if section:
+            sections.append(section)
+        current.clear()
+        length = 0
+
+    for line in (document_text or "").splitlines(keepends=True):
+        # Lines longer than a whole section are cut on word boundaries
+        pieces = [line] if len(line) <= SUMMARY_SECTION_LENGTH else [
+            piece + " " for piece in split_into_chunks(line, chunk_size=SUMMARY_SECTION_LENGTH, overlap=0)
+        ]
+        for piece in pieces:
+            if current and length + len(piece) > SUMMARY_SECTION_LENGTH:
+                close()
+            current.append(piece)
+            length += len(piece)
+        if length >= SUMMARY_SECTION_MIN_LENGTH and _is_anchor(line):
+            close()
+    close()
+    return sections
+
+
+def group_partials(partials: List[dict]) -> List[List[dict]]:
+    return [partials[i:i + SUMMARY_REDUCE_FAN_IN] for i in range(0, len(partials), SUMMARY_REDUCE_FAN_IN)]
+
+
+def section_prompt(system_prompt: str, section: str, summary_type: str) -> str:
+    """Prompt for the map step. Deliberately position-independent so cached
+    section summaries stay valid when text elsewhere in the document changes."""
+    return f"""
+        {system_prompt}
+        Task: Summarize this section of a larger document.
+        Section: "{section}"
+        Type: {summary_type}
+        Output JSON with 'summary' (a few sentences), 'key_points' (list of strings) and 'keywords' (list of strings).
+        """
+
+
+def reduce_prompt(system_prompt: str, partials: List[dict], summary_type: str, length: str, final: bool) -> str:
+    """Prompt for the reduce step, merging partial summaries in document order."""
+    partials_json = json.dumps(partials, ensure_ascii=False, indent=1)
+    if final:
+        output = "Output JSON with 'title', 'summary', 'key_points', 'keywords'."
+        requirements = f"Type: {summary_type}, Length: {length}"
+    else:
+        output = "Output JSON with 'summary', 'key_points' and 'keywords'."
+        requirements = f"Type: {summary_type}"
+    return f"""
+        {system_prompt}
+        Task: Combine these partial summaries of consecutive parts of one document into a single summary.
+        Remove repetition and keep the most important points.
+        Partial summaries: {partials_json}
+        {requirements}
+        {output}
+        """
@@ -0,0 +1,192 @@
+"""
+Streaming Uploads for Professor AI Helper
+
+Uploaded files are copied to disk in fixed-size chunks instead of being
+read into memory whole, so memory per upload stays constant no matter
+how large the file is. The SHA-256 and size are computed while copying,
+the per-type size cap is enforced as soon as it is crossed, and the file
+only appears under its final name once it is complete.
+
+Starlette spools a multipart body to disk before the endpoint runs, so
+UploadSizeLimitMiddleware caps the request itself while it streams in:
+anything larger than the biggest per-type cap is refused with 413 before
+it is written anywhere.
+"""
+from dataclasses import dataclass
+from typing import BinaryIO, Tuple
+import asyncio
+import hashlib
+import os
+import tempfile
+import uuid
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))  # Bytes copied per read
+
+# Size caps per file type, in megabytes
+UPLOAD_MAX_PDF_MB = float(os.getenv("UPLOAD_MAX_PDF_MB", 100))
+UPLOAD_MAX_OFFICE_MB = float(os.getenv("UPLOAD_MAX_OFFICE_MB", 50))  # .doc, .docx, .xls, .xlsx
+UPLOAD_MAX_TEXT_MB = float(os.getenv("UPLOAD_MAX_TEXT_MB", 10))  # .txt, .md, .csv and anything else
+
+# Request-level cap for multipart bodies: the largest per-type cap plus room for the multipart framing
+UPLOAD_MAX_REQUEST_BYTES = int(max(UPLOAD_MAX_PDF_MB, UPLOAD_MAX_OFFICE_MB, UPLOAD_MAX_TEXT_MB) * 1024 * 1024) + 1024 * 1024
+
+_MAX_MB_BY_EXTENSION = {
+    ".pdf": UPLOAD_MAX_PDF_MB,
+    ".doc": UPLOAD_MAX_OFFICE_MB,
+    ".docx": UPLOAD_MAX_OFFICE_MB,
+    ".xls": UPLOAD_MAX_OFFICE_MB,
+    ".xlsx": UPLOAD_MAX_OFFICE_MB,
+}
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    size: int
+    sha256: str
+
+
+def max_upload_bytes(extension: str) -> int:
+    return int(_MAX_MB_BY_EXTENSION.get(extension.lower(), UPLOAD_MAX_TEXT_MB) * 1024 * 1024)
+
+
+def _too_large(extension: str, limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File is too large. The limit for {extension or 'this file type'} files is {limit // (1024 * 1024)} MB.",
+    )
+
+
+def _copy(source: BinaryIO, target: BinaryIO, limit: int, extension: str) -> Tuple[int, str]:
+    """Copies source to target chunk by chunk; returns (size, SHA-256 hex digest)."""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            raise _too_large(extension, limit)
+        digest.update(chunk)
+        target.write(chunk)
+    target.flush()
+    os.fsync(target.fileno())
+    return size, digest.hexdigest()
+
+
+def discard_upload(upload: StoredUpload) -> None:
+    try:
+        os.remove(upload.path)
+    except OSError:
+        pass
+
+
+def place_upload(upload: StoredUpload, final_path: str) -> None:
+    """Atomically moves a received upload to final_path (in the same directory)."""
+    os.replace(upload.path, final_path)
+    upload.path = final_path
+
+
+async def receive_upload(file: UploadFile, directory: str, extension: str) -> StoredUpload:
+    """
+    Streams an upload into a temporary .part file in directory.
+
+    The caller decides the final name (e.g. from the hash) and calls
+    place_upload or discard_upload. Raises HTTPException(413) if the file
+    exceeds the cap for its type; nothing is left on disk in that case or
+    on any other error.
+    """
+    limit = max_upload_bytes(extension)
+    # The body is already spooled by now; skip copying a file known to be too large
+    if file.size is not None and file.size > limit:
+        raise _too_large(extension, limit)
+
+    os.makedirs(directory, exist_ok=True)
+    # The partial file lives in the target directory so the final rename is atomic
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            await file.seek(0)
+            size, sha256 = await asyncio.to_thread(_copy, file.file, target, limit, extension)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return StoredUpload(path=temp_path, size=size, sha256=sha256)
+
+
+async def save_upload(file: UploadFile, directory: str, extension: str) -> StoredUpload:
+    """Streams an upload into directory under a new unique name ending in extension."""
+    upload = await receive_upload(file, directory, extension)
+    try:
+        place_upload(upload, os.path.join(directory, f"{uuid.uuid4()}{extension}"))
+    except BaseException:
+        discard_upload(upload)
+        raise
+    return upload
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware refusing multipart requests over max_bytes before their
+    body is spooled: by Content-Length when declared, otherwise by counting
+    bytes as they stream in.
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large_response(self) -> JSONResponse:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload is too large. The limit is {self.max_bytes // (1024 * 1024)} MB."},
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._too_large_response()(scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise HTTPException(status_code=413)
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return  # The app's answer to the aborted body is replaced by the 413 below
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._too_large_response()(scope, receive, send)
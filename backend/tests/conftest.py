@@ -0,0 +1,72 @@
+"""
+Test setup: the app runs against a throwaway SQLite database and the
+offline fake AI backend, so the suite needs no network or API key.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+# Settings are read at import time, so they must be in place before the app is imported
+_data_dir = tempfile.mkdtemp(prefix="professor-ai-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_data_dir, 'test.db')}",
+    SECRET_KEY="test-secret",
+    AI_BACKEND="fake",
+    AI_FAKE_LATENCY="fixed:0.05",
+    AI_FAKE_TOKENS_PER_SECOND="0",
+    JOB_POLL_INTERVAL="0.1",
+)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.ai_providers import FakeProvider  # noqa: E402
+from app.ai_services import teaching_assistant  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    # Entering the client runs the lifespan, which starts the job workers
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def auth_headers(client):
+    """Registers a fresh user, so per-user rate limits don't carry over between tests."""
+    email = f"{uuid.uuid4().hex}@example.com"
+    response = client.post("/api/v1/register", json={"email": email, "password": "secret", "full_name": "Test User"})
+    assert response.status_code == 201, response.text
+    response = client.post("/api/v1/login", data={"username": email, "password": "secret"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+class CountingProvider(FakeProvider):
+    """Fake provider that counts the calls that reach it."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    async def generate(self, prompt, generation_config):
+        self.calls += 1
+        return await super().generate(prompt, generation_config)
+
+    async def stream(self, prompt, generation_config):
+        self.calls += 1
+        async for chunk in super().stream(prompt, generation_config):
+            yield chunk
+
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    """Serves every model from one counting fake provider; use .configure() to change its timing."""
+    def configure(latency="fixed:0.05", tokens_per_second=0):
+        provider = CountingProvider(model_name="fake-test", latency=latency, tokens_per_second=tokens_per_second)
+        monkeypatch.setattr(teaching_assistant, "_provider_override", provider)
+        return provider
+
+    return configure
@@ -0,0 +1,89 @@
+"""
+AI endpoints driven through the HTTP API with the fake backend.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import dataclasses
+import json
+import time
+
+from app import ai_profiles
+
+
+def _sse_events(response):
+    """Parses a Server-Sent Events body into (event, data) pairs."""
+    events = []
+    for message in response.text.strip().split("\n\n"):
+        event, data = "message", None
+        for line in message.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+def test_slow_chats_run_concurrently_without_blocking_other_requests(client, auth_headers, fake_provider):
+    fake_provider(latency="fixed:1")
+
+    def chat(i):
+        return client.post("/api/v1/ai/chat", json={"query": f"Concurrent question {i}"}, headers=auth_headers)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        started = time.monotonic()
+        chats = [executor.submit(chat, i) for i in range(4)]
+        time.sleep(0.2)
+        health_started = time.monotonic()
+        health = client.get("/api/v1/health")
+        health_time = time.monotonic() - health_started
+        responses = [future.result() for future in chats]
+        total_time = time.monotonic() - started
+
+    assert health.status_code == 200
+    assert health_time < 0.5
+    assert all(response.status_code == 200 for response in responses)
+    # Four one-second calls overlapping, not queued one after another
+    assert total_time < 3
+
+
+def test_chat_times_out_at_the_profile_deadline(client, auth_headers, fake_provider, monkeypatch):
+    fake_provider(latency="fixed:5")
+    monkeypatch.setitem(ai_profiles.PROFILES, "chat", dataclasses.replace(ai_profiles.PROFILES["chat"], timeout=0.5))
+
+    started = time.monotonic()
+    response = client.post("/api/v1/ai/chat", json={"query": "A question that takes too long"}, headers=auth_headers)
+
+    assert time.monotonic() - started < 2
+    assert response.status_code == 200
+    assert "timed out" in response.json()["message"]
+
+
+def test_chat_stream_ends_with_done_event(client, auth_headers, fake_provider):
+    fake_provider()
+
+    response = client.post("/api/v1/ai/chat/stream", json={"query": "Stream me an answer"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response)
+    chunks = [data["text"] for event, data in events if event == "message"]
+    event, done = events[-1]
+    assert event == "done"
+    assert done["model"] == "fake-test"
+    assert done["cached"] is False
+    assert done["chunks"] == len(chunks)
+    assert done["characters"] == len("".join(chunks))
+
+
+def test_identical_concurrent_requests_share_one_model_call(client, auth_headers, fake_provider):
+    provider = fake_provider(latency="fixed:0.5")
+
+    def chat(_):
+        return client.post("/api/v1/ai/chat", json={"query": "The same question"}, headers=auth_headers)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(chat, range(4)))
+
+    assert all(response.status_code == 200 for response in responses)
+    assert len({response.json()["message"] for response in responses}) == 1
+    assert provider.calls == 1
@@ -0,0 +1,48 @@
+"""
+Background job lifecycle through the HTTP API.
+"""
+import time
+import uuid
+
+
+def _wait_for_job(client, headers, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(f"/api/v1/jobs/{job_id}", headers=headers)
+        assert response.status_code == 200, response.text
+        job = response.json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.1)
+
+
+def test_report_job_runs_to_completion(client, auth_headers, fake_provider):
+    fake_provider()
+
+    response = client.post("/api/v1/ai/generate-report", json={"text": "Alice: 5, Bob: 4"}, headers=auth_headers)
+    assert response.status_code == 202, response.text
+    accepted = response.json()
+    assert accepted["status"] == "queued"
+    assert accepted["status_url"] == f"/api/v1/jobs/{accepted['job_id']}"
+
+    job = _wait_for_job(client, auth_headers, accepted["job_id"])
+
+    assert job["status"] == "succeeded"
+    assert job["kind"] == "class_report"
+    assert job["attempts"] == 1
+    assert job["result"]["report"]
+    assert job["started_at"] is not None and job["finished_at"] is not None
+
+
+def test_jobs_are_private_to_their_owner(client, auth_headers, fake_provider):
+    fake_provider()
+    response = client.post("/api/v1/ai/generate-report", json={"text": "Alice: 5"}, headers=auth_headers)
+    job_id = response.json()["job_id"]
+    _wait_for_job(client, auth_headers, job_id)
+
+    other = f"{uuid.uuid4().hex}@example.com"
+    client.post("/api/v1/register", json={"email": other, "password": "secret", "full_name": "Other"})
+    token = client.post("/api/v1/login", data={"username": other, "password": "secret"}).json()["access_token"]
+
+    response = client.get(f"/api/v1/jobs/{job_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
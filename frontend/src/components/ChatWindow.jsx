@@ -2,37 +2,16 @@ import React, { useState, useRef, useEffect, useCallback } from 'react';
 import { Prism as SyntaxHighlighter } from 'prism-react-renderer';
 import { CopyToClipboard } from 'react-copy-to-clipboard';
 import { FiSend, FiCopy, FiCheck, FiLoader } from 'react-icons/fi';
-import { queryClassAI, getDocument } from '../services/api';
+import { queryDocumentChat } from '../services/api';
 
 function ChatWindow({ documentId, initialHistory = [], onNewMessage }) {
   const [history, setHistory] = useState(initialHistory);
   const [query, setQuery] = useState('');
   const [isSending, setIsSending] = useState(false);
-  const [documentText, setDocumentText] = useState('');
   const [copied, setCopied] = useState('');
   const chatContainerRef = useRef(null);
   const inputRef = useRef(null);
 
-  // Fetch document content when documentId changes
-  useEffect(() => {
-    const fetchDocumentText = async () => {
-      if (documentId) {
-        try {
-          const response = await getDocument(documentId);
-          if (response.data && response.data.extracted_text_content) {
-            setDocumentText(response.data.extracted_text_content);
-          } else {
-            console.warn("Document has no extracted text content");
-            setDocumentText(""); // Set empty string if no content
-          }
-        } catch (error) {
-          console.error("Failed to fetch document content:", error);
-        }
-      }
-    };
-    fetchDocumentText();
-  }, [documentId]);
-
   // Scroll to bottom when messages change
   const scrollToBottom = useCallback(() => {
     if (chatContainerRef.current) {
@@ -203,11 +182,6 @@ function ChatWindow({ documentId, initialHistory = [], onNewMessage }) {
     e.preventDefault();
     if (!query.trim() || isSending) return;
 
-    // Check if document text is available
-    if (!documentText) {
-      console.warn("No document text available for AI chat");
-    }
-
     const userMessage = {
       id: Date.now(),
       user_query: query,
@@ -252,11 +226,8 @@ function ChatWindow({ documentId, initialHistory = [], onNewMessage }) {
       // We don't need to add the current query to history
       // It will be sent separately as the 'query' parameter
 
-      // Log document text for debugging
-      console.log("Document text length:", documentText ? documentText.length : 0);
-      
-      // Use document text instead of document ID
-      const response = await queryClassAI(documentText || "", query, formattedHistory);
+      // The server loads the document text by ID
+      const response = await queryDocumentChat(documentId, query, formattedHistory);
       
       const aiMessage = {
         ...userMessage,
@@ -1,7 +1,7 @@
 import React, { useState, useRef, useCallback } from 'react';
 import { FiUpload, FiMessageSquare, FiFile, FiX, FiSend, FiPaperclip } from 'react-icons/fi';
 import { toast } from 'react-toastify';
-import { uploadDocument, queryClassAI } from '../services/api';
+import { uploadDocument, queryClassAI, queryDocumentChat } from '../services/api';
 
 function QuickChatMode({ onBackToFull }) {
   const [selectedFile, setSelectedFile] = useState(null);
@@ -113,7 +113,9 @@ function QuickChatMode({ onBackToFull }) {
         }
       });
 
-      const response = await queryClassAI(documentContent || "", query, formattedHistory);
+      const response = selectedFile?.id
+        ? await queryDocumentChat(selectedFile.id, query, formattedHistory)
+        : await queryClassAI(documentContent || "", query, formattedHistory);
       
       const aiMessage = {
         ...userMessage,
@@ -197,7 +199,9 @@ function QuickChatMode({ onBackToFull }) {
         }
       });
 
-      const response = await queryClassAI(documentContent, query, formattedHistory);
+      const response = selectedFile?.id
+        ? await queryDocumentChat(selectedFile.id, query, formattedHistory)
+        : await queryClassAI(documentContent, query, formattedHistory);
       const aiMessage = {
         ...userMessage,
         ai_response: response.data.message || 'Не удалось получить ответ.',
@@ -3,7 +3,7 @@ import { useParams, useNavigate } from 'react-router-dom';
 import { FiArrowLeft, FiMessageSquare, FiFileText, FiHelpCircle } from 'react-icons/fi';
 import { Tabs, Tab, TabList, TabPanel } from 'react-tabs';
 import 'react-tabs/style/react-tabs.css';
-import apiClient, { getDocument, debugDocument, queryClassAI } from '../services/api';
+import apiClient, { getDocument, debugDocument, queryDocumentChat, getDocumentChat } from '../services/api';
 import { toast } from 'react-toastify';
 import ChatWindow from '../components/ChatWindow';
 import TeachingAssistantPanel from '../components/TeachingAssistantPanel';
@@ -223,6 +223,7 @@ function DocumentView() {
   const [chatHistory, setChatHistory] = useState([]);
   const [isProcessing, setIsProcessing] = useState(false);
   const chatEndRef = useRef(null);
+  const chatAbortRef = useRef(null);
   const [aiResponse, setAiResponse] = useState(null);
   const [aiResponseType, setAiResponseType] = useState('markdown');
 
@@ -281,11 +282,24 @@ function DocumentView() {
         }
         
         setDocument(docResponse.data);
+
+        // The server stores the conversation; show the latest turns
+        let storedTurns = [];
+        try {
+          const { data: page } = await getDocumentChat(docId);
+          storedTurns = page.items.flatMap(turn => [
+            { role: 'user', content: turn.user_query },
+            { role: 'assistant', content: turn.ai_response }
+          ]);
+        } catch (historyError) {
+          console.warn('Could not load chat history:', historyError);
+        }
         setChatHistory([
           {
             role: 'assistant',
             content: 'Welcome! You can ask me questions about this document.'
-          }
+          },
+          ...storedTurns
         ]);
       } catch (err) {
         console.error('Error fetching document:', err);
@@ -341,6 +355,11 @@ function DocumentView() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [documentId, navigate]);
 
+  // Abort a pending AI request when leaving the page so the server stops generating
+  useEffect(() => {
+    return () => chatAbortRef.current?.abort();
+  }, []);
+
   const handleSendMessage = useCallback(async (message, requestData = null, commandType = 'chat') => {
     if ((!message.trim() && !requestData) || isProcessing) return;
     try {
@@ -353,11 +372,12 @@ function DocumentView() {
         setChatHistory(prev => [...prev, userMessage]);
       }
       
-      // Send document text as context for the AI
-      const documentText = document?.extracted_text_content || '';
-      
-      // Call the AI service with document context
-      const response = await queryClassAI(documentText, message, chatHistory);
+      // Call the AI service; the server loads the document text and the
+      // stored conversation by ID, so the history isn't resent
+      chatAbortRef.current = new AbortController();
+      const response = await queryDocumentChat(document.id, message, undefined, {
+        signal: chatAbortRef.current.signal
+      });
       
       if (!response.data || !response.data.message) {
         throw new Error('Invalid response from AI service');
@@ -371,6 +391,9 @@ function DocumentView() {
       
       setChatHistory(prev => [...prev, aiMessage]);
     } catch (error) {
+      if (error.code === 'ERR_CANCELED') {
+        return;
+      }
       console.error('Error processing request:', error);
       const errorMsg = error.response?.data?.detail || 'Failed to process your request.';
       toast.error(errorMsg);
@@ -122,16 +122,25 @@ export const getDocument = async (documentId) => {
   }
 };
 
-export const uploadDocument = (file) => {
+// Pass uploadId to follow text extraction with getUploadProgress while the upload runs
+export const uploadDocument = (file, { uploadId } = {}) => {
   const formData = new FormData();
   formData.append('file', file);
   return apiClient.post('/documents/upload', formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
     },
+    params: { upload_id: uploadId },
   });
 };
 
+export const getUploadProgress = (uploadId) => apiClient.get(`/documents/uploads/${uploadId}/progress`);
+
+// Extracted text of pages from..to (1-based, inclusive) of a document
+export const getDocumentPages = (documentId, { from = 1, to } = {}) => {
+  return apiClient.get(`/documents/${documentId}/pages`, { params: { from, to } });
+};
+
 export const deleteDocument = async (documentId) => {
   const response = await apiClient.delete(`/documents/${documentId}`);
   if (response.data && response.data.status === 'success') {
@@ -178,9 +187,45 @@ export const queryClassAI = (document_text, query, history = []) => {
 // Alias for queryClassAI to maintain compatibility with existing code
 export const queryDocumentAI = queryClassAI;
 
-export const generateClassReport = (text) => {
+// Chat about an uploaded document; the server loads its text by ID.
+// Leave history undefined to use the conversation stored on the server.
+// Pass an AbortSignal to cancel the request (the server then stops generating).
+export const queryDocumentChat = (document_id, query, history, { signal, useCache = true } = {}) => {
+  return apiClient.post('/ai/chat', {
+    document_id,
+    query,
+    history,
+    use_cache: useCache
+  }, { signal });
+};
+
+// Stored chat about a document, newest page first; pass next_cursor for older turns
+export const getDocumentChat = (documentId, { cursor, limit = 50 } = {}) => {
+  return apiClient.get(`/documents/${documentId}/chat`, { params: { cursor, limit } });
+};
+
+// Background job API: long AI tasks return 202 with a job ID to poll
+export const getJob = (jobId) => apiClient.get(`/jobs/${jobId}`);
+
+export const waitForJob = async (jobId, { interval = 1500, timeout = 10 * 60 * 1000 } = {}) => {
+  const startedAt = Date.now();
+  while (Date.now() - startedAt < timeout) {
+    const { data: job } = await getJob(jobId);
+    if (job.status === 'succeeded') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Background job failed');
+    }
+    await new Promise((resolve) => setTimeout(resolve, interval));
+  }
+  throw new Error('Timed out waiting for background job');
+};
+
+export const generateClassReport = async (text) => {
   // Отправляем строку с данными класса (JSON или табличка)
-  return apiClient.post('/ai/generate-report', { text });
+  const response = await apiClient.post('/ai/generate-report', { text });
+  return { data: await waitForJob(response.data.job_id) };
 };
 
 // File Report API
@@ -192,7 +237,7 @@ export const generateFileReport = async (classId, file) => {
       'Content-Type': 'multipart/form-data',
     },
   });
-  return response.data;
+  return waitForJob(response.data.job_id);
 };
 
 // Import Class Data API
@@ -204,7 +249,7 @@ export const importClassData = async (classId, file) => {
       'Content-Type': 'multipart/form-data',
     },
   });
-  return response.data;
+  return waitForJob(response.data.job_id);
 };
 
 // Debug API calls